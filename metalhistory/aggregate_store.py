@@ -0,0 +1,252 @@
+"""
+Materialized aggregates of the processed dataset, saved next to the dataset
+"""
+
+import ast
+import hashlib
+import os
+
+import pandas as pd
+
+from .aggregation import partial_aggregate, merge_partials
+
+
+METRICS = ['listeners', 'playcount', 'MA_score']
+
+# version of the layout of the partial aggregates, stores of other versions are rebuilt
+STORE_VERSION = 3
+
+# number of bytes at the end of the aggregated data used to recognize appended files
+TAIL_BYTES = 4096
+
+
+class AggregateStore():
+    def __init__(self, dataset, path=None):
+        """
+        Create an aggregate store for a processed dataset. The store holds mergeable
+        partial aggregates (count, sum, min, max) of the metrics per artist, per tag
+        and per release decade, so that they do not have to be recomputed on every chart.
+
+        Parameters
+        ----------
+
+        dataset: Path of the processed csv file
+
+        path: Path of the store file (defaults to <dataset>_aggregates.pkl next to the dataset)
+
+
+        Examples
+        ----------
+        Building the store once, then querying the artists with at least 5 albums:
+
+        >>> from metalhistory.aggregate_store import AggregateStore
+        >>>
+        >>> store = AggregateStore('data/proc_MA_1k_albums.csv')
+        >>> store.update()
+        >>> store.artists(min_albums=5)
+
+        """
+        assert isinstance(dataset, str), "'dataset' must be of type str."
+        assert path is None or isinstance(path, str), "'path' must be None or str."
+
+        self.dataset = dataset
+        self.path = path if path is not None else os.path.splitext(dataset)[0] + '_aggregates.pkl'
+        self.source = None
+        self.tables = {}
+
+
+    def load(self):
+        """
+        Load the store from disk.
+
+        Returns
+        ----------
+        bool
+            True if a store file was found.
+        """
+        if not os.path.isfile(self.path):
+            return False
+        content = pd.read_pickle(self.path)
+        self.source = content['source']
+        self.tables = content['tables']
+        return True
+
+
+    def save(self):
+        """
+        Write the store to disk. The file is replaced atomically.
+        """
+        tmp_path = self.path + '.tmp'
+        pd.to_pickle({'source': self.source, 'tables': self.tables}, tmp_path)
+        os.replace(tmp_path, self.path)
+
+
+    def is_fresh(self):
+        """
+        Check that the store reflects the current content of the dataset.
+
+        Returns
+        ----------
+        bool
+            True if the store exists and the dataset did not change since it was built.
+        """
+        if self.source is None and not self.load():
+            return False
+        if self.source.get('version') != STORE_VERSION:
+            return False
+        stat = os.stat(self.dataset)
+        return stat.st_size == self.source['size'] and stat.st_mtime_ns == self.source['mtime_ns']
+
+
+    def build(self):
+        """
+        Build the store from the whole dataset and save it.
+
+        Returns
+        ----------
+        int
+            Number of aggregated rows.
+        """
+        df = pd.read_csv(self.dataset)
+        self.tables = aggregate_tables(df)
+        self.source = self._fingerprint(columns=list(df.columns), rows=len(df))
+        self.save()
+        return len(df)
+
+
+    def update(self):
+        """
+        Bring the store up to date with the dataset. If rows were only appended to
+        the dataset since the last build, only the new rows are read and merged into
+        the store. Otherwise the store is rebuilt from scratch.
+
+        Returns
+        ----------
+        int
+            Number of aggregated rows (only the new ones for an incremental update).
+        """
+        if self.is_fresh():
+            return 0
+        if self.source is None or self.source.get('version') != STORE_VERSION or not self._is_appended():
+            return self.build()
+
+        columns = self.source['columns']
+        with open(self.dataset, 'rb') as file:
+            file.seek(self.source['size'])
+            df = pd.read_csv(file, header=None, names=columns)
+
+        tables = aggregate_tables(df)
+        for name, table in tables.items():
+            self.tables[name] = merge_partials([self.tables[name], table])
+        self.source = self._fingerprint(columns=columns, rows=self.source['rows'] + len(df))
+        self.save()
+        return len(df)
+
+
+    def artists(self, min_albums=1):
+        """
+        Partial aggregates per artist, for artists with at least min_albums albums.
+
+        Parameters
+        ----------
+
+        min_albums: Min number of album published by the considered artists
+
+        Returns
+        ----------
+        DataFrame
+            Partial aggregates indexed by artist name.
+        """
+        table = self._table('artist')
+        return table[table[('MA_album', 'count')] >= min_albums]
+
+
+    def tags(self):
+        """
+        Partial aggregates per tag, ('MA_album', 'count') is the number of albums per tag.
+        """
+        return self._table('tag')
+
+
+    def decades(self):
+        """
+        Partial aggregates per release decade, ('MA_album', 'count') is the number of albums per decade.
+        """
+        return self._table('decade')
+
+
+    def _table(self, name):
+        if self.source is None and not self.load():
+            raise RuntimeError('No aggregate store found at %s, run update() first.' % self.path)
+        return self.tables[name]
+
+
+    def _fingerprint(self, columns, rows):
+        stat = os.stat(self.dataset)
+        return {'version': STORE_VERSION,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'tail': self._tail_hash(stat.st_size),
+                'columns': columns,
+                'rows': rows}
+
+
+    def _tail_hash(self, size):
+        # hash of the last bytes of the aggregated data, ending with a line break
+        with open(self.dataset, 'rb') as file:
+            file.seek(max(0, size - TAIL_BYTES))
+            tail = file.read(size - file.tell())
+        if not tail.endswith(b'\n'):
+            return None
+        return hashlib.sha1(tail).hexdigest()
+
+
+    def _is_appended(self):
+        size = os.stat(self.dataset).st_size
+        if size <= self.source['size'] or self.source['tail'] is None:
+            return False
+        return self._tail_hash(self.source['size']) == self.source['tail']
+
+
+def release_decade(dates):
+    """
+    Compute the release decade from release date strings (e.g. '1982-05-10' -> 1980).
+
+    Parameters
+    ----------
+
+    dates: pandas Series of release dates
+
+    Returns
+    ----------
+    Series
+        Release decades as floats, NaN where the date is missing.
+    """
+    years = pd.to_numeric(dates.astype(str).str[:4], errors='coerce')
+    return (years // 10) * 10
+
+
+def aggregate_tables(df):
+    """
+    Compute the partial aggregates per artist, per tag and per release decade.
+
+    Parameters
+    ----------
+
+    df: Processed album dataframe
+
+    Returns
+    ----------
+    dict
+        Partial aggregate tables keyed by 'artist', 'tag' and 'decade'.
+    """
+    tables = {}
+    tables['artist'] = partial_aggregate(df, 'MA_artist', METRICS, counts=['MA_album'])
+
+    tags_df = df[['MA_album', 'tags'] + METRICS].dropna(subset=['tags'])
+    tags_df = tags_df.assign(tags=tags_df['tags'].apply(ast.literal_eval)).explode('tags')
+    tables['tag'] = partial_aggregate(tags_df.dropna(subset=['tags']), 'tags', METRICS, counts=['MA_album'])
+
+    decade_df = df[['MA_album'] + METRICS].assign(decade=release_decade(df['release-date']))
+    tables['decade'] = partial_aggregate(decade_df.dropna(subset=['decade']), 'decade', METRICS, counts=['MA_album'])
+    return tables
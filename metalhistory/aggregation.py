@@ -0,0 +1,383 @@
+"""
+Aggregation plans computing only the statistics requested by a chart
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+STATISTICS = ['count', 'sum', 'mean', 'min', 'max']
+
+# statistics that can be merged across partitions of the data, all others are derived from them
+# sums are exact: finite values are split on a grid of levels, the level columns 'sum_<level>'
+# hold the integral sums of the multiples of 2^(SUM_LEVEL_BITS * level), and 'sum_nonfinite'
+# the sum of the infinite values
+PARTIAL_STATISTICS = ['count', 'sum_nonfinite', 'sum_<level>', 'min', 'max']
+SUM_LEVEL_BITS = 30
+
+
+class AggregationPlan():
+    def __init__(self, metric, statistics=('mean',), order_by=None, top_k=None, ascending=False):
+        """
+        Declare the statistics of a metric needed by a chart, and how the groups are ranked.
+        Only the declared statistics are computed when the plan is executed.
+
+        Parameters
+        ----------
+
+        metric: Column the statistics are computed on [listeners, playcount, MA_score]
+
+        statistics: Statistics to compute per group, any of 'count', 'sum', 'mean', 'min', 'max'
+
+        order_by: Statistic used to rank the groups (defaults to the first statistic)
+
+        top_k: Number of groups to keep (or None to keep all of them)
+
+        ascending: Rank the groups in ascending order instead of descending
+
+        Examples
+        ----------
+        Mean, min and max MA score of the 30 best artists with at least 5 albums:
+
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.aggregation import AggregationPlan
+        >>>
+        >>> plan = AggregationPlan('MA_score', ['mean', 'min', 'max'], top_k=30)
+        >>> plan.execute(vis.prune_and_group(5))
+
+        """
+
+        statistics = list(statistics)
+        assert isinstance(metric, str), "'metric' must be of type str."
+        assert len(statistics) > 0, "'statistics' must contain at least one statistic."
+        for stat in statistics:
+            if stat not in STATISTICS:
+                raise ValueError('%s is not in the list of supported statistics.' % stat)
+        order_by = statistics[0] if order_by is None else order_by
+        if order_by not in statistics:
+            raise ValueError("'order_by' must be one of the requested statistics.")
+        assert top_k is None or (isinstance(top_k, int) and top_k >= 0), "'top_k' must be None or a non-negative int."
+
+        self.metric = metric
+        self.statistics = statistics
+        self.order_by = order_by
+        self.top_k = top_k
+        self.ascending = ascending
+
+
+    def execute(self, grouped):
+        """
+        Compute the requested statistics on grouped data and keep the top ranked groups.
+
+        Parameters
+        ----------
+
+        grouped: pandas GroupBy object, e.g. as returned by prune_and_group
+
+        Returns
+        ----------
+        DataFrame
+            One row per kept group, columns (metric, statistic) ordered as requested.
+        """
+        # the statistics go through the partial aggregates, so that they are identical
+        # to the ones merged from chunks of the data
+        return self.execute_partial(grouped_partials(grouped, [self.metric]))
+
+
+    def execute_partial(self, partials):
+        """
+        Derive the requested statistics from partial aggregates and keep the top ranked groups.
+
+        Parameters
+        ----------
+
+        partials: DataFrame of partial aggregates, as returned by partial_aggregate or merge_partials
+
+        Returns
+        ----------
+        DataFrame
+            One row per kept group, columns (metric, statistic) ordered as requested.
+        """
+        stats = pd.DataFrame(index=partials.index)
+        total = exact_totals(partials, self.metric)
+        for stat in self.statistics:
+            if stat == 'sum':
+                stats[(self.metric, stat)] = total
+            elif stat == 'mean':
+                stats[(self.metric, stat)] = total.div(partials[(self.metric, 'count')])
+            else:
+                stats[(self.metric, stat)] = partials[(self.metric, stat)]
+        stats.columns = pd.MultiIndex.from_product([[self.metric], self.statistics])
+        return self.select(stats)
+
+
+    def select(self, stats):
+        """
+        Rank already computed statistics and keep the top groups.
+
+        Parameters
+        ----------
+
+        stats: DataFrame with (metric, statistic) columns, one row per group
+
+        Returns
+        ----------
+        DataFrame
+            The top_k rows of stats, ranked on the order_by statistic.
+        """
+        values = stats[(self.metric, self.order_by)].astype(float).to_numpy()
+        positions = top_k_positions(values, self.top_k, self.ascending)
+        return stats.iloc[positions]
+
+
+def top_k_positions(values, k=None, ascending=False):
+    """
+    Positions of the k largest (or smallest) values, in ranked order.
+    Uses a partial selection so that only the k selected values get sorted.
+    Ties are broken by position and NaN values are ranked last, so the result
+    is identical to a stable full sort followed by head(k).
+
+    Parameters
+    ----------
+
+    values: 1D array of values to rank
+
+    k: Number of positions to return (or None for all of them)
+
+    ascending: Return the smallest values instead of the largest
+
+    Returns
+    ----------
+    ndarray
+        Integer positions into values.
+    """
+    values = np.asarray(values, dtype=float)
+    # NaN compares larger than any number, so it ends up last in both directions
+    key = values if ascending else -values
+    n = len(key)
+    if k is None or k >= n:
+        return np.argsort(key, kind='stable')
+    if k == 0:
+        return np.array([], dtype=int)
+
+    # the k-th smallest key is the threshold, everything below it is selected
+    threshold = np.partition(key, k - 1)[k - 1]
+    if np.isnan(threshold):
+        below = np.flatnonzero(~np.isnan(key))
+        ties = np.flatnonzero(np.isnan(key))
+    else:
+        below = np.flatnonzero(key < threshold)
+        ties = np.flatnonzero(key == threshold)
+    # ties are kept in positional order until k values are selected
+    selected = np.concatenate([below, ties[:k - len(below)]])
+    return selected[np.argsort(key[selected], kind='stable')]
+
+
+def exact_sums(values, codes, n_groups):
+    """
+    Sum float values per group exactly, vectorized over all the groups.
+    Each finite value is split on a grid of levels: level L holds an integral number of
+    units of 2^(SUM_LEVEL_BITS * L), so that the sums of the units are exact integers
+    whatever the order of the values. NaN values are skipped.
+
+    Parameters
+    ----------
+
+    values: 1D float array
+
+    codes: Group of each value, from 0 to n_groups - 1 (values with a negative code are skipped)
+
+    n_groups: Number of groups
+
+    Returns
+    ----------
+    dict
+        Partial statistic ('sum_<level>' or 'sum_nonfinite') to the array of its sums per group.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.asarray(codes)
+    valid = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[valid], codes[valid]
+    finite = np.isfinite(values)
+    sums = {'sum_nonfinite': np.bincount(codes[~finite], values[~finite], minlength=n_groups)}
+    remainders, codes = values[finite], codes[finite]
+    if not remainders.any():
+        return sums
+
+    # the top level holds units below 2^SUM_LEVEL_BITS, and so do all the levels below it
+    level = (int(np.frexp(np.abs(remainders).max())[1]) - 1) // SUM_LEVEL_BITS
+    while True:
+        scale = SUM_LEVEL_BITS * level
+        units = np.rint(np.ldexp(remainders, -scale))
+        remainders = remainders - np.ldexp(units, scale)
+        units = units.astype(np.int64)
+        # the float sums of the halves of the units are exact for up to 2^38 values
+        high = np.bincount(codes, units >> 15, minlength=n_groups).astype(np.int64)
+        low = np.bincount(codes, units & 0x7fff, minlength=n_groups).astype(np.int64)
+        sums['sum_%d' % level] = (high << 15) + low
+        if not remainders.any():
+            return sums
+        level -= 1
+
+
+def exact_totals(partials, metric):
+    """
+    Correctly rounded sums of a metric, from its partial aggregates.
+
+    Parameters
+    ----------
+
+    partials: DataFrame of partial aggregates, as returned by partial_aggregate or merge_partials
+
+    metric: Column the sums are computed on
+
+    Returns
+    ----------
+    Series
+        The sum of the metric per group.
+    """
+    levels = sum_levels(partials[metric].columns)
+    totals = np.zeros(len(partials))
+    if levels:
+        units = partials[[(metric, 'sum_%d' % level) for level in levels]].to_numpy(dtype=np.int64)
+        for i, row in enumerate(units):
+            # the levels are contiguous, the exact sum is an integer number of units of the lowest one
+            exact = 0
+            for unit in row:
+                exact = (exact << SUM_LEVEL_BITS) + int(unit)
+            totals[i] = to_float(exact, SUM_LEVEL_BITS * levels[-1])
+    return pd.Series(totals, index=partials.index) + partials[(metric, 'sum_nonfinite')]
+
+
+def to_float(units, scale):
+    """
+    Correctly rounded float value of units * 2^scale, for an integer number of units.
+    """
+    try:
+        # integer true division and conversion are correctly rounded
+        if scale < 0:
+            return units / (1 << -scale)
+        return float(units << scale)
+    except OverflowError:
+        return math.copysign(math.inf, units)
+
+
+def sum_levels(statistics):
+    """
+    Levels of the 'sum_<level>' statistics, from the highest to the lowest.
+    """
+    return sorted((int(stat[len('sum_'):]) for stat in statistics
+                   if stat.startswith('sum_') and stat != 'sum_nonfinite'), reverse=True)
+
+
+def partial_columns(columns):
+    """
+    Canonical order of the columns of partial aggregates. The sum levels of each
+    column are completed to a contiguous range, from the highest to the lowest.
+
+    Parameters
+    ----------
+
+    columns: (column, statistic) pairs
+
+    Returns
+    ----------
+    list
+        The (column, statistic) pairs, columns in order of first appearance.
+    """
+    statistics = {}
+    for column, stat in columns:
+        statistics.setdefault(column, set()).add(stat)
+
+    ordered = []
+    for column, stats in statistics.items():
+        levels = sum_levels(stats)
+        if levels:
+            levels = list(range(levels[0], levels[-1] - 1, -1))
+        level_stats = ['sum_%d' % level for level in levels]
+        order = ['count', 'sum_nonfinite'] + level_stats + ['min', 'max']
+        ordered += [(column, stat) for stat in order if stat in stats or stat in level_stats]
+    return ordered
+
+
+def grouped_partials(grouped, metrics, counts=()):
+    """
+    Compute mergeable partial aggregates (count, exact sum, min, max) of metrics on grouped data.
+
+    Parameters
+    ----------
+
+    grouped: pandas GroupBy object of a DataFrame
+
+    metrics: Numeric columns to aggregate
+
+    counts: Additional columns for which only the non-null count is computed
+
+    Returns
+    ----------
+    DataFrame
+        One row per group, columns (column, statistic).
+    """
+    partials = grouped[list(metrics)].agg(['count', 'min', 'max'])
+    codes = grouped.ngroup().fillna(-1).to_numpy().astype(np.int64)
+    for metric in metrics:
+        sums = exact_sums(grouped.obj[metric].to_numpy(dtype=np.float64, na_value=np.nan), codes, grouped.ngroups)
+        for stat, values in sums.items():
+            partials[(metric, stat)] = values
+    for column in counts:
+        partials[(column, 'count')] = grouped[column].count()
+    return partials[partial_columns(partials.columns)]
+
+
+def partial_aggregate(df, by, metrics, counts=()):
+    """
+    Compute mergeable partial aggregates (count, exact sum, min, max) of metrics per group.
+
+    Parameters
+    ----------
+
+    df: DataFrame holding the group keys and the metrics
+
+    by: Column (or list of columns) to group by
+
+    metrics: Numeric columns to aggregate
+
+    counts: Additional columns for which only the non-null count is computed
+
+    Returns
+    ----------
+    DataFrame
+        One row per group, columns (column, statistic).
+    """
+    return grouped_partials(df.groupby(by, observed=True), metrics, counts)
+
+
+def merge_partials(partials):
+    """
+    Merge partial aggregates computed on different partitions of the data.
+
+    Parameters
+    ----------
+
+    partials: List of DataFrames as returned by partial_aggregate
+
+    Returns
+    ----------
+    DataFrame
+        Partial aggregates of the union of the partitions, one row per group.
+    """
+    # partitions may hold different sum levels, the missing ones sum to 0
+    columns = pd.MultiIndex.from_tuples(partial_columns([c for partial in partials for c in partial.columns]))
+    combined = pd.concat([partial.reindex(columns=columns, fill_value=0) for partial in partials])
+    grouped = combined.groupby(level=0)
+    statistics = combined.columns.get_level_values(1)
+
+    # counts and sums add up, min and max are the min and max of the partitions
+    merged = [grouped[columns[~statistics.isin(['min', 'max'])]].sum(),
+              grouped[columns[statistics == 'min']].min(),
+              grouped[columns[statistics == 'max']].max()]
+    merged = pd.concat(merged, axis=1)[columns]
+    merged.index.name = combined.index.name
+    return merged
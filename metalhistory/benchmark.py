@@ -0,0 +1,408 @@
+"""
+Benchmarks of the query and visualization hot paths at several dataset sizes
+"""
+
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+
+# number of albums of the benchmarked datasets
+SCALES = [1000, 10000, 100000, 1000000]
+
+# max number of LastFM queries per benchmark, the query benchmarks measure throughput
+MAX_QUERIES = 100000
+
+# relative slowdown over the baseline flagged as a regression
+DEFAULT_TOLERANCE = 0.25
+
+DATASET = os.path.abspath(__file__ + "/../../") + '/data/proc_MA_1k_albums.csv'
+
+# fields of the album info queried by the LastFM benchmarks
+ALBUM_FIELDS = ['artist', 'name', 'release-date', 'listeners', 'playcount', 'tags', 'mbid', 'url', 'image']
+
+MUSICBRAINZ_RESPONSE = ('<metadata><release><release-group><first-release-date>1986-10-07'
+                        '</first-release-date></release-group></release></metadata>')
+
+
+def scaled_dataset(rows, seed=0, dataset=DATASET):
+    """
+    Dataset of the given size, resampled from a processed dataset. Every copy of
+    the source dataset gets its own artists, so that the number of artists and
+    the albums per artist grow like in a larger catalogue.
+
+    Parameters
+    ----------
+
+    rows : Number of albums
+
+    seed : Seed of the resampling
+
+    dataset : Name of the source csv file or pandas dataframe
+
+    Returns
+    ----------
+
+    Processed album dataframe
+    """
+    source = pd.read_csv(dataset) if isinstance(dataset, str) else dataset
+    rng = np.random.default_rng(seed)
+    df = source.iloc[rng.integers(0, len(source), rows)].reset_index(drop=True)
+    copy = pd.Series(np.arange(rows) // len(source)).astype(str)
+    for column in ['artist', 'MA_artist']:
+        df[column] = df[column] + ' #' + copy
+    return df
+
+
+class LocalResponse():
+    """
+    Response of the local stand-in for the LastFM and Musicbrainz servers.
+    """
+    def __init__(self, body, status_code=200):
+        self.text = body
+        self.status_code = status_code
+        self.ok = status_code == 200
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class LocalTransport():
+    def __init__(self, df):
+        """
+        Local stand-in for the LastFM and Musicbrainz servers, answering the album
+        queries from a processed dataset (see LastFM's fetch argument).
+
+        Parameters
+        ----------
+
+        df : Processed album dataframe
+        """
+        self.albums = {}
+        for artist, album, tags, ignored, image, listeners, playcount in zip(
+                df['artist'], df['album'], df['tags'], df['ignored tags'], df['image'], df['listeners'], df['playcount']):
+            key = (str(artist), str(album))
+            if key in self.albums:
+                continue
+            # LastFM answers with the accepted and the ignored tags
+            tags = sum([eval(t) for t in [tags, ignored] if isinstance(t, str)], [])
+            self.albums[key] = json.dumps({'album': {
+                'artist': str(artist), 'name': str(album), 'mbid': 'b1d5c7b8-0000-4000-8000-000000000000',
+                'url': 'https://www.last.fm/music/' + urllib.parse.quote(str(artist)),
+                'listeners': str(listeners), 'playcount': str(playcount),
+                'image': eval(image) if isinstance(image, str) else [],
+                'tags': {'tag': [{'name': t, 'url': ''} for t in tags]}}})
+        self.requests = 0
+
+    def fetch(self, url):
+        self.requests += 1
+        if url.startswith('http://musicbrainz.org'):
+            return LocalResponse(MUSICBRAINZ_RESPONSE)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        key = (query.get('artist', [''])[0], query.get('album', [''])[0])
+        if key not in self.albums:
+            return LocalResponse(json.dumps({'error': 6, 'message': 'Album not found'}))
+        return LocalResponse(self.albums[key])
+
+
+def local_cover(url):
+    """
+    Local stand-in for the cover server, serving a plain 300x300 cover colored by its URL.
+    """
+    color = hash(url) % 256
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 300), (color, 64, 255 - color)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ScaleData():
+    def __init__(self, rows, seed, work_dir):
+        """
+        Inputs of the benchmarks at one scale, computed on first use.
+        """
+        from .cover_cache import CoverCache
+
+        self.rows = rows
+        self.df = scaled_dataset(rows, seed)
+        self.work_dir = work_dir
+        self.covers = CoverCache(os.path.join(work_dir, 'covers'), fetch=local_cover)
+        self._lastfm = None
+        self._responses = None
+        self._tag_lists = None
+        self._graph = None
+
+    @property
+    def lastfm(self):
+        if self._lastfm is None:
+            from .data_query_functions import LastFM
+            self.transport = LocalTransport(self.df.head(MAX_QUERIES))
+            self._lastfm = LastFM(fetch=self.transport.fetch)
+        return self._lastfm
+
+    @property
+    def responses(self):
+        # decoded album infos, as given to response_formatter
+        if self._responses is None:
+            self.lastfm
+            self._responses = [json.loads(r)['album'] for r in self.transport.albums.values()]
+        return self._responses
+
+    @property
+    def tag_lists(self):
+        if self._tag_lists is None:
+            from .visualization_api import generate_tag_cooccurrence_list_from_df
+            self._tag_lists = generate_tag_cooccurrence_list_from_df(self.df)
+        return self._tag_lists
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            from .visualization_api import generate_tag_network, generate_unique_tag_from_list
+            self._graph = generate_tag_network(self.tag_lists, generate_unique_tag_from_list(self.tag_lists))
+        return self._graph
+
+    def output(self, name):
+        return os.path.join(self.work_dir, name)
+
+
+def _build_request(data):
+    lastfm = data.lastfm
+    queries = data.df[['artist', 'album']].head(MAX_QUERIES).astype(str).values.tolist()
+    for artist, album in queries:
+        lastfm.build_request('album.getinfo', artist=artist, album=album)
+    return len(queries)
+
+
+def _album_info(data):
+    lastfm = data.lastfm
+    queries = data.df[['artist', 'album']].head(MAX_QUERIES).astype(str).values.tolist()
+    for artist, album in queries:
+        lastfm.get_album_info(artist=artist, album=album, fields=ALBUM_FIELDS)
+    return len(queries)
+
+
+def _response_formatter(data):
+    lastfm = data.lastfm
+    responses = data.responses
+    n = min(data.rows, MAX_QUERIES)
+    for i in range(n):
+        lastfm.response_formatter(responses[i % len(responses)], ALBUM_FIELDS)
+    return n
+
+
+def _get_tags(data):
+    lastfm = data.lastfm
+    tags = [response['tags'] for response in data.responses]
+    n = min(data.rows, MAX_QUERIES)
+    for i in range(n):
+        lastfm.get_tags(tags[i % len(tags)])
+    return n
+
+
+def _prune_and_group(data):
+    from .visualization_api import prune_and_group
+    prune_and_group(5, data.df)[['listeners', 'playcount', 'MA_score']].mean()
+    return data.rows
+
+
+def _tag_parse(data):
+    from .visualization_api import generate_tag_cooccurrence_list_from_df
+    generate_tag_cooccurrence_list_from_df(data.df)
+    return data.rows
+
+
+def _tag_network(data):
+    from .visualization_api import generate_tag_network, generate_unique_tag_from_list
+    tag_lists = data.tag_lists
+    generate_tag_network(tag_lists, generate_unique_tag_from_list(tag_lists))
+    return data.rows
+
+
+def _filter_tag_graph(data):
+    from .visualization_api import filter_tag_graph
+    graph = data.graph
+    for n_tags in [6, 12, 18, 24, 30]:
+        filter_tag_graph(graph, n_tags)
+    return 5
+
+
+def _force_layout(data):
+    from .graph_layout import force_layout
+    force_layout(data.graph, iterations=50)
+    return len(data.graph)
+
+
+def _tag_analytics(data):
+    from .tag_analytics import TagMatrix, tag_table
+    tag_table(TagMatrix.from_tag_lists(data.tag_lists))
+    return data.rows
+
+
+def _compose_covers(data):
+    from .visualization_api import album_covers
+    album_covers(100, dataset=data.df, image_name=None, cache=data.covers)
+    return 100
+
+
+def _chart_barplot(data):
+    from .visualization_api import artist_barplot
+    artist_barplot(5, 30, 'playcount', data.output('bar.png'), data.df)
+    return 1
+
+
+def _chart_cloud(data):
+    from .visualization_api import artist_cloud
+    artist_cloud(5, 20, 'playcount', data.output('cloud.png'), data.df)
+    return 1
+
+
+def _chart_covers(data):
+    from .visualization_api import album_covers
+    album_covers(100, dataset=data.df, image_name=data.output('covers.jpg'), cache=data.covers)
+    return 1
+
+
+def _chart_tag_graph(data):
+    from .visualization_api import tag_graph
+    tag_graph(18, data.df, data.output('tag_graph.png'))
+    return 1
+
+
+# benchmarks by name, with the inputs they get from ScaleData (prepared before they are
+# timed); each function returns the number of items it processed
+BENCHMARKS = {
+    'lastfm.build_request': (_build_request, ['lastfm']),
+    'lastfm.get_album_info': (_album_info, ['lastfm']),
+    'lastfm.response_formatter': (_response_formatter, ['responses']),
+    'lastfm.get_tags': (_get_tags, ['responses']),
+    'prune_and_group': (_prune_and_group, []),
+    'tags.parse': (_tag_parse, []),
+    'generate_tag_network': (_tag_network, ['tag_lists']),
+    'filter_tag_graph': (_filter_tag_graph, ['graph']),
+    'graph.force_layout': (_force_layout, ['graph']),
+    'tag_analytics.tag_table': (_tag_analytics, ['tag_lists']),
+    'album_covers.compose': (_compose_covers, []),
+    'chart.artist_barplot': (_chart_barplot, []),
+    'chart.artist_cloud': (_chart_cloud, []),
+    'chart.album_covers': (_chart_covers, []),
+    'chart.tag_graph': (_chart_tag_graph, []),
+}
+
+
+def run_benchmarks(scales=SCALES, names=None, repeat=3, seed=0, progress=None):
+    """
+    Run the benchmarks at several dataset sizes. Each benchmark is run repeat
+    times and its fastest and median times are kept.
+
+    Parameters
+    ----------
+
+    scales : Numbers of albums of the datasets
+
+    names : Names of the benchmarks to run (or None for all, see BENCHMARKS)
+
+    repeat : Number of runs of each benchmark
+
+    seed : Seed of the datasets
+
+    progress : Function called with the record of each benchmark once run (or None)
+
+    Returns
+    ----------
+
+    Dictionary with the 'meta' data of the run and the 'results' records, each with
+    the name, rows, items, seconds (fastest run), median_seconds and items_per_second
+    """
+    names = list(BENCHMARKS) if names is None else names
+    assert all(name in BENCHMARKS for name in names), "'names' must be in %s." % list(BENCHMARKS)
+    assert isinstance(repeat, int) and repeat > 0, "'repeat' must be an int larger than 0."
+
+    # the modules are imported before the first timing
+    for module in ['visualization_api', 'data_query_functions']:
+        importlib.import_module('.' + module, __package__)
+
+    results = []
+    for rows in scales:
+        work_dir = tempfile.mkdtemp(prefix='metalhistory-benchmark-')
+        try:
+            data = ScaleData(rows, seed, work_dir)
+            for name in names:
+                function, inputs = BENCHMARKS[name]
+                for attribute in inputs:
+                    getattr(data, attribute)
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    items = function(data)
+                    times.append(time.perf_counter() - start)
+                record = {'name': name, 'rows': rows, 'items': items, 'seconds': min(times),
+                          'median_seconds': statistics.median(times), 'items_per_second': items / max(min(times), 1e-9)}
+                results.append(record)
+                if progress is not None:
+                    progress(record)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    meta = {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'repeat': repeat, 'seed': seed,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def save_results(results, file_name):
+    """
+    Save benchmark results as JSON.
+    """
+    with open(file_name, 'w') as file:
+        json.dump(results, file, indent=1)
+
+
+def load_results(file_name):
+    """
+    Load benchmark results saved with save_results.
+    """
+    with open(file_name) as file:
+        return json.load(file)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare benchmark results with a baseline run. Benchmarks missing from the
+    baseline are left out.
+
+    Parameters
+    ----------
+
+    results : Results of run_benchmarks
+
+    baseline : Results of an earlier run
+
+    tolerance : Relative slowdown of the fastest run flagged as a regression
+
+    Returns
+    ----------
+
+    DataFrame of the benchmarks with their seconds, baseline seconds, ratio and a
+    'regression' column
+    """
+    columns = ['name', 'rows', 'seconds', 'baseline_seconds', 'ratio', 'regression']
+    base = {(r['name'], r['rows']): r['seconds'] for r in baseline['results']}
+    table = []
+    for r in results['results']:
+        key = (r['name'], r['rows'])
+        if key in base:
+            ratio = r['seconds'] / max(base[key], 1e-9)
+            table.append((r['name'], r['rows'], r['seconds'], base[key], ratio, ratio > 1 + tolerance))
+    return pd.DataFrame(table, columns=columns)
@@ -0,0 +1,363 @@
+"""
+Local HTTP service rendering the charts from a dataset and renderers kept in memory
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from . import visualization_api as vis
+from .figures import FigurePool
+from .render_cache import RENDER_CACHE_VERSION, dataset_fingerprint
+from .tag_index import TagIndex, TagQuery
+
+
+# charts served under /charts/<name>.<format>: function, output argument, formats and typed parameters
+CHARTS = {
+    'barplot': (vis.artist_barplot, 'file_name', ['png', 'svg'],
+                {'min_albums': int, 'n_artists': int, 'metric': str}),
+    'cloud': (vis.artist_cloud, 'file_name', ['png', 'svg'],
+              {'min_albums': int, 'words_limit': int, 'metric': str}),
+    'covers': (vis.album_covers, 'image_name', ['png', 'jpg'],
+               {'num_albums': int, 'width': int, 'height': int}),
+    'tag-graph': (vis.tag_graph, 'file_name', ['png', 'svg'],
+                  {'n_tags': int, 'layout': str, 'color_by': str}),
+}
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'jpg': 'image/jpeg'}
+
+# query parameters of the tag filter, as comma separated tags
+TAG_PARAMETERS = {'tags': 'all_of', 'any_tags': 'any_of', 'no_tags': 'none_of'}
+
+# largest side in pixels of the cover mosaics served
+MAX_COVER_SIDE = 4096
+
+
+class ChartService():
+    def __init__(self, dataset=None, max_concurrent=2, queue_timeout=10.0, max_cached_bytes=64 * 2**20,
+                 cover_cache=None, atlas=None):
+        """
+        Renderer of the charts served over HTTP. The dataset, its tag index,
+        the tag graph renderer and a pool of figures are loaded once and kept
+        warm, at most max_concurrent charts are rendered at the same time, and
+        the latest responses are kept in memory by their ETag.
+
+        Parameters
+        ----------
+
+        dataset : Name of the input csv file or pandas dataframe
+
+        max_concurrent : Number of charts rendered at the same time
+
+        queue_timeout : Seconds a request waits for a rendering slot before being refused
+
+        max_cached_bytes : Size cap in bytes of the rendered responses kept in memory
+
+        cover_cache : CoverCache used to get the album covers
+
+        atlas : CoverAtlas the album covers are copied from
+        """
+        assert isinstance(max_concurrent, int) and max_concurrent > 0, "'max_concurrent' must be an int larger than 0."
+        assert queue_timeout > 0, "'queue_timeout' must be larger than 0."
+
+        self.df = vis.load_data(dataset)
+        self.fingerprint = dataset_fingerprint(self.df)
+        self.tag_index = TagIndex(self.df)
+        self.renderer = vis.default_tag_graph_renderer()
+        self.figure_pool = FigurePool()
+        self.cover_cache = cover_cache
+        self.atlas = atlas
+
+        self.max_concurrent = max_concurrent
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.max_cached_bytes = max_cached_bytes
+        self.lock = threading.Lock()
+        self.responses = collections.OrderedDict()
+        self.cached_bytes = 0
+        self.renders = 0
+
+
+    def parse(self, chart, extension, query):
+        """
+        Check the chart, format and query parameters of a request.
+
+        Parameters
+        ----------
+
+        chart : Name of the chart [barplot, cloud, covers, tag-graph]
+
+        extension : Format of the image
+
+        query : Dictionary of the query parameters, with lists of values
+
+        Returns
+        ----------
+
+        Dictionary of the typed parameters of the chart
+
+        Raises
+        ----------
+
+        KeyError if the chart or format is not served, ValueError if a parameter is not valid
+        """
+        if chart not in CHARTS or extension not in CHARTS[chart][2]:
+            raise KeyError('%s.%s' % (chart, extension))
+        types = CHARTS[chart][3]
+
+        params = {}
+        tag_terms = {}
+        for name, values in query.items():
+            if len(values) != 1:
+                raise ValueError("parameter '%s' is given more than once." % name)
+            if name in TAG_PARAMETERS:
+                tag_terms[TAG_PARAMETERS[name]] = [t.strip() for t in values[0].split(',') if t.strip() != '']
+            elif name in types:
+                params[name] = types[name](values[0])
+            else:
+                raise ValueError("unknown parameter '%s', expected one of %s." % (name, sorted(types) + sorted(TAG_PARAMETERS)))
+
+        if chart == 'covers' and max(params.get('width', 0), params.get('height', 0)) > MAX_COVER_SIDE:
+            raise ValueError("cover mosaics are at most %d pixels wide and high." % MAX_COVER_SIDE)
+        if len(tag_terms) > 0:
+            params['tag_query'] = TagQuery(**tag_terms)
+        return params
+
+
+    def etag(self, chart, extension, params):
+        """
+        Entity tag of a chart, which only depends on the chart, its format and
+        parameters, the dataset and the state of the tag graph renderer, so it is
+        known before rendering.
+        """
+        description = '%d\n%s.%s\n%r\n%s' % (RENDER_CACHE_VERSION, chart, extension,
+                                             sorted(params.items()), self.fingerprint)
+        if chart == 'tag-graph':
+            # force-directed layouts start from the positions of the previous ones
+            description += '\n' + self.renderer.fingerprint(params.get('layout', 'circular'))
+        return '"%s"' % hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+    def render(self, chart, extension, params):
+        """
+        Render a chart, or get it from the responses kept in memory.
+
+        Parameters
+        ----------
+
+        chart : Name of the chart
+
+        extension : Format of the image
+
+        params : Typed parameters of the chart (see parse)
+
+        Returns
+        ----------
+
+        (content, etag, cached) tuple, with the bytes of the image
+
+        Raises
+        ----------
+
+        TimeoutError if no rendering slot was free within queue_timeout
+        """
+        etag = self.etag(chart, extension, params)
+        with self.lock:
+            if etag in self.responses:
+                self.responses.move_to_end(etag)
+                return self.responses[etag], etag, True
+
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise TimeoutError('all %s rendering slots are busy.' % self.max_concurrent)
+        tmp_dir = tempfile.mkdtemp(prefix='metalhistory-chart-')
+        try:
+            output = os.path.join(tmp_dir, 'chart.' + extension)
+            self._draw(chart, output, params)
+            with open(output, 'rb') as file:
+                content = file.read()
+        finally:
+            self.slots.release()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        with self.lock:
+            self.renders += 1
+            if etag not in self.responses and len(content) <= self.max_cached_bytes:
+                self.responses[etag] = content
+                self.cached_bytes += len(content)
+                while self.cached_bytes > self.max_cached_bytes:
+                    _, old = self.responses.popitem(last=False)
+                    self.cached_bytes -= len(old)
+        return content, etag, False
+
+
+    def _draw(self, chart, output, params):
+        function, output_argument, _, _ = CHARTS[chart]
+        kwargs = dict(params)
+        kwargs[output_argument] = output
+        kwargs['dataset'] = self.df
+        if 'tag_query' in kwargs:
+            kwargs['tag_index'] = self.tag_index
+        if chart == 'barplot':
+            fig, _ = function(figure_pool=self.figure_pool, **kwargs)
+            self.figure_pool.release(fig)
+        elif chart == 'cloud':
+            function(figure_pool=self.figure_pool, **kwargs)
+        elif chart == 'covers':
+            function(cache=self.cover_cache, atlas=self.atlas, **kwargs)
+        else:
+            function(renderer=self.renderer, **kwargs)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTP server handling each request in a new thread (http.server has it from Python 3.7).
+    """
+    daemon_threads = True
+
+
+class ChartRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests of a chart server:
+
+    GET /charts/<chart>.<format>?<parameters> : rendered chart
+    GET /health : state of the service as JSON
+    """
+    server_version = 'metalhistory-charts/0.1'
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+
+    def log_request(self, code='-', size='-'):
+        # requests are logged with their timing once answered
+        pass
+
+
+    def _handle(self, send_body):
+        start = time.perf_counter()
+        service = self.server.service
+        url = urlsplit(self.path)
+        status, content, headers, note = 404, b'not found\n', {}, ''
+
+        try:
+            if url.path == '/health':
+                status = 200
+                content = json.dumps({'status': 'ok', 'rows': len(service.df), 'renders': service.renders,
+                                      'cached_responses': len(service.responses)}).encode('utf-8')
+                headers['Content-Type'] = 'application/json'
+            elif url.path.startswith('/charts/') and '.' in url.path:
+                chart, extension = url.path[len('/charts/'):].rsplit('.', 1)
+                try:
+                    params = service.parse(chart, extension, parse_qs(url.query))
+                except KeyError:
+                    raise FileNotFoundError(url.path)
+                etag = service.etag(chart, extension, params)
+                headers.update({'ETag': etag, 'Cache-Control': 'no-cache'})
+                if _etag_matches(self.headers.get('If-None-Match'), etag):
+                    status, content, note = 304, b'', 'not modified'
+                else:
+                    content, etag, cached = service.render(chart, extension, params)
+                    status, note = 200, 'cached' if cached else 'rendered'
+                    headers['Content-Type'] = CONTENT_TYPES[extension]
+        except FileNotFoundError:
+            status, content = 404, b'not found\n'
+        except (ValueError, AssertionError, KeyError) as e:
+            status, content = 400, ('bad request: %s\n' % e).encode('utf-8')
+        except TimeoutError as e:
+            status, content = 503, ('busy: %s\n' % e).encode('utf-8')
+            headers['Retry-After'] = '1'
+        except Exception as e:
+            status, content = 500, ('%s: %s\n' % (type(e).__name__, e)).encode('utf-8')
+
+        headers.setdefault('Content-Type', 'text/plain; charset=utf-8')
+        seconds = time.perf_counter() - start
+        headers['Server-Timing'] = 'render;dur=%.1f' % (seconds * 1000)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if send_body and status != 304:
+            self.wfile.write(content)
+        self.log_message('"%s %s" %d %d %.1fms %s', self.command, self.path, status, len(content),
+                         seconds * 1000, note)
+
+
+def _etag_matches(if_none_match, etag):
+    # weak comparison, as for GET and HEAD requests
+    if if_none_match is None:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in [t[2:] if t.startswith('W/') else t for t in tags]
+
+
+def make_server(dataset=None, host='127.0.0.1', port=8000, **kwargs):
+    """
+    Create a chart server, loading the dataset and the renderers.
+
+    Parameters
+    ----------
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    host : Address the server listens on
+
+    port : Port the server listens on (0 for any free port)
+
+    kwargs : Other arguments of ChartService
+
+    Returns
+    ----------
+
+    ThreadingHTTPServer, with the ChartService as its service attribute
+    """
+    server = ThreadingHTTPServer((host, port), ChartRequestHandler)
+    server.service = ChartService(dataset, **kwargs)
+    return server
+
+
+def serve(dataset=None, host='127.0.0.1', port=8000, **kwargs):
+    """
+    Serve the charts until interrupted.
+
+    Parameters
+    ----------
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    host : Address the server listens on
+
+    port : Port the server listens on
+
+    kwargs : Other arguments of ChartService
+
+
+    Examples
+    ----------
+    >>> from metalhistory.chart_server import serve
+    >>>
+    >>> serve(port=8000)
+
+    and then, e.g. in a browser: http://127.0.0.1:8000/charts/barplot.svg?metric=playcount&min_albums=3
+    """
+    server = make_server(dataset, host, port, **kwargs)
+    print('Serving charts on http://%s:%d/charts/' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,429 @@
+"""
+Command line interface of metalhistory, run as: python -m metalhistory <command> --help
+
+Every command reports its progress as JSON lines on stderr and exits with:
+0 on success, 1 on error, 2 on invalid arguments, 3 if some albums could not be
+enriched, 4 if benchmarks regressed and 130 when interrupted. The modules behind a command are only imported
+when it runs, so e.g. enriching albums does not load matplotlib.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+EXIT_REGRESSION = 4
+EXIT_INTERRUPTED = 130
+
+# name of the input and output files standing for stdin and stdout
+STDIO = '-'
+
+
+class Progress():
+    def __init__(self, stream=None, every=1):
+        """
+        Progress reporter writing one JSON object per line, e.g.
+
+        {"event": "progress", "command": "enrich", "done": 10, "failed": 1, "elapsed": 2.31}
+
+        Parameters
+        ----------
+
+        stream : Output stream (None to not report anything)
+
+        every : Report one progress event every this many items
+        """
+        self.stream = stream
+        self.every = every
+        self.start = time.perf_counter()
+
+
+    def emit(self, event, **fields):
+        """
+        Report an event with its fields and the seconds elapsed since the start.
+        """
+        if self.stream is None:
+            return
+        fields = dict(event=event, **fields)
+        fields['elapsed'] = round(time.perf_counter() - self.start, 3)
+        self.stream.write(json.dumps(fields) + '\n')
+        self.stream.flush()
+
+
+    def step(self, done, **fields):
+        """
+        Report the progress after done items, every self.every items.
+        """
+        if done % self.every == 0:
+            self.emit('progress', done=done, **fields)
+
+
+def build_parser():
+    """
+    Parser of the command line arguments.
+    """
+    parser = argparse.ArgumentParser(prog='python -m metalhistory',
+                                     description='Enrich heavy metal album data and visualize it.')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress on stderr')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='record the time and peak memory of the stages of the command, as a Chrome trace '
+                             'if FILE ends with .json and as a table otherwise')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    enrich = commands.add_parser('enrich', help='query LastFM info of Metal Archives albums')
+    enrich.add_argument('input', help="csv file with artist, album and MA_score columns ('-' for stdin)")
+    enrich.add_argument('-o', '--output', default=STDIO, help="processed csv file ('-' for stdout)")
+    enrich.add_argument('--start', type=int, default=0, help='number of input albums to skip')
+    enrich.add_argument('--limit', type=int, default=None, help='max number of albums to query')
+    enrich.add_argument('--resume', action='store_true', help='append to the output, skipping the albums already in it')
+    enrich.add_argument('--progress-every', type=int, default=10, help='report progress every this many albums')
+    enrich.set_defaults(run=run_enrich)
+
+    convert = commands.add_parser('convert', help='convert a processed dataset')
+    convert.add_argument('input', help="processed csv file ('-' for stdin)")
+    convert.add_argument('output', help="csv file, or .pkl file for the compact dataset loaded without parsing ('-' for stdout)")
+    convert.add_argument('--columns', nargs='+', default=None, help='columns to keep')
+    convert.add_argument('--chunksize', type=int, default=100000, help='rows converted at once between csv files')
+    convert.set_defaults(run=run_convert)
+
+    generate = commands.add_parser('generate', help='generate a synthetic processed dataset')
+    generate.add_argument('output', help='csv file, or directory of pickle parts loaded without parsing')
+    generate.add_argument('--albums', type=int, default=1000000, help='number of albums')
+    generate.add_argument('--seed', type=int, default=0, help='seed of the generator')
+    generate.add_argument('--chunksize', type=int, default=100000, help='albums generated and written at once')
+    generate.set_defaults(run=run_generate)
+
+    charts = {
+        'barplot': ('bar plot of artist statistics', './images/artist_bar.svg'),
+        'cloud': ('word cloud of artist names', './images/artist_cloud.svg'),
+        'covers': ('mosaic of album covers', './images/album_covers.jpg'),
+        'tag-graph': ('graph of tag cooccurrences', './images/tag_graph.svg'),
+    }
+    for name, (description, output) in charts.items():
+        chart = commands.add_parser(name, help=description)
+        chart.add_argument('--dataset', default=None, help="processed csv or .pkl file, directory of .pkl parts ('-' for stdin, default: bundled dataset)")
+        chart.add_argument('-o', '--output', default=output, help='output image (default: %(default)s)')
+        chart.add_argument('--tags', nargs='+', default=[], help='only consider albums with all these tags')
+        chart.add_argument('--any-tags', nargs='+', default=[], help='only consider albums with one of these tags')
+        chart.add_argument('--no-tags', nargs='+', default=[], help='do not consider albums with these tags')
+        chart.add_argument('--render-cache', default=None, help='directory of a cache of rendered charts')
+        if name in ['barplot', 'cloud']:
+            chart.add_argument('--metric', default='MA_score', choices=['listeners', 'playcount', 'MA_score'])
+            chart.add_argument('--min-albums', type=int, default=5)
+        if name == 'barplot':
+            chart.add_argument('--n-artists', type=int, default=30)
+        if name == 'cloud':
+            chart.add_argument('--words-limit', type=int, default=20)
+        if name == 'covers':
+            chart.add_argument('--num-albums', type=int, default=100)
+            chart.add_argument('--width', type=int, default=1280)
+            chart.add_argument('--height', type=int, default=720)
+            chart.add_argument('--cover-cache', default=None, help='directory of a cache of album covers')
+            chart.add_argument('--atlas', default=None, help='cover atlas built with build_cover_atlas')
+            chart.add_argument('--n-workers', type=int, default=8)
+        if name == 'tag-graph':
+            chart.add_argument('--n-tags', type=int, default=18)
+            chart.add_argument('--layout', default='circular', choices=['circular', 'force'],
+                               help='force-directed layouts scale to hundreds of tags')
+            chart.add_argument('--positions', default=None,
+                               help='json file of tag positions, force-directed layouts start from and update it')
+            chart.add_argument('--color-by', default=None, choices=['community', 'pagerank'],
+                               help='color the tags by community or by PageRank')
+        if name != 'covers':
+            chart.add_argument('--chunksize', type=int, default=None, help='stream the dataset in chunks of this many rows')
+        chart.set_defaults(run=run_chart, chart=name)
+
+    analytics = commands.add_parser('tag-analytics', help='rank the tags and group them into communities')
+    analytics.add_argument('--dataset', default=None, help="processed csv or .pkl file, directory of .pkl parts ('-' for stdin, default: bundled dataset)")
+    analytics.add_argument('-o', '--output', default=STDIO, help="csv file of the table ('-' for stdout)")
+    analytics.add_argument('--table', default='tags', choices=['tags', 'edges', 'communities'])
+    analytics.add_argument('--weight', default='npmi', choices=['count', 'npmi'], help='edge weight of the centralities and communities')
+    analytics.add_argument('--tags', nargs='+', default=[], help='only consider albums with all these tags')
+    analytics.add_argument('--chunksize', type=int, default=None, help='stream the dataset in chunks of this many rows')
+    analytics.set_defaults(run=run_tag_analytics)
+
+    benchmark = commands.add_parser('benchmark', help='benchmark the query and visualization hot paths')
+    benchmark.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                           help='numbers of albums of the benchmarked datasets')
+    benchmark.add_argument('--only', nargs='+', default=None, metavar='NAME', help='benchmarks to run (default: all)')
+    benchmark.add_argument('--repeat', type=int, default=3, help='runs of each benchmark, the fastest is kept')
+    benchmark.add_argument('-o', '--output', default=None, help='json file of the results')
+    benchmark.add_argument('--baseline', default=None, help='json file of earlier results to compare with')
+    benchmark.add_argument('--tolerance', type=float, default=0.25, help='relative slowdown flagged as a regression')
+    benchmark.set_defaults(run=run_benchmark)
+
+    serve = commands.add_parser('serve', help='serve the charts over HTTP')
+    serve.add_argument('--dataset', default=None, help="processed csv or .pkl file, directory of .pkl parts ('-' for stdin)")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--max-concurrent', type=int, default=2, help='number of charts rendered at the same time')
+    serve.set_defaults(run=run_serve)
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a command.
+
+    Parameters
+    ----------
+
+    argv : Command line arguments (None for sys.argv)
+
+    Returns
+    ----------
+
+    Exit code
+    """
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return e.code
+    progress = Progress(None if args.quiet else sys.stderr)
+
+    try:
+        if args.profile is None:
+            return args.run(args, progress)
+        from .profiling import Profiler
+        with Profiler() as profiler:
+            code = args.run(args, progress)
+        if args.profile.endswith('.json'):
+            profiler.save_trace(args.profile)
+        else:
+            with open(args.profile, 'w') as file:
+                file.write(profiler.summary().to_string() + '\n')
+        progress.emit('profile', command=args.command, output=args.profile)
+        return code
+    except KeyboardInterrupt:
+        progress.emit('interrupted', command=args.command)
+        return EXIT_INTERRUPTED
+    except BrokenPipeError:
+        # the reader of stdout went away (e.g. head), stop writing quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_ERROR
+    except Exception as e:
+        progress.emit('error', command=args.command, error='%s: %s' % (type(e).__name__, e))
+        return EXIT_ERROR
+
+
+def run_enrich(args, progress):
+    """
+    Stream albums from the input, query their LastFM info and append them to the
+    output as soon as they are enriched, so that an interrupted run can be resumed.
+    """
+    from . import data_query_functions as dqf
+
+    if args.resume and args.output == STDIO:
+        raise ValueError('--resume needs an output file.')
+    progress.every = max(1, args.progress_every)
+
+    # albums already enriched by a previous run
+    done = set()
+    append = args.resume and os.path.isfile(args.output) and os.path.getsize(args.output) > 0
+    if append:
+        with open(args.output, newline='') as file:
+            done = {(row['MA_artist'], row['MA_album']) for row in csv.DictReader(file)}
+
+    input_file = sys.stdin if args.input == STDIO else open(args.input, newline='')
+    output_file = sys.stdout if args.output == STDIO else open(args.output, 'a' if append else 'w', newline='')
+    try:
+        albums = (row for i, row in enumerate(csv.DictReader(input_file))
+                  if i >= args.start and (row['artist'], row['album']) not in done)
+        if args.limit is not None:
+            albums = (row for _, row in zip(range(args.limit), albums))
+
+        writer = csv.DictWriter(output_file, fieldnames=dqf.ENRICHED_COLUMNS)
+        if not append:
+            writer.writeheader()
+        progress.emit('start', command='enrich', skipped=len(done))
+
+        lastfm = dqf.LastFM()
+        n_done = n_failed = 0
+        for album, row, error in dqf.enrich_albums(lastfm, albums):
+            n_done += 1
+            if row is None or error is not None:
+                n_failed += 1
+                reason = 'no info' if error is None else '%s: %s' % (type(error).__name__, error)
+                progress.emit('failed', artist=album['artist'], album=album['album'], error=reason)
+            else:
+                # albums whose query failed are not written, so that they are queried again on resume
+                writer.writerow(row)
+                output_file.flush()
+            progress.step(n_done, command='enrich', failed=n_failed)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    progress.emit('done', command='enrich', done=n_done, failed=n_failed, output=args.output)
+    return EXIT_PARTIAL if n_failed > 0 else EXIT_OK
+
+
+def run_convert(args, progress):
+    """
+    Convert a processed dataset between csv files, streaming it chunk by chunk, or
+    to the compact dataset in a pickle file.
+    """
+    import pandas as pd
+
+    source = sys.stdin if args.input == STDIO else args.input
+    progress.emit('start', command='convert', input=args.input)
+    if args.output.endswith('.pkl'):
+        from .visualization_api import compact_dataset
+
+        df = compact_dataset(pd.read_csv(source, usecols=args.columns))
+        tmp_name = args.output + '.tmp'
+        df.to_pickle(tmp_name)
+        os.replace(tmp_name, args.output)
+        rows = len(df)
+    else:
+        output = sys.stdout if args.output == STDIO else open(args.output, 'w', newline='')
+        rows = 0
+        try:
+            for chunk in pd.read_csv(source, usecols=args.columns, chunksize=args.chunksize):
+                chunk.to_csv(output, header=rows == 0, index=False)
+                rows += len(chunk)
+                progress.emit('progress', command='convert', done=rows)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    progress.emit('done', command='convert', rows=rows, output=args.output)
+    return EXIT_OK
+
+
+def run_generate(args, progress):
+    """
+    Generate a synthetic processed dataset, streaming it to disk chunk by chunk.
+    """
+    from .synthetic import write_dataset
+
+    progress.emit('start', command='generate', albums=args.albums, seed=args.seed)
+    write_dataset(args.output, args.albums, args.seed, args.chunksize,
+                  progress=lambda done: progress.emit('progress', command='generate', done=done))
+    progress.emit('done', command='generate', rows=args.albums, output=args.output)
+    return EXIT_OK
+
+
+def run_chart(args, progress):
+    """
+    Render a chart with the visualization_api function of the command.
+    """
+    from . import visualization_api as vis
+    from .tag_index import TagQuery
+
+    kwargs = {'dataset': _read_dataset(args.dataset)}
+    if len(args.tags + args.any_tags + args.no_tags) > 0:
+        kwargs['tag_query'] = TagQuery(all_of=args.tags, any_of=args.any_tags, none_of=args.no_tags)
+    if args.render_cache is not None:
+        from .render_cache import RenderCache
+        kwargs['render_cache'] = RenderCache(args.render_cache)
+
+    progress.emit('start', command=args.chart, output=args.output)
+    if args.chart == 'barplot':
+        vis.artist_barplot(args.min_albums, args.n_artists, args.metric, args.output, chunksize=args.chunksize, **kwargs)
+    elif args.chart == 'cloud':
+        vis.artist_cloud(args.min_albums, args.words_limit, args.metric, args.output, chunksize=args.chunksize, **kwargs)
+    elif args.chart == 'covers':
+        if args.cover_cache is not None:
+            from .cover_cache import CoverCache
+            kwargs['cache'] = CoverCache(args.cover_cache)
+        if args.atlas is not None:
+            from .cover_atlas import CoverAtlas
+            kwargs['atlas'] = CoverAtlas(args.atlas)
+        vis.album_covers(args.num_albums, args.width, args.height, image_name=args.output,
+                         n_workers=args.n_workers, **kwargs)
+    else:
+        if args.positions is not None:
+            from .graph_renderer import TagGraphRenderer
+            kwargs['renderer'] = TagGraphRenderer(positions_file=args.positions)
+        vis.tag_graph(args.n_tags, file_name=args.output, chunksize=args.chunksize, layout=args.layout,
+                      color_by=args.color_by, **kwargs)
+
+    progress.emit('done', command=args.chart, output=args.output)
+    return EXIT_OK
+
+
+def run_tag_analytics(args, progress):
+    """
+    Write a table of the tags, of their cooccurrences or of their communities.
+    """
+    from . import tag_analytics
+    from .tag_index import TagQuery
+
+    tag_query = TagQuery(all_of=args.tags) if len(args.tags) > 0 else None
+    progress.emit('start', command='tag-analytics', table=args.table)
+    matrix = tag_analytics.TagMatrix.from_dataset(_read_dataset(args.dataset), args.chunksize, tag_query)
+    if args.table == 'edges':
+        table = matrix.edges()
+    else:
+        table = tag_analytics.tag_table(matrix, args.weight)
+        if args.table == 'communities':
+            table = tag_analytics.community_table(table)
+    table.to_csv(sys.stdout if args.output == STDIO else args.output, index=args.table != 'edges')
+    progress.emit('done', command='tag-analytics', rows=len(table), output=args.output)
+    return EXIT_OK
+
+
+def run_benchmark(args, progress):
+    """
+    Run the benchmarks, save their results and compare them with a baseline.
+    """
+    from . import benchmark
+
+    def report(record):
+        progress.emit('progress', command='benchmark', **record)
+
+    progress.emit('start', command='benchmark', scales=args.scales)
+    results = benchmark.run_benchmarks(args.scales, args.only, args.repeat, progress=report)
+    if args.output is not None:
+        benchmark.save_results(results, args.output)
+    if args.baseline is None:
+        progress.emit('done', command='benchmark', output=args.output)
+        return EXIT_OK
+
+    comparison = benchmark.compare(results, benchmark.load_results(args.baseline), args.tolerance)
+    regressions = comparison[comparison['regression']]
+    for record in regressions.to_dict('records'):
+        progress.emit('regression', command='benchmark', name=record['name'], rows=record['rows'],
+                      seconds=record['seconds'], baseline_seconds=record['baseline_seconds'])
+    progress.emit('done', command='benchmark', output=args.output, compared=len(comparison),
+                  regressions=len(regressions))
+    return EXIT_REGRESSION if len(regressions) > 0 else EXIT_OK
+
+
+def run_serve(args, progress):
+    """
+    Serve the charts over HTTP until interrupted.
+    """
+    from .chart_server import make_server
+
+    server = make_server(_read_dataset(args.dataset), args.host, args.port, max_concurrent=args.max_concurrent)
+    host, port = server.server_address[:2]
+    progress.emit('start', command='serve', url='http://%s:%d/charts/' % (host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    progress.emit('done', command='serve')
+    return EXIT_OK
+
+
+def _read_dataset(dataset):
+    # a dataset streamed on stdin is read once, the charts then get the dataframe
+    if dataset != STDIO:
+        return dataset
+    import pandas as pd
+    return pd.read_csv(sys.stdin)
@@ -0,0 +1,188 @@
+"""
+Atlas of decoded album covers in a single memory-mapped pixel file
+"""
+
+import json
+import os
+import threading
+import warnings
+
+import numpy as np
+from PIL import Image
+
+from .mosaic import open_cover, map_bounded
+
+
+# side in pixels of the square covers stored for every album
+ATLAS_SIZES = [64, 128, 256]
+
+
+class CoverAtlas():
+    def __init__(self, path, sizes=ATLAS_SIZES):
+        """
+        Atlas of album covers. Every cover is decoded once, resized to a few fixed
+        square sizes, and appended as raw RGB pixels to a single file (path + '.raw'),
+        with an index of the offset of every album (path + '.json'). Mosaics are then
+        composed by copying pixels out of the memory-mapped file, without opening or
+        decoding any image.
+
+        Parameters
+        ----------
+
+        path : Path of the atlas, without extension
+
+        sizes : Sides in pixels of the stored covers (only used when creating the atlas)
+
+
+        Examples
+        ----------
+        Build the atlas of the top 1000 albums once, then compose mosaics from it:
+
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.cover_cache import CoverCache
+        >>>
+        >>> atlas = vis.build_cover_atlas('data/covers', num_albums=1000, cache=CoverCache())
+        >>> vis.album_covers(num_albums=1000, atlas=atlas)
+
+        """
+        assert isinstance(path, str), "'path' must be of type str."
+
+        self.path = path
+        self.raw_file = path + '.raw'
+        self.index_file = path + '.json'
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as file:
+                index = json.load(file)
+            self.sizes = index['sizes']
+            self.offsets = index['albums']
+            self.end = index['end']
+        else:
+            self.sizes = sorted(sizes)
+            self.offsets = {}
+            self.end = 0
+
+        # pixels written after the last saved index are not referenced, drop them
+        if os.path.exists(self.raw_file) and os.path.getsize(self.raw_file) > self.end:
+            os.truncate(self.raw_file, self.end)
+        self.pixels = None
+        self.record_bytes = sum(3 * s * s for s in self.sizes)
+
+
+    @staticmethod
+    def key(artist, album):
+        """
+        Index key of an album.
+        """
+        return '%s\t%s' % (artist, album)
+
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    def get(self, key, size=None):
+        """
+        Get the cover of an album from the atlas.
+
+        Parameters
+        ----------
+
+        key : Album key (see CoverAtlas.key)
+
+        size : (width, height) the cover will be displayed at, the smallest stored
+               size covering it is returned (or the largest one if None)
+
+        Returns
+        ----------
+        PIL Image
+            The square cover in RGB mode.
+        """
+        side = self.sizes[-1]
+        if size is not None:
+            side = next((s for s in self.sizes if s >= max(size)), self.sizes[-1])
+
+        with self.lock:
+            if self.pixels is None or len(self.pixels) < self.end:
+                self.pixels = np.memmap(self.raw_file, dtype=np.uint8, mode='r', shape=(self.end,))
+            pixels = self.pixels
+        start = self.offsets[key]
+        for s in self.sizes:
+            if s == side:
+                break
+            start += 3 * s * s
+        return Image.fromarray(np.array(pixels[start:start + 3 * side * side]).reshape(side, side, 3), 'RGB')
+
+
+    def add(self, key, im):
+        """
+        Append the cover of an album. The index is only written by save.
+
+        Parameters
+        ----------
+
+        key : Album key (see CoverAtlas.key)
+
+        im : PIL Image of the cover
+        """
+        im = im.convert('RGB')
+        record = b''.join(np.asarray(im.resize((s, s), Image.LANCZOS)).tobytes() for s in self.sizes)
+        with self.lock:
+            with open(self.raw_file, 'ab') as file:
+                file.write(record)
+            self.offsets[key] = self.end
+            self.end += len(record)
+
+
+    def save(self):
+        """
+        Write the index of the atlas.
+        """
+        with self.lock:
+            index = {'sizes': self.sizes, 'end': self.end, 'albums': self.offsets}
+            with open(self.index_file + '.tmp', 'w') as file:
+                json.dump(index, file)
+            os.replace(self.index_file + '.tmp', self.index_file)
+
+
+    def build(self, albums, cache=None, n_workers=8):
+        """
+        Add the covers of the albums that are not in the atlas yet, then save the index.
+
+        Parameters
+        ----------
+
+        albums : Iterable of (key, url) pairs
+
+        cache : CoverCache used to get the covers (or None to download them)
+
+        n_workers : Number of threads loading covers
+
+        Returns
+        ----------
+
+        Number of covers added
+        """
+        side = self.sizes[-1]
+
+        def load(album):
+            key, url = album
+            try:
+                return key, open_cover(url, (side, side), cache)
+            except Exception as e:
+                warnings.warn('Could not load cover %s (%s), it is not added to the atlas.' % (url, e))
+                return key, None
+
+        missing = [(key, url) for key, url in albums if key not in self.offsets]
+        added = 0
+        for key, im in map_bounded(load, missing, n_workers):
+            if im is not None and key not in self.offsets:
+                self.add(key, im)
+                added += 1
+        self.save()
+        return added
@@ -0,0 +1,258 @@
+"""
+Disk cache of album covers, keyed by URL hash, with pre-resized thumbnails
+"""
+
+import collections
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+import requests
+from PIL import Image
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'metalhistory', 'covers')
+
+# largest side in pixels of the thumbnails stored next to every original cover
+THUMBNAIL_SIZES = [32, 64, 128, 256]
+
+ORIGINAL_NAME = 'original'
+
+
+def download_cover(url):
+    """
+    Download an album cover.
+
+    Parameters
+    ----------
+
+    url : URL of the cover
+
+    Raises
+    ----------
+
+    RuntimeError : If the server does not respond with the image
+
+    Returns
+    ----------
+    bytes
+        Encoded image.
+    """
+    response = requests.get(url, timeout=30)
+    if not response.ok:
+        raise RuntimeError('Cover server responded with status code %s.' % (response.status_code))
+    return response.content
+
+
+class CoverCache():
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=512 * 2**20, thumbnail_sizes=THUMBNAIL_SIZES,
+                 fetch=download_cover):
+        """
+        Create a disk cache of album covers. Every cover is stored once (keyed by
+        the hash of its URL) together with thumbnails of a few fixed sizes. When the
+        cache grows larger than max_bytes, the least recently used covers are evicted.
+
+        Parameters
+        ----------
+
+        cache_dir : Directory of the cache
+
+        max_bytes : Size cap of the cache in bytes
+
+        thumbnail_sizes : Largest side in pixels of the stored thumbnails
+
+        fetch : Function downloading the encoded image of a URL
+
+        The cache can be shared by several threads of a process.
+
+
+        Examples
+        ----------
+        Rendering the same mosaic twice downloads every cover only once:
+
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.cover_cache import CoverCache
+        >>>
+        >>> cache = CoverCache()
+        >>> vis.album_covers(num_albums=100, cache=cache)
+        >>> vis.album_covers(num_albums=100, cache=cache)
+
+        """
+        assert isinstance(cache_dir, str), "'cache_dir' must be of type str."
+        assert isinstance(max_bytes, int) and max_bytes > 0, "'max_bytes' must be an int larger than 0."
+        assert callable(fetch), "'fetch' must be callable."
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.thumbnail_sizes = sorted(thumbnail_sizes)
+        self.fetch = fetch
+
+        # entries in least recently used order, with their size on disk
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self._scan()
+
+
+    def key(self, url):
+        """
+        Cache key of a URL.
+        """
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+    def get(self, url, size=None):
+        """
+        Get an album cover, downloading it only if it is not cached.
+
+        Parameters
+        ----------
+
+        url : URL of the cover
+
+        size : (width, height) the cover will be displayed at, or None for the original.
+               The smallest cached version covering this size is returned.
+
+        Returns
+        ----------
+        PIL Image
+            The cover in RGB mode.
+        """
+        if not self.contains(url):
+            self.put(url, self.fetch(url))
+        try:
+            im = self._open(url, size)
+        except FileNotFoundError:
+            # the cover was evicted by another thread since it was looked up
+            self.put(url, self.fetch(url))
+            im = self._open(url, size)
+        return im.convert('RGB')
+
+
+    def _open(self, url, size):
+        # the lock is only held to find the file, covers are decoded in parallel
+        key = self.key(url)
+        with self.lock:
+            if key in self.entries:
+                self._touch(key)
+            path = self._path(key, self._level(size))
+        im = Image.open(path)
+        if size is not None:
+            # let the decoder downscale while decoding (JPEG only, a no-op for other formats)
+            im.draft('RGB', size)
+        im.load()
+        return im
+
+
+    def contains(self, url):
+        """
+        Check if the cover of a URL is cached.
+        """
+        with self.lock:
+            return self.key(url) in self.entries
+
+
+    def put(self, url, data):
+        """
+        Store an encoded cover and its thumbnails, then evict covers beyond the size cap.
+
+        Parameters
+        ----------
+
+        url : URL of the cover
+
+        data : Encoded image
+        """
+        key = self.key(url)
+        entry_dir = os.path.join(self.cache_dir, key[:2], key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=key, suffix='.tmp', dir=os.path.dirname(entry_dir))
+
+        with open(os.path.join(tmp_dir, ORIGINAL_NAME), 'wb') as file:
+            file.write(data)
+        im = Image.open(io.BytesIO(data)).convert('RGB')
+        for level in self.thumbnail_sizes:
+            thumbnail = im.copy()
+            thumbnail.thumbnail((level, level), Image.LANCZOS)
+            thumbnail.save(os.path.join(tmp_dir, '%d.jpg' % level), quality=90)
+
+        with self.lock:
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(tmp_dir, entry_dir)
+
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+            self.entries[key] = _dir_size(entry_dir)
+            self.total_bytes += self.entries[key]
+            self.evict()
+
+
+    def evict(self):
+        """
+        Remove the least recently used covers until the cache fits in max_bytes.
+        The most recently used cover is always kept.
+        """
+        with self.lock:
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                key, size = self.entries.popitem(last=False)
+                shutil.rmtree(os.path.join(self.cache_dir, key[:2], key), ignore_errors=True)
+                self.total_bytes -= size
+
+
+    def clear(self):
+        """
+        Remove all covers from the cache.
+        """
+        with self.lock:
+            for key in list(self.entries.keys()):
+                shutil.rmtree(os.path.join(self.cache_dir, key[:2], key), ignore_errors=True)
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+    def _level(self, size):
+        # smallest thumbnail covering the requested size, the original if none does
+        if size is None:
+            return None
+        for level in self.thumbnail_sizes:
+            if level >= max(size):
+                return level
+        return None
+
+
+    def _path(self, key, level):
+        name = ORIGINAL_NAME if level is None else '%d.jpg' % level
+        return os.path.join(self.cache_dir, key[:2], key, name)
+
+
+    def _touch(self, key):
+        self.entries.move_to_end(key)
+        os.utime(os.path.join(self.cache_dir, key[:2], key))
+
+
+    def _scan(self):
+        # rebuild the LRU order from the modification times of the cached covers
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry_dir = os.path.join(shard_dir, key)
+                if key.endswith('.tmp'):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                found.append((os.stat(entry_dir).st_mtime_ns, key, _dir_size(entry_dir)))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
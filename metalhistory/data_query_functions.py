@@ -8,13 +8,15 @@ import yaml
 import time
 
 class LastFM():
-    def __init__(self):
+    def __init__(self, fetch=None):
         """
         Create LastFM API Object that can be used to query the database.
 
         Parameters
         ----------
-        None
+
+        fetch : Function getting a URL and returning a requests.Response-like object
+                (or None for requests.get), e.g. a local stand-in for tests and benchmarks
 
 
         Examples
@@ -33,7 +35,9 @@ class LastFM():
         self.api_str = '&api_key=' + api_key
         self.base_str = 'http://ws.audioscrobbler.com/2.0/?'
 
-        with open('metalhistory/config.yaml') as file:
+        self.fetch = requests.get if fetch is None else fetch
+
+        with open(os.path.join(os.path.dirname(__file__), 'config.yaml')) as file:
             self.config = yaml.load(file, Loader=yaml.FullLoader)
 
         pass
@@ -89,7 +93,6 @@ class LastFM():
         
         for key in kwargs.keys():
             if key not in INVALID_KWARGS:
-                print(key, kwargs[key])
                 request_str += '&' + key + '=' + self.clean_string(kwargs[key])
         
         if format_spec is not None:
@@ -157,7 +160,7 @@ class LastFM():
         
         method = 'album.search'
 
-        response = requests.get(self.build_request(method=method, verbose=verbose, **kwargs))
+        response = self.fetch(self.build_request(method=method, verbose=verbose, **kwargs))
         if not response.ok:
             raise RuntimeError('LastFM API responded with status code %s.' % (response.status_code))
 
@@ -213,13 +216,14 @@ class LastFM():
         
         method = 'album.getinfo'
 
-        response = requests.get(self.build_request(method=method, verbose=verbose, **kwargs))
+        response = self.fetch(self.build_request(method=method, verbose=verbose, **kwargs))
         if not response.ok:
             raise RuntimeError('LastFM API responded with status code %s.' % (response.status_code))
 
         try:
             try:
-                r_data = requests.get(self.build_request(method=method, verbose=verbose, **kwargs)).json()['album']
+                # the album info is decoded from the response checked above, without querying it again
+                r_data = response.json()['album']
                 fields = kwargs['fields'] if 'fields' in kwargs.keys() else None
                 if fields is not None:
                     r_dict = self.response_formatter(r_data, fields)
@@ -281,7 +285,7 @@ class LastFM():
         
         method = 'track.getinfo'
 
-        response = requests.get(self.build_request(method=method, verbose=verbose, **kwargs))
+        response = self.fetch(self.build_request(method=method, verbose=verbose, **kwargs))
         if not response.ok:
             raise RuntimeError('LastFM API responded with status code %s.' % (response.status_code))
 
@@ -339,14 +343,14 @@ class LastFM():
 
         """
         if mbid is not None:
-            response = requests.get('http://musicbrainz.org/ws/2/release/' + str(mbid) + '?inc=release-groups&fmt=xml')
+            response = self.fetch('http://musicbrainz.org/ws/2/release/' + str(mbid) + '?inc=release-groups&fmt=xml')
             while response.status_code == 503:
                 retry_margin = 2
                 retry_after = int(response.headers['Retry-After']) + retry_margin
                 
                 print('Response code 503. Waiting for %d seconds.' % (retry_after))
                 time.sleep(retry_after)
-                response = requests.get('http://musicbrainz.org/ws/2/release/' + str(mbid) + '?inc=release-groups&fmt=xml')
+                response = self.fetch('http://musicbrainz.org/ws/2/release/' + str(mbid) + '?inc=release-groups&fmt=xml')
 
             if response.status_code == 200:
                 response_dict = xmltodict.parse(response.text)
@@ -395,3 +399,49 @@ class LastFM():
                 else:
                     r_dict[field] = json[field]
         return r_dict
+
+
+# fields of the album info queried to build the processed dataset
+ENRICH_FIELDS = ['artist', 'name', 'release-date', 'listeners', 'playcount', 'tags', 'mbid', 'url', 'image']
+
+# columns of the processed dataset written by enrich_albums
+ENRICHED_COLUMNS = ['artist', 'album', 'ignored tags', 'image', 'listeners', 'mbid', 'playcount',
+                    'release-date', 'tags', 'url', 'MA_score', 'MA_artist', 'MA_album']
+
+
+def enrich_albums(lastfm, albums, fields=ENRICH_FIELDS):
+    """
+    Query the LastFM info of Metal Archives albums, one album at a time, so that
+    the albums can be streamed from and to files of any size. An album whose
+    query fails is recorded with NaN LastFM fields and the next albums are queried.
+
+    Parameters
+    ----------
+
+    lastfm : LastFM API object
+
+    albums : Iterable of dictionaries with the 'artist', 'album' and 'MA_score' of the albums
+
+    fields : Fields of the album info to query
+
+    Returns
+    ----------
+    Iterator over (album, row, error) tuples, row being the dictionary of the ENRICHED_COLUMNS
+    of the album, or None if LastFM has no info about it, and error the exception raised by
+    the query of the album (or None).
+    """
+    for album in albums:
+        try:
+            info = lastfm.get_album_info(artist=album['artist'], album=album['album'], fields=fields)
+            error = None
+        except Exception as e:
+            info, error = {}, e
+        if not isinstance(info, dict):
+            yield album, None, None
+            continue
+        info = dict(info)
+        info['album'] = info.pop('name', np.nan)
+        info['MA_score'] = album.get('MA_score')
+        info['MA_artist'] = album['artist']
+        info['MA_album'] = album['album']
+        yield album, {c: info.get(c, np.nan) for c in ENRICHED_COLUMNS}, error
@@ -0,0 +1,146 @@
+"""
+Creation, sizing and pooling of the matplotlib figures of the visualizations
+"""
+
+import os
+import threading
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .profiling import stage
+
+
+DPI = 100
+
+# bar plots grow with the number of bars, within bounds
+BAR_HEIGHT = 6
+BAR_WIDTH_PER_BAR = 0.4
+MIN_BAR_WIDTH = 6
+MAX_BAR_WIDTH = 40
+
+
+def create_figure(fig_size, dpi=DPI):
+    """
+    Create a figure drawn by the headless Agg canvas. The figure is not registered
+    with pyplot, so it is owned by the caller and freed with it.
+
+    Parameters
+    ----------
+
+    fig_size : (width, height) of the figure in inches
+
+    dpi : Resolution of the figure in dots per inch
+
+    Returns
+    ----------
+
+    Matplotlib figure
+    """
+    fig = Figure(figsize=fig_size, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def bar_figure_size(n_bars):
+    """
+    Size in inches of a bar plot with the given number of bars.
+    """
+    width = min(MAX_BAR_WIDTH, max(MIN_BAR_WIDTH, 2 + BAR_WIDTH_PER_BAR * n_bars))
+    return (width, BAR_HEIGHT)
+
+
+def figure_memory(fig):
+    """
+    Size in bytes of the RGBA pixel buffer of a figure, which dominates the memory
+    needed to render it.
+    """
+    width, height = fig.get_size_inches() * fig.dpi
+    return int(width) * int(height) * 4
+
+
+def save_figure(fig, file_name):
+    """
+    Save a figure, creating the directory of the file if needed.
+
+    Parameters
+    ----------
+
+    fig : Matplotlib figure
+
+    file_name : Name of the output file (or None to not save)
+    """
+    if file_name is None:
+        return
+    dir_name = os.path.dirname(file_name)
+    if dir_name != '' and not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+    with stage('savefig'):
+        fig.savefig(file_name)
+
+
+class FigurePool():
+    def __init__(self, max_figures=4):
+        """
+        Pool of figures reused across renders, for batch jobs drawing many charts.
+        Charts drawn with a pool return a figure of the pool, which the caller gives
+        back with release when done; it is then cleared and handed out again instead
+        of allocating a new one.
+
+        Parameters
+        ----------
+
+        max_figures : Number of idle figures kept by the pool
+
+
+        Examples
+        ----------
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.figures import FigurePool
+        >>>
+        >>> pool = FigurePool()
+        >>> for metric in ['listeners', 'playcount', 'MA_score']:
+        >>>     fig, df = vis.artist_barplot(metric=metric, file_name='images/%s.svg' % metric, figure_pool=pool)
+        >>>     pool.release(fig)
+
+        """
+        assert isinstance(max_figures, int) and max_figures > 0, "'max_figures' must be an int larger than 0."
+
+        self.max_figures = max_figures
+        self.idle = []
+        self.lock = threading.Lock()
+
+
+    def acquire(self, fig_size, dpi=DPI):
+        """
+        Get an empty figure of the given size.
+
+        Parameters
+        ----------
+
+        fig_size : (width, height) of the figure in inches
+
+        dpi : Resolution of the figure in dots per inch
+
+        Returns
+        ----------
+
+        Matplotlib figure, to be given back with release
+        """
+        with self.lock:
+            fig = self.idle.pop() if len(self.idle) > 0 else None
+        if fig is None:
+            return create_figure(fig_size, dpi)
+        fig.set_dpi(dpi)
+        fig.set_size_inches(fig_size)
+        return fig
+
+
+    def release(self, fig):
+        """
+        Give a figure back to the pool. It must not be used by the caller anymore.
+        """
+        fig.clear()
+        with self.lock:
+            if len(self.idle) < self.max_figures:
+                self.idle.append(fig)
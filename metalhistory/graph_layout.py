@@ -0,0 +1,272 @@
+"""
+Force-directed layout of large tag graphs, vectorized with numpy
+"""
+
+import json
+import os
+
+import networkx as nx
+import numpy as np
+
+from .profiling import profiled
+
+
+# repulsion is computed exactly between all the nodes of graphs up to this size
+EXACT_REPULSION_NODES = 400
+# max number of levels of the grids approximating the repulsion of larger graphs
+MAX_GRID_DEPTH = 10
+
+# layouts are computed in units of the optimal distance between nodes, so that the
+# positions of a layout keep their scale when it is continued with more nodes
+# temperature (max displacement per iteration) of a layout started from scratch, relative to its side
+INITIAL_TEMPERATURE = 0.1
+# min share of the initial temperature of a layout started from earlier positions
+WARM_TEMPERATURE = 0.02
+# pull towards the center, keeping disconnected tags close to the rest of the graph
+GRAVITY = 0.05
+# jitter of the nodes placed next to their positioned neighbours, in units of the optimal distance
+NEW_NODE_JITTER = 0.05
+
+
+@profiled('graph.force_layout')
+def force_layout(G, pos=None, iterations=100, weight='weight', seed=0):
+    """
+    Fruchterman-Reingold layout of a graph. The nodes attract their neighbours
+    (more strongly along heavier edges, with the log of the weight) and repel all the other nodes. On graphs
+    larger than EXACT_REPULSION_NODES the repulsion is approximated like in the
+    Barnes-Hut algorithm, on a quadtree of grids vectorized level by level: nodes
+    in neighbouring cells of the finest grid repel each other exactly, farther
+    nodes as the center of mass of the largest cell well separated from the node,
+    so an iteration costs about n log(n) operations instead of n^2.
+
+    With the positions of an earlier layout, the known nodes start where they
+    were, new nodes start next to their positioned neighbours and the layout
+    starts cooler, so adding a few tags only perturbs the existing layout.
+
+    Parameters
+    ----------
+
+    G : Graph to lay out
+
+    pos : Dictionary of initial positions by node (or None to start from random positions)
+
+    iterations : Number of iterations
+
+    weight : Edge attribute scaling the attraction (or None for unweighted edges)
+
+    seed : Seed of the random initial positions
+
+    Returns
+    ----------
+
+    Dictionary of positions by node, in units of the optimal distance between nodes
+    (see scale_positions to fit them into a figure)
+
+
+    Examples
+    ----------
+    >>> from metalhistory.graph_layout import force_layout
+    >>>
+    >>> pos = force_layout(G)
+    >>> G.add_edge('death metal', 'deathcore', weight=3)
+    >>> pos = force_layout(G, pos=pos, iterations=30)  # warm start
+
+    """
+    assert isinstance(G, nx.Graph), "'G' must be a networkx Graph."
+    assert isinstance(iterations, int) and iterations >= 0, "'iterations' must be an int larger or equal to 0."
+
+    nodes = list(G)
+    n = len(nodes)
+    if n == 0:
+        return {}
+    if n == 1:
+        return {nodes[0]: np.zeros(2) if pos is None or nodes[0] not in pos else np.array(pos[nodes[0]], dtype=float)}
+
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index[u], index[v]) for u, v in G.edges() if u != v], dtype=np.int64).reshape(-1, 2)
+    if weight is None or len(edges) == 0:
+        weights = np.ones(len(edges))
+    else:
+        # cooccurrence counts are heavy-tailed, the attraction grows with their log
+        weights = np.log1p([d.get(weight, 1) for u, v, d in G.edges(data=True) if u != v])
+        weights = weights / weights.mean()
+
+    rng = np.random.default_rng(seed)
+    x, known = _initial_positions(nodes, edges, pos, rng)
+    k = 1
+    # a warm start only needs to settle the new nodes
+    temperature = INITIAL_TEMPERATURE * np.sqrt(n) * max(1 - known.mean(), WARM_TEMPERATURE)
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        if n <= EXACT_REPULSION_NODES:
+            force = _exact_repulsion(x, k)
+        else:
+            force = _grid_repulsion(x, k)
+
+        if len(edges) > 0:
+            delta = x[edges[:, 0]] - x[edges[:, 1]]
+            distance = np.sqrt((delta ** 2).sum(axis=1))
+            pull = delta * (distance * weights / k)[:, None]
+            for axis in range(2):
+                force[:, axis] -= np.bincount(edges[:, 0], pull[:, axis], minlength=n)
+                force[:, axis] += np.bincount(edges[:, 1], pull[:, axis], minlength=n)
+        force -= GRAVITY * (x - x.mean(axis=0)) / k
+
+        # each node moves along its force by at most the temperature
+        length = np.maximum(np.sqrt((force ** 2).sum(axis=1)), 1e-9)
+        x += force * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    return dict(zip(nodes, x))
+
+
+def scale_positions(pos):
+    """
+    Center positions and scale them into [-1, 1].
+
+    Parameters
+    ----------
+
+    pos : Dictionary of positions by node
+
+    Returns
+    ----------
+
+    Dictionary of scaled positions by node
+    """
+    if len(pos) == 0:
+        return {}
+    x = np.array(list(pos.values()), dtype=float)
+    x -= (x.max(axis=0) + x.min(axis=0)) / 2
+    x /= max(np.abs(x).max(), 1e-9)
+    return dict(zip(pos, x))
+
+
+def _initial_positions(nodes, edges, pos, rng):
+    # positions of the known nodes, new nodes at the mean of their known neighbours
+    n = len(nodes)
+    x = (rng.random((n, 2)) - 0.5) * np.sqrt(n)
+    known = np.zeros(n, dtype=bool)
+    if pos is None:
+        return x, known
+
+    for i, node in enumerate(nodes):
+        if node in pos:
+            x[i] = pos[node]
+            known[i] = True
+    if known.any() and not known.all():
+        total = np.zeros((n, 2))
+        count = np.zeros(n)
+        for a, b in [(0, 1), (1, 0)]:
+            mask = known[edges[:, b]] & ~known[edges[:, a]]
+            np.add.at(total, edges[mask, a], x[edges[mask, b]])
+            np.add.at(count, edges[mask, a], 1)
+        placed = count > 0
+        x[placed] = total[placed] / count[placed, None] + NEW_NODE_JITTER * (rng.random((placed.sum(), 2)) - 0.5)
+        # nodes without positioned neighbours start anywhere around the known ones
+        spread = x[known].max(axis=0) - x[known].min(axis=0)
+        lonely = ~known & ~placed
+        x[lonely] = x[known].mean(axis=0) + (rng.random((lonely.sum(), 2)) - 0.5) * spread
+    return x, known
+
+
+def _exact_repulsion(x, k):
+    # k^2 / d along the direction between every pair of nodes
+    delta = x[:, None, :] - x[None, :, :]
+    distance2 = np.maximum((delta ** 2).sum(axis=2), 1e-6)
+    return (delta * (k ** 2 / distance2)[:, :, None]).sum(axis=1)
+
+
+def _grid_repulsion(x, k):
+    # quadtree of grids: the level l splits the bounding square into 2^l x 2^l cells
+    n = len(x)
+    lower = x.min(axis=0)
+    side = max((x.max(axis=0) - lower).max(), 1e-9) * (1 + 1e-9)
+    unit = (x - lower) / side
+    depth = min(max(int(np.ceil(np.log(n / 2) / np.log(4))), 2), MAX_GRID_DEPTH)
+
+    force = np.zeros((n, 2))
+    for level in range(2, depth + 1):
+        g = 2 ** level
+        cell_xy = (unit * g).astype(np.int64)
+        cell = cell_xy[:, 0] * g + cell_xy[:, 1]
+        mass = np.bincount(cell, minlength=g * g).astype(float)
+        center = np.stack([np.bincount(cell, x[:, axis], minlength=g * g) for axis in range(2)], axis=1)
+        center /= np.maximum(mass, 1)[:, None]
+
+        # cells in the neighbourhood of the parent cell but not of the cell itself are
+        # far enough to repel as one node of their mass at their center of mass; the
+        # nearer ones are split at the next level
+        parent_xy = cell_xy // 2 * 2
+        for a in range(-2, 4):
+            for b in range(-2, 4):
+                qx, qy = parent_xy[:, 0] + a, parent_xy[:, 1] + b
+                far = (np.maximum(np.abs(qx - cell_xy[:, 0]), np.abs(qy - cell_xy[:, 1])) > 1) \
+                    & (qx >= 0) & (qx < g) & (qy >= 0) & (qy < g)
+                source = np.flatnonzero(far)
+                q = qx[far] * g + qy[far]
+                source, q = source[mass[q] > 0], q[mass[q] > 0]
+                delta = x[source] - center[q]
+                push = delta * (mass[q] * k ** 2 / np.maximum((delta ** 2).sum(axis=1), 1e-6))[:, None]
+                for axis in range(2):
+                    force[:, axis] += np.bincount(source, push[:, axis], minlength=n)
+
+    # exact repulsion between the nodes of neighbouring cells of the finest level,
+    # with the nodes sorted by cell and the first node of each cell
+    counts = mass.astype(np.int64)
+    order = np.argsort(cell, kind='stable')
+    starts = np.cumsum(counts) - counts
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            cx, cy = cell_xy[:, 0] + dx, cell_xy[:, 1] + dy
+            valid = (cx >= 0) & (cx < g) & (cy >= 0) & (cy < g)
+            source = np.flatnonzero(valid)
+            neighbour = cx[valid] * g + cy[valid]
+            n_pairs = counts[neighbour]
+            i = np.repeat(source, n_pairs)
+            offsets = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+            j = order[np.repeat(starts[neighbour], n_pairs) + offsets]
+            i, j = i[i != j], j[i != j]
+            delta = x[i] - x[j]
+            push = delta * (k ** 2 / np.maximum((delta ** 2).sum(axis=1), 1e-6))[:, None]
+            for axis in range(2):
+                force[:, axis] += np.bincount(i, push[:, axis], minlength=n)
+    return force
+
+
+def load_positions(file_name):
+    """
+    Load the positions saved by save_positions.
+
+    Parameters
+    ----------
+
+    file_name : Name of the json file
+
+    Returns
+    ----------
+
+    Dictionary of positions by node, empty if the file does not exist
+    """
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name) as file:
+        return {node: np.array(xy) for node, xy in json.load(file).items()}
+
+
+def save_positions(pos, file_name):
+    """
+    Save the positions of a layout as json, to warm-start later layouts.
+
+    Parameters
+    ----------
+
+    pos : Dictionary of positions by node name
+
+    file_name : Name of the json file
+    """
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name, 'w') as file:
+        json.dump({str(node): [float(v) for v in xy] for node, xy in pos.items()}, file)
+    os.replace(tmp_name, file_name)
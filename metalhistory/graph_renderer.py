@@ -0,0 +1,236 @@
+"""
+Renderer of tag graphs, reusing a styled figure template across calls
+"""
+
+import hashlib
+import math
+import os
+import threading
+
+import networkx as nx
+import numpy as np
+from PIL import Image
+
+from .figures import create_figure, save_figure
+from .graph_layout import force_layout, load_positions, save_positions, scale_positions
+from .profiling import stage
+
+
+BACKGROUND_IMAGE_FILE = os.path.abspath(__file__ + "/../../") + '/assets/coal_bg_crop.jpg'
+
+# Plot constants for tag graph
+FIG_SIZE = (12, 10)
+DPI = 100
+
+X_OFFSET = 1.1
+Y_OFFSET = 1.25  # y-axis offset needs to be larger so labels have enough space
+X_LIMIT = [-2, 2]
+Y_LIMIT = [-1.5, 2]
+IMG_EXTENT = X_LIMIT + Y_LIMIT
+
+NODE_SIZE = 7
+NODE_COLOR = 'white'
+SHADOW_NODE_SIZE = 10
+SHADOW_NODE_COLOR = '#333333'
+
+MAX_NODE_WEIGHT = 300  # nodes of heavier tags (e.g. of large datasets) are scaled down
+
+EDGE_WIDTH = 1.0
+EDGE_WIDTH_LOG_BASE = 3  # Base 10 was too extreme, base 2 too small
+EDGE_COLOR = 'white'
+
+LABEL_FONT_COLOR = 'white'
+LABEL_FONT_WEIGHT = 'bold'
+LABEL_FONT_SIZE = 12
+MIN_LABEL_FONT_SIZE = 5
+LABEL_Y_OFFSET = 0.06  # labels above the nodes of force-directed layouts
+FORCE_SCALE = (1.8, 1.3)  # force-directed layouts fill the axes below the title
+
+LAYOUTS = ['circular', 'force']
+# iterations of a force-directed layout from scratch and from the positions of earlier renders
+FORCE_ITERATIONS = 150
+WARM_ITERATIONS = 40
+
+TITLE_TEXT = 'Heavy Metal Genre Relations'
+TITLE_X_POS = -1.2
+TITLE_Y_POS = 1.5
+TITLE_FONT_SIZE = 28
+TITLE_FONT_COLOR = 'white'
+
+
+class TagGraphRenderer():
+    def __init__(self, background_file=BACKGROUND_IMAGE_FILE, fig_size=FIG_SIZE, dpi=DPI, positions_file=None):
+        """
+        Renderer of tag graphs. The background image is loaded and downsampled to
+        the figure resolution once, and the styled figure (background, limits and
+        title) is kept as a template: every render only redraws the nodes, edges
+        and labels of the graph.
+
+        The positions of the tags of force-directed layouts are kept, so that the
+        next layouts start from them: the graph of a few more tags or albums keeps
+        its shape and takes fewer iterations.
+
+        Parameters
+        ----------
+
+        background_file : Path of the background image
+
+        fig_size : Size of the figure in inches
+
+        dpi : Resolution of the figure in dots per inch
+
+        positions_file : Json file where the tag positions are kept across runs (or None to keep them in memory)
+
+
+        Examples
+        ----------
+        Render the graphs of several subgenres with the same renderer:
+
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.graph_renderer import TagGraphRenderer
+        >>> from metalhistory.tag_index import TagQuery
+        >>>
+        >>> renderer = TagGraphRenderer()
+        >>> for genre in ['thrash metal', 'death metal', 'black metal']:
+        >>>     vis.tag_graph(file_name='images/%s.svg' % genre, tag_query=TagQuery(all_of=[genre]), renderer=renderer)
+
+        Lay out a genre map of hundreds of tags, starting from the positions of the last run:
+
+        >>> renderer = TagGraphRenderer(positions_file='images/tag_positions.json')
+        >>> vis.tag_graph(300, file_name='images/genre_map.svg', layout='force', renderer=renderer)
+
+        """
+        self.lock = threading.Lock()
+        self.positions_file = positions_file
+        self.positions = {} if positions_file is None else load_positions(positions_file)
+        self.figure = create_figure(fig_size, dpi)
+        self.ax = self.figure.add_subplot()
+
+        # the background is never shown larger than the figure
+        background = Image.open(background_file)
+        pixels = (int(fig_size[0] * dpi), int(fig_size[1] * dpi))
+        background.draft('RGB', pixels)
+        background = background.convert('RGB')
+        background.thumbnail(pixels, Image.LANCZOS)
+        self.background = np.asarray(background)
+
+        # the style of the figures, keying the renders of this renderer
+        self.style = hashlib.sha1(repr((tuple(fig_size), dpi)).encode('utf-8') + self.background.tobytes()).hexdigest()
+
+        self.ax.imshow(self.background, extent=IMG_EXTENT)
+        self.ax.set_xlim(X_LIMIT)
+        self.ax.set_ylim(Y_LIMIT)
+        self.title = self.ax.text(TITLE_X_POS, TITLE_Y_POS, TITLE_TEXT, size=TITLE_FONT_SIZE, color=TITLE_FONT_COLOR)
+        self.template = set(self.ax.get_children())
+
+
+    def render(self, G, file_name=None, title=TITLE_TEXT, layout='circular', node_colors=None):
+        """
+        Draw a tag graph on the template figure.
+
+        Parameters
+        ----------
+
+        G : Tag graph with 'weight' attributes on nodes and edges
+
+        file_name : Name of the output image (or None to not save)
+
+        title : Title of the figure
+
+        layout : Layout of the tags [circular, force]
+
+        node_colors : Dictionary of colors by tag (or None to draw all the tags in NODE_COLOR)
+
+        Returns
+        ----------
+
+        Matplotlib figure of the tag graph. The figure is reused by the next render.
+        """
+        assert layout in LAYOUTS, "'layout' must be in %s." % LAYOUTS
+        n_weights = nx.get_node_attributes(G, 'weight')
+        e_weights = list(nx.get_edge_attributes(G, 'weight').values())
+        node_scale = min(1, MAX_NODE_WEIGHT / max(list(n_weights.values()) + [1]))
+        edge_scale = 1
+        colors = NODE_COLOR if node_colors is None else [node_colors.get(k, NODE_COLOR) for k in n_weights]
+        if layout == 'force':
+            # nodes and edges shrink as the graph grows
+            node_scale *= min(1, 18 / max(len(G), 1))
+            edge_scale = min(1, math.sqrt(18 / max(len(G), 1)))
+
+        with self.lock:
+            # remove the graph of the previous render
+            for artist in set(self.ax.get_children()) - self.template:
+                artist.remove()
+            self.title.set_text(title)
+
+            with stage('graph.layout'):
+                if layout == 'circular':
+                    pos = nx.circular_layout(G)
+                    pos_outer = {}
+                    for k, v in pos.items():
+                        pos_outer[k] = (v[0]*(X_OFFSET), v[1]*(Y_OFFSET))
+                    font_size = LABEL_FONT_SIZE
+                else:
+                    pos = {k: v * FORCE_SCALE for k, v in scale_positions(self.force_layout(G)).items()}
+                    pos_outer = {k: (v[0], v[1] + LABEL_Y_OFFSET) for k, v in pos.items()}
+                    # labels shrink as the graph grows
+                    font_size = max(LABEL_FONT_SIZE * math.sqrt(18 / max(len(G), 18)), MIN_LABEL_FONT_SIZE)
+
+            with stage('graph.draw'):
+                nx.draw_networkx(G, pos, ax=self.ax, nodelist=n_weights.keys(), node_size=[v * node_scale * SHADOW_NODE_SIZE for v in n_weights.values()], node_color=SHADOW_NODE_COLOR, edge_color=EDGE_COLOR, width=[math.log(v, EDGE_WIDTH_LOG_BASE) * EDGE_WIDTH * edge_scale for v in e_weights], with_labels=False)
+                nx.draw_networkx_nodes(G, pos, ax=self.ax, nodelist=n_weights.keys(), node_size=[v * node_scale * NODE_SIZE for v in n_weights.values()], node_color=colors)
+                nx.draw_networkx_labels(G, pos_outer, ax=self.ax, font_size=font_size, font_color=LABEL_FONT_COLOR, font_weight=LABEL_FONT_WEIGHT)
+            self.ax.set_xlim(X_LIMIT)
+            self.ax.set_ylim(Y_LIMIT)
+
+            save_figure(self.figure, file_name)
+        return self.figure
+
+
+    def fingerprint(self, layout='circular'):
+        """
+        Hash of the state of the renderer changing the graphs of a layout: the style of
+        the figure and, for force-directed layouts, the positions the layouts start from.
+
+        Parameters
+        ----------
+
+        layout : Layout of the tags [circular, force]
+
+        Returns
+        ----------
+
+        Hex digest string
+        """
+        h = hashlib.sha1(self.style.encode('utf-8'))
+        if layout == 'force':
+            with self.lock:
+                positions = sorted((tag, [float(x) for x in pos]) for tag, pos in self.positions.items())
+            h.update(repr(positions).encode('utf-8'))
+        return h.hexdigest()
+
+
+    def force_layout(self, G):
+        """
+        Force-directed layout of a graph, started from the positions of the tags of
+        earlier layouts, which are then updated (see graph_layout.force_layout).
+
+        Parameters
+        ----------
+
+        G : Tag graph with 'weight' attributes on edges
+
+        Returns
+        ----------
+
+        Dictionary of positions by tag
+        """
+        known = [tag for tag in G if tag in self.positions]
+        if len(known) == 0:
+            pos = force_layout(G, iterations=FORCE_ITERATIONS)
+        else:
+            pos = force_layout(G, pos={tag: self.positions[tag] for tag in known}, iterations=WARM_ITERATIONS)
+        self.positions.update(pos)
+        if self.positions_file is not None:
+            save_positions(self.positions, self.positions_file)
+        return pos
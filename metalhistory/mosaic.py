@@ -0,0 +1,340 @@
+"""
+Layout and rendering of album cover mosaics
+"""
+
+import io
+import itertools
+import os
+import struct
+import warnings
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from PIL import Image
+
+from .cover_cache import download_cover
+from .treemap import treemap_boxes
+
+
+# color of the tiles of covers that could not be loaded
+PLACEHOLDER_COLOR = (40, 40, 40)
+
+
+def cover_layout(values, width, height):
+    """
+    Compute the squarified treemap layout of album covers (cached, see treemap_boxes).
+
+    Parameters
+    ----------
+
+    values : Sizes of the covers (e.g. playcounts), sorted in decreasing order
+
+    width : Width of the mosaic
+
+    height : Height of the mosaic
+
+    Returns
+    ----------
+    ndarray
+        Int array of shape (n, 4) with the box (left, upper, right, lower) of every value.
+    """
+    return treemap_boxes(values, width, height)
+
+
+def open_cover(url, size, cache=None):
+    """
+    Open an album cover at a resolution of at least the given size (if available),
+    without resizing it to that size.
+
+    Parameters
+    ----------
+
+    url : URL of the cover
+
+    size : (width, height) the cover will be displayed at
+
+    cache : CoverCache used to get the cover (or None to download it)
+
+    Returns
+    ----------
+
+    The cover as a PIL Image object in RGB mode
+    """
+    if cache is not None:
+        return cache.get(url, size=size)
+    im = Image.open(io.BytesIO(download_cover(url)))
+    # let the decoder downscale while decoding (JPEG only, a no-op for other formats)
+    im.draft('RGB', size)
+    return im.convert('RGB')
+
+
+def load_cover(url, size, cache=None):
+    """
+    Load an album cover resized to the given size.
+
+    Parameters
+    ----------
+
+    url : URL of the cover
+
+    size : (width, height) of the returned image
+
+    cache : CoverCache used to get the cover (or None to download it)
+
+    Returns
+    ----------
+
+    The cover as a PIL Image object
+    """
+    return open_cover(url, size, cache).resize(size)
+
+
+def map_bounded(function, items, n_workers=8):
+    """
+    Apply a function to items on a pool of threads. At most 2 * n_workers items
+    are in flight, so memory does not grow with the number of items.
+
+    Parameters
+    ----------
+
+    function : Function applied to every item
+
+    items : Iterable of items
+
+    n_workers : Number of threads
+
+    Returns
+    ----------
+
+    Iterator over the results, in completion order
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        in_flight = set()
+        for item in itertools.islice(items, 2 * n_workers):
+            in_flight.add(executor.submit(function, item))
+        while len(in_flight) > 0:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                for item in itertools.islice(items, 1):
+                    in_flight.add(executor.submit(function, item))
+
+
+def load_covers(tiles, cache=None, n_workers=8):
+    """
+    Load album covers in parallel, resized to their boxes. A cover that cannot be
+    loaded is replaced by a placeholder tile.
+
+    Parameters
+    ----------
+
+    tiles : List of (url, box) pairs, box being (left, upper, right, lower) in the output image
+
+    cache : CoverCache used to get the covers (or None to download them)
+
+    n_workers : Number of threads
+
+    Returns
+    ----------
+
+    Iterator over (box, image) pairs, in completion order
+    """
+    def load(tile):
+        url, box = tile
+        size = (box[2] - box[0], box[3] - box[1])
+        try:
+            return box, load_cover(url, size, cache)
+        except Exception as e:
+            warnings.warn('Could not load cover %s (%s), using a placeholder.' % (url, e))
+            return box, Image.new('RGB', size, PLACEHOLDER_COLOR)
+
+    return map_bounded(load, tiles, n_workers)
+
+
+def render_region(placed, region):
+    """
+    Render a region of a mosaic. Only the part of every cover that intersects the
+    region is resized, so memory is bounded by the region size.
+
+    Parameters
+    ----------
+
+    placed : List of (box, image) pairs, box being (left, upper, right, lower) in the mosaic
+             and image the cover at any resolution
+
+    region : (left, upper, right, lower) of the region in the mosaic
+
+    Returns
+    ----------
+
+    The region as a PIL Image object
+    """
+    left, upper, right, lower = region
+    out = Image.new('RGB', (right - left, lower - upper))
+    for box, im in placed:
+        part_left, part_upper = max(box[0], left), max(box[1], upper)
+        part_right, part_lower = min(box[2], right), min(box[3], lower)
+        if part_right <= part_left or part_lower <= part_upper:
+            continue
+        # part of the cover falling in the region, in cover coordinates
+        scale_x = im.width / (box[2] - box[0])
+        scale_y = im.height / (box[3] - box[1])
+        source_box = ((part_left - box[0]) * scale_x, (part_upper - box[1]) * scale_y,
+                      (part_right - box[0]) * scale_x, (part_lower - box[1]) * scale_y)
+        part = im.resize((part_right - part_left, part_lower - part_upper), box=source_box)
+        out.paste(part, (part_left - left, part_upper - upper))
+    return out
+
+
+class StreamingPNGWriter():
+    def __init__(self, file_name, width, height):
+        """
+        Write an RGB PNG file band by band, so that the whole image never has to be
+        held in memory. The file is written to a temporary name and moved in place
+        when the writer is closed.
+
+        Parameters
+        ----------
+
+        file_name : Name of the output file
+
+        width : Width of the image
+
+        height : Height of the image
+
+
+        Examples
+        ----------
+        >>> with StreamingPNGWriter('poster.png', 16384, 16384) as writer:
+        >>>     for band in bands:
+        >>>         writer.write(band)
+
+        """
+        self.file_name = file_name
+        self.width = width
+        self.height = height
+        self.rows = 0
+
+        dir_name = os.path.dirname(file_name)
+        if dir_name != '' and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        self.tmp_name = file_name + '.tmp'
+        self.file = open(self.tmp_name, 'wb')
+        self.compressor = zlib.compressobj(6)
+
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        # 8 bits per channel, RGB, default compression, filtering and no interlacing
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+
+    def write(self, band):
+        """
+        Append a band of rows to the image.
+
+        Parameters
+        ----------
+
+        band : PIL Image of the full image width
+        """
+        assert band.width == self.width, "'band' must have the width of the image."
+        assert self.rows + band.height <= self.height, "too many rows written."
+
+        pixels = np.asarray(band.convert('RGB')).reshape(band.height, self.width * 3)
+        # every row starts with its filter type, 0 (none)
+        rows = np.hstack([np.zeros((band.height, 1), dtype=np.uint8), pixels])
+        data = self.compressor.compress(rows.tobytes())
+        if len(data) > 0:
+            self._write_chunk(b'IDAT', data)
+        self.rows += band.height
+
+
+    def close(self):
+        """
+        Finish the image and move it to its final name.
+        """
+        assert self.rows == self.height, "the image is missing %d rows." % (self.height - self.rows)
+        self._write_chunk(b'IDAT', self.compressor.flush())
+        self._write_chunk(b'IEND', b'')
+        self.file.close()
+        os.replace(self.tmp_name, self.file_name)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.tmp_name)
+
+
+    def _write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type + data)
+        self.file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def render_mosaic_tiled(tiles, width, height, file_name, band_height=512, cache=None, n_workers=8):
+    """
+    Render a mosaic into a PNG file band by band. The layout is computed once by
+    the caller, every band only holds the covers intersecting it, so peak memory
+    is bounded by the band size rather than by the mosaic size.
+
+    Parameters
+    ----------
+
+    tiles : List of (url, box) pairs, box being (left, upper, right, lower) in the mosaic
+
+    width : Width of the mosaic
+
+    height : Height of the mosaic
+
+    file_name : Name of the output PNG file
+
+    band_height : Number of rows rendered at once
+
+    cache : CoverCache used to get the covers (or None to download them)
+
+    n_workers : Number of threads loading covers
+
+    Returns
+    ----------
+
+    Name of the output file
+    """
+    assert isinstance(band_height, int) and band_height > 0, "'band_height' must be an int larger than 0."
+
+    def load(i):
+        url, box = tiles[i]
+        size = (box[2] - box[0], box[3] - box[1])
+        try:
+            return i, open_cover(url, size, cache)
+        except Exception as e:
+            warnings.warn('Could not load cover %s (%s), using a placeholder.' % (url, e))
+            return i, Image.new('RGB', (1, 1), PLACEHOLDER_COLOR)
+
+    # covers are opened when the first band they intersect is rendered
+    order = sorted(range(len(tiles)), key=lambda i: tiles[i][1][1])
+    next_tile = 0
+    sources = {}
+    with StreamingPNGWriter(file_name, width, height) as writer:
+        for upper in range(0, height, band_height):
+            lower = min(height, upper + band_height)
+            starting = []
+            while next_tile < len(order) and tiles[order[next_tile]][1][1] < lower:
+                starting.append(order[next_tile])
+                next_tile += 1
+            for i, im in map_bounded(load, starting, n_workers):
+                sources[i] = im
+
+            writer.write(render_region([(tiles[i][1], im) for i, im in sources.items()], (0, upper, width, lower)))
+
+            # covers ending in this band are not needed anymore
+            for i in [i for i in sources if tiles[i][1][3] <= lower]:
+                del sources[i]
+    return file_name
@@ -0,0 +1,233 @@
+"""
+Opt-in timing and peak memory of the named stages of the visualization pipeline
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+# profiler recording the stages, None when profiling is disabled
+_profiler = None
+
+class _NoStage():
+    # no-op context manager (contextlib.nullcontext needs Python 3.7)
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+# stage returned while profiling is disabled
+_NO_STAGE = _NoStage()
+
+# nanosecond clock (time.perf_counter_ns needs Python 3.7)
+_clock_ns = getattr(time, 'perf_counter_ns', lambda: int(time.perf_counter() * 1e9))
+
+
+def stage(name):
+    """
+    Context manager timing a stage of the pipeline, e.g.
+
+    >>> with stage('tags.parse'):
+    >>>     ...
+
+    While no Profiler is active it returns a shared no-op context manager.
+
+    Parameters
+    ----------
+
+    name : Name of the stage
+    """
+    if _profiler is None:
+        return _NO_STAGE
+    return _profiler.stage(name)
+
+
+def profiled(name):
+    """
+    Decorator timing every call of a function as a stage.
+
+    Parameters
+    ----------
+
+    name : Name of the stage
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Profiler():
+    def __init__(self, memory=True):
+        """
+        Recorder of the stages run while it is active. Each stage is recorded with
+        its start, duration, thread and, with memory=True, the peak of the memory
+        allocated during the stage above the memory allocated at its start. Memory
+        is traced with tracemalloc, so it covers Python objects and numpy and pandas
+        arrays but not the buffers of native libraries (e.g. PIL images), and slows
+        allocations down while the profiler is active. Peaks of stages running in
+        several threads at once are approximate.
+
+        Parameters
+        ----------
+
+        memory : If True, record the peak memory of the stages
+
+
+        Examples
+        ----------
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.profiling import Profiler
+        >>>
+        >>> with Profiler() as profiler:
+        >>>     vis.tag_graph(file_name='images/tag_graph.svg')
+        >>> print(profiler.summary())
+        >>> profiler.save_trace('tag_graph_trace.json')  # open in chrome://tracing or Perfetto
+
+        """
+        self.memory = memory
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_tracing = False
+        self.origin = None
+        # memory untracked by the restarts of tracemalloc (see _reset_peak)
+        self.base = 0
+
+
+    def __enter__(self):
+        global _profiler
+        assert _profiler is None, "another Profiler is already active."
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.origin = _clock_ns()
+        _profiler = self
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _profiler
+        _profiler = None
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager recording a stage (see the stage function).
+        """
+        stack = self.local.__dict__.setdefault('stack', [])
+        if self.memory:
+            current, peak = self._traced_memory()
+            if len(stack) > 0:
+                stack[-1][1] = max(stack[-1][1], peak)
+            current = self._reset_peak()
+            frame = [current, current]
+        else:
+            frame = [0, 0]
+        stack.append(frame)
+        start = _clock_ns()
+        try:
+            yield
+        finally:
+            end = _clock_ns()
+            stack.pop()
+            if self.memory:
+                frame[1] = max(frame[1], self._traced_memory()[1])
+                if len(stack) > 0:
+                    stack[-1][1] = max(stack[-1][1], frame[1])
+            with self.lock:
+                self.events.append((name, threading.get_ident(), start - self.origin, end - start,
+                                    frame[1] - frame[0], len(stack)))
+
+
+    def _traced_memory(self):
+        # current and peak memory, including the memory untracked by restarts
+        current, peak = tracemalloc.get_traced_memory()
+        return self.base + current, self.base + peak
+
+
+    def _reset_peak(self):
+        # tracemalloc.reset_peak needs Python 3.9, before it the tracing is restarted,
+        # which also resets the peak but forgets the blocks allocated so far: they are
+        # counted in self.base from then on (so their later release is not seen)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            with self.lock:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                tracemalloc.start()
+                self.base += current
+        return self._traced_memory()[0]
+
+
+    def trace_events(self):
+        """
+        Stages as Chrome trace events (complete events, times in microseconds).
+
+        Returns
+        ----------
+
+        List of dictionaries
+        """
+        pid = os.getpid()
+        events = []
+        for name, thread, start, duration, peak, depth in self.events:
+            event = {'name': name, 'cat': 'metalhistory', 'ph': 'X', 'pid': pid, 'tid': thread,
+                     'ts': start / 1000, 'dur': duration / 1000, 'args': {'depth': depth}}
+            if self.memory:
+                event['args']['peak_bytes'] = peak
+            events.append(event)
+        return events
+
+
+    def save_trace(self, file_name):
+        """
+        Save the stages in the Chrome trace event format, which can be opened in
+        chrome://tracing or https://ui.perfetto.dev.
+
+        Parameters
+        ----------
+
+        file_name : Name of the output json file
+        """
+        with open(file_name, 'w') as file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, file)
+
+
+    def summary(self):
+        """
+        Flat table of the stages.
+
+        Returns
+        ----------
+
+        DataFrame indexed by stage, with the number of calls, the total, mean and max
+        seconds and the max peak memory in bytes, sorted by decreasing total time
+        """
+        import pandas as pd
+
+        df = pd.DataFrame([(name, duration / 1e9, peak) for name, _, _, duration, peak, _ in self.events],
+                          columns=['stage', 'seconds', 'peak_bytes'])
+        table = df.groupby('stage').agg(calls=('seconds', 'size'), total_s=('seconds', 'sum'),
+                                        mean_s=('seconds', 'mean'), max_s=('seconds', 'max'),
+                                        peak_bytes=('peak_bytes', 'max'))
+        if not self.memory:
+            table = table.drop(columns=['peak_bytes'])
+        return table.sort_values('total_s', ascending=False)
@@ -0,0 +1,332 @@
+"""
+Content-addressed cache of rendered charts, keyed by chart parameters and dataset content
+"""
+
+import collections
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'metalhistory', 'renders')
+
+# bump to invalidate all cached renders when the charts change
+RENDER_CACHE_VERSION = 1
+
+# fingerprints of dataset files, by (path, size, modification time)
+_file_fingerprints = {}
+
+
+def dataset_fingerprint(dataset):
+    """
+    Hash of the content of a dataset.
+
+    Parameters
+    ----------
+
+    dataset : Name of a csv file, pickle file or directory of pickle parts, pandas dataframe or SharedDataset
+
+    Returns
+    ----------
+
+    Hex digest string
+    """
+    if hasattr(dataset, 'fingerprint'):
+        # shared datasets are hashed once when they are published
+        return dataset.fingerprint
+    if isinstance(dataset, pd.DataFrame):
+        h = hashlib.sha1()
+        h.update(repr(list(dataset.columns)).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(dataset, index=True).to_numpy().tobytes())
+        return h.hexdigest()
+
+    path = os.path.abspath(dataset)
+    if os.path.isdir(path):
+        h = hashlib.sha1()
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode('utf-8'))
+            h.update(dataset_fingerprint(os.path.join(path, name)).encode('utf-8'))
+        return h.hexdigest()
+    stat = os.stat(path)
+    file_key = (path, stat.st_size, stat.st_mtime_ns)
+    if file_key not in _file_fingerprints:
+        h = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                h.update(block)
+        _file_fingerprints[file_key] = h.hexdigest()
+    return _file_fingerprints[file_key]
+
+
+class RenderCache():
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=256 * 2**20):
+        """
+        Disk cache of rendered charts. A chart is stored under the hash of the
+        function name, its parameters and the content of the dataset, so it is
+        rendered again only when one of them changes. When the cache grows larger
+        than max_bytes, the least recently used charts are evicted.
+
+        Parameters
+        ----------
+
+        cache_dir : Directory of the cache
+
+        max_bytes : Size cap of the cache in bytes
+
+
+        Examples
+        ----------
+        The second call copies the cached chart instead of rendering it:
+
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.render_cache import RenderCache
+        >>>
+        >>> cache = RenderCache()
+        >>> vis.tag_graph(n_tags=12, file_name='images/tag_graph.svg', render_cache=cache)
+        >>> vis.tag_graph(n_tags=12, file_name='images/tag_graph.svg', render_cache=cache)
+
+        """
+        assert isinstance(cache_dir, str), "'cache_dir' must be of type str."
+        assert isinstance(max_bytes, int) and max_bytes > 0, "'max_bytes' must be an int larger than 0."
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        # entries in least recently used order, with their size on disk
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self._scan()
+
+
+    def key(self, function_name, params, dataset):
+        """
+        Cache key of a chart.
+
+        Parameters
+        ----------
+
+        function_name : Name of the chart function
+
+        params : Dictionary of the parameters of the chart, except dataset and output
+
+        dataset : Name of the input csv file or pandas dataframe
+
+        Returns
+        ----------
+
+        Hex digest string
+        """
+        description = '%d\n%s\n%s\n%s' % (RENDER_CACHE_VERSION, function_name,
+                                           repr(sorted(params.items())), dataset_fingerprint(dataset))
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+    def fetch(self, key, output):
+        """
+        Copy a cached chart to an output file.
+
+        Parameters
+        ----------
+
+        key : Cache key of the chart
+
+        output : Name of the output file
+
+        Returns
+        ----------
+
+        True if the chart was cached, False otherwise
+        """
+        name = key + os.path.splitext(output)[1]
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return False
+            self.entries.move_to_end(name)
+            path = self._path(name)
+            os.utime(path)
+            self.hits += 1
+
+        dir_name = os.path.dirname(output)
+        if dir_name != '' and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        fd, tmp_name = tempfile.mkstemp(suffix='.tmp', dir=dir_name if dir_name != '' else '.')
+        os.close(fd)
+        shutil.copyfile(path, tmp_name)
+        os.replace(tmp_name, output)
+        return True
+
+
+    def put(self, key, output, result=None):
+        """
+        Store a rendered chart, then evict charts beyond the size cap.
+
+        Parameters
+        ----------
+
+        key : Cache key of the chart
+
+        output : Name of the rendered file
+
+        result : Data returned with the chart, stored next to it (or None)
+        """
+        self._store(key + os.path.splitext(output)[1], lambda tmp_name: shutil.copyfile(output, tmp_name))
+        if result is not None:
+            self._store(key + '.pkl', lambda tmp_name: _dump(result, tmp_name))
+
+
+    def load_result(self, key):
+        """
+        Data stored with a chart.
+
+        Parameters
+        ----------
+
+        key : Cache key of the chart
+
+        Returns
+        ----------
+
+        The result passed to put, or None if there is none
+        """
+        name = key + '.pkl'
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+            path = self._path(name)
+            os.utime(path)
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+    def clear(self):
+        """
+        Remove all charts from the cache.
+        """
+        with self.lock:
+            for name in self.entries:
+                os.remove(self._path(name))
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name[:2], name)
+
+
+    def _store(self, name, write):
+        # write to a temporary file first, so that readers never see a partial entry
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        os.close(fd)
+        write(tmp_name)
+
+        with self.lock:
+            os.replace(tmp_name, path)
+            if name in self.entries:
+                self.total_bytes -= self.entries.pop(name)
+            self.entries[name] = os.path.getsize(path)
+            self.total_bytes += self.entries[name]
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_name, size = self.entries.popitem(last=False)
+                os.remove(self._path(old_name))
+                self.total_bytes -= size
+
+
+    def _scan(self):
+        # rebuild the LRU order from the modification times of the cached charts
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                if name.endswith('.tmp'):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime_ns, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+
+
+def _dump(data, file_name):
+    with open(file_name, 'wb') as file:
+        pickle.dump(data, file)
+
+
+def cached_render(output_argument, default_dataset, ignore=(), fingerprints=None, store_result=None, hit_result=None):
+    """
+    Decorator adding a render_cache argument to a chart function. With a
+    RenderCache, the chart is looked up by the function name, its parameters and
+    the content of the dataset: on a hit the cached file is copied to the output
+    and hit_result is returned without rendering, on a miss the chart is rendered and stored.
+
+    Parameters
+    ----------
+
+    output_argument : Name of the argument of the output file
+
+    default_dataset : Dataset used by the function when its dataset argument is None
+
+    ignore : Names of the arguments that do not change the output (e.g. numbers of workers)
+
+    fingerprints : Dictionary of functions by argument name, computing from the parameters the
+                   value keying an argument whose state changes the output (e.g. a renderer)
+
+    store_result : Function computing from the result of the function the data stored with
+                   the chart (or None to store nothing)
+
+    hit_result : Value returned on a hit or, with store_result, function computing it from
+                 the stored data (e.g. the data frame of a chart returning a figure and data)
+    """
+    fingerprints = {} if fingerprints is None else fingerprints
+
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, render_cache=None, **kwargs):
+            if render_cache is None:
+                return function(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            output = params.pop(output_argument)
+            dataset = params.pop('dataset')
+            if output is None:
+                return function(*args, **kwargs)
+            for name, fingerprint in fingerprints.items():
+                params[name] = fingerprint(params)
+            for name in ignore:
+                params.pop(name, None)
+
+            key = render_cache.key(function.__name__, params, default_dataset if dataset is None else dataset)
+            if render_cache.fetch(key, output):
+                if store_result is None:
+                    return hit_result
+                stored = render_cache.load_result(key)
+                if stored is not None:
+                    return hit_result(stored)
+                # the stored data was evicted, the chart is rendered again
+            result = function(*args, **kwargs)
+            render_cache.put(key, output, None if store_result is None else store_result(result))
+            return result
+        return wrapper
+    return decorator
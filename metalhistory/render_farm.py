@@ -0,0 +1,148 @@
+"""
+Batch rendering of many charts across a pool of processes
+"""
+
+import os
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+from . import visualization_api as vis
+
+
+# chart functions that can be rendered in batch, with the name of their output file argument
+CHARTS = {
+    'artist_barplot': 'file_name',
+    'artist_cloud': 'file_name',
+    'tag_graph': 'file_name',
+    'album_covers': 'image_name',
+}
+
+# dataset of the worker processes, loaded once per pool
+_worker_dataset = None
+
+
+class ChartSpec():
+    def __init__(self, chart, output, **params):
+        """
+        Specification of a chart to render.
+
+        Parameters
+        ----------
+
+        chart : Name of the visualization_api function [artist_barplot, artist_cloud, tag_graph, album_covers]
+
+        output : Name of the output file
+
+        params : Other arguments of the function, except the dataset
+
+
+        Examples
+        ----------
+        >>> from metalhistory.render_farm import ChartSpec
+        >>>
+        >>> spec = ChartSpec('artist_barplot', 'images/bar_playcount.svg', metric='playcount', min_albums=3)
+
+        """
+        assert chart in CHARTS, "'chart' must be one of %s." % list(CHARTS.keys())
+        assert isinstance(output, str), "'output' must be of type str."
+        assert 'dataset' not in params, "the dataset is given to render_batch, not to the specs."
+
+        self.chart = chart
+        self.output = output
+        self.params = params
+
+
+    def __repr__(self):
+        return 'ChartSpec(%r, %r, %s)' % (self.chart, self.output,
+                                         ', '.join('%s=%r' % item for item in self.params.items()))
+
+
+def render_batch(specs, dataset=None, n_workers=None, shared=False):
+    """
+    Render a list of charts. The dataset is loaded once and shared by a pool of
+    processes (inherited without copy where processes are forked), which render
+    the charts in parallel. Every output is written to a temporary file and moved
+    in place once complete, so no partial file is ever visible.
+
+    Parameters
+    ----------
+
+    specs : List of ChartSpec
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    n_workers : Number of processes (None for the number of cores, 1 to render in this process)
+
+    shared : If True, publish the dataset in shared memory (see SharedDataset), so that
+             workers attach to it without copy even where processes are not forked
+
+    Returns
+    ----------
+
+    DataFrame with the chart, output, status ('ok' or the error) and rendering
+    time in seconds of every spec, in the order of the specs
+
+
+    Examples
+    ----------
+    Bar plots of every metric for several album thresholds:
+
+    >>> from metalhistory.render_farm import ChartSpec, render_batch
+    >>>
+    >>> specs = [ChartSpec('artist_barplot', 'images/bar_%s_%d.svg' % (metric, n), metric=metric, min_albums=n)
+    >>>          for metric in ['listeners', 'playcount', 'MA_score'] for n in [3, 5, 8]]
+    >>> render_batch(specs)
+
+    """
+    assert all(isinstance(spec, ChartSpec) for spec in specs), "'specs' must be a list of ChartSpec."
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    assert isinstance(n_workers, int) and n_workers > 0, "'n_workers' must be None or an int larger than 0."
+
+    df = vis.load_data(dataset)
+    if shared:
+        # shared memory needs Python 3.8, it is only imported when used
+        from .shared_dataset import SharedDataset
+        df = SharedDataset.publish(df)
+    results = [None] * len(specs)
+    try:
+        if n_workers == 1 or len(specs) <= 1:
+            _init_worker(df)
+            for i, spec in enumerate(specs):
+                results[i] = _render_spec(spec)
+        else:
+            # Pool rather than ProcessPoolExecutor, whose initializer needs Python 3.7
+            with Pool(min(n_workers, len(specs)), initializer=_init_worker, initargs=(df,)) as pool:
+                results = pool.map(_render_spec, specs, chunksize=1)
+    finally:
+        _init_worker(None)
+        if shared:
+            df.unlink()
+
+    return pd.DataFrame(results, columns=['chart', 'output', 'status', 'seconds'])
+
+
+def _init_worker(df):
+    global _worker_dataset
+    _worker_dataset = df
+
+
+def _render_spec(spec):
+    # render into a temporary file with the same extension, so that the format is kept
+    root, extension = os.path.splitext(spec.output)
+    tmp_name = '%s.tmp-%d%s' % (root, os.getpid(), extension)
+    params = dict(spec.params)
+    params[CHARTS[spec.chart]] = tmp_name
+
+    start = time.perf_counter()
+    try:
+        getattr(vis, spec.chart)(dataset=_worker_dataset, **params)
+        os.replace(tmp_name, spec.output)
+        status = 'ok'
+    except Exception as e:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        status = '%s: %s' % (type(e).__name__, e)
+    return spec.chart, spec.output, status, time.perf_counter() - start
@@ -0,0 +1,267 @@
+"""
+Album dataset published once in shared memory and attached by worker processes without copy
+"""
+
+import ast
+import hashlib
+import pickle
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    raise ImportError("metalhistory.shared_dataset requires Python 3.8 or later (multiprocessing.shared_memory)")
+
+import numpy as np
+import pandas as pd
+
+
+# alignment in bytes of the arrays in the shared memory block
+ALIGNMENT = 8
+
+# shared memory blocks attached by this process, by name
+_attached = {}
+
+
+class SharedDataset():
+    def __init__(self, name, manifest):
+        """
+        Handle of a dataset published in shared memory (see SharedDataset.publish).
+        The handle only holds the name of the shared memory block and the layout of
+        the arrays in it, so it is cheap to pickle and send to worker processes,
+        which give it to load_data (or call to_frame) to attach to the data.
+
+        Parameters
+        ----------
+
+        name : Name of the shared memory block
+
+        manifest : Layout of the columns, dictionaries and tag arrays in the block
+
+
+        Examples
+        ----------
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.shared_dataset import SharedDataset
+        >>>
+        >>> with SharedDataset.publish(vis.load_data(None)) as shared:
+        >>>     # in any process that received the handle
+        >>>     df = vis.load_data(shared)
+
+        """
+        self.name = name
+        self.manifest = manifest
+        self.fingerprint = manifest['fingerprint']
+        self.owner = None
+
+
+    @classmethod
+    def publish(cls, df):
+        """
+        Publish a dataset in a new shared memory block. The dataset is first
+        compacted (see compact_dataset): numeric columns are stored as arrays,
+        text columns as integer codes into string dictionaries, and the tags of
+        every album as an array of tag codes with offsets.
+
+        The publishing process owns the block and frees it with unlink (or when
+        leaving the with block of the handle).
+
+        Parameters
+        ----------
+
+        df : Processed album dataframe
+
+        Returns
+        ----------
+
+        SharedDataset handle
+        """
+        from .visualization_api import compact_dataset
+
+        df = compact_dataset(df)
+        arrays = []
+        manifest = {'columns': [], 'dictionaries': [], 'index': len(df),
+                    'fingerprint': _frame_fingerprint(df)}
+
+        def add_array(a):
+            arrays.append(np.ascontiguousarray(a))
+            return len(arrays) - 1
+
+        def add_dictionary(strings):
+            blob = [s.encode('utf-8') for s in strings]
+            offsets = np.cumsum([0] + [len(b) for b in blob], dtype=np.int64)
+            manifest['dictionaries'].append((add_array(np.frombuffer(b''.join(blob), dtype=np.uint8)),
+                                             add_array(offsets)))
+            return len(manifest['dictionaries']) - 1
+
+        # columns sharing a categorical dtype share one dictionary
+        dictionaries = {}
+        for column in df.columns:
+            values = df[column]
+            if values.dtype == object:
+                values = values.astype('category')
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                key = id(values.dtype.categories)
+                if key not in dictionaries:
+                    dictionaries[key] = add_dictionary([str(c) for c in values.dtype.categories])
+                manifest['columns'].append((column, 'categorical', add_array(values.cat.codes.to_numpy()),
+                                            dictionaries[key]))
+            elif isinstance(values.array, pd.arrays.IntegerArray):
+                manifest['columns'].append((column, 'nullable', add_array(values.array._data),
+                                            add_array(values.array._mask)))
+            else:
+                manifest['columns'].append((column, 'numeric', add_array(values.to_numpy()), None))
+
+        # tags of every album as codes into the tag dictionary
+        if 'tags' in df.columns:
+            tag_lists = [ast.literal_eval(t) if isinstance(t, str) else [] for t in df['tags']]
+            tag_names = sorted(set(tag for tags in tag_lists for tag in tags))
+            codes = {tag: i for i, tag in enumerate(tag_names)}
+            manifest['tags'] = (add_array(np.array([codes[t] for tags in tag_lists for t in tags], dtype=np.int32)),
+                                add_array(np.cumsum([0] + [len(tags) for tags in tag_lists], dtype=np.int64)),
+                                add_dictionary(tag_names))
+
+        # lay the arrays out in one block
+        layout = []
+        size = 0
+        for a in arrays:
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            layout.append((size, a.dtype.str, a.shape))
+            size += a.nbytes
+        manifest['arrays'] = layout
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        for (offset, _, _), a in zip(layout, arrays):
+            shm.buf[offset:offset + a.nbytes] = a.tobytes()
+
+        handle = cls(shm.name, manifest)
+        handle.owner = shm
+        _attached[shm.name] = (shm, None)
+        return handle
+
+
+    def array(self, i):
+        """
+        Read-only view of an array of the block.
+        """
+        shm = self._attach()
+        offset, dtype, shape = self.manifest['arrays'][i]
+        a = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        a.flags.writeable = False
+        return a
+
+
+    def dictionary(self, i):
+        """
+        List of the strings of a dictionary of the block.
+        """
+        blob, offsets = self.manifest['dictionaries'][i]
+        blob = self.array(blob).tobytes()
+        offsets = self.array(offsets)
+        return [blob[offsets[j]:offsets[j + 1]].decode('utf-8') for j in range(len(offsets) - 1)]
+
+
+    def to_frame(self):
+        """
+        Dataframe of the shared dataset. Numeric columns and the codes of text
+        columns are read-only views of the shared memory; only the string
+        dictionaries are decoded in this process. The dataframe is built once per
+        process and reused.
+
+        Returns
+        ----------
+
+        Compact dataframe (see compact_dataset)
+        """
+        shm, df = _attached.get(self.name, (None, None))
+        if df is not None:
+            return df
+
+        columns = {}
+        dtypes = {}
+        for column, kind, a, b in self.manifest['columns']:
+            if kind == 'categorical':
+                if b not in dtypes:
+                    dtypes[b] = pd.CategoricalDtype(self.dictionary(b))
+                columns[column] = pd.Categorical.from_codes(self.array(a), dtype=dtypes[b])
+            elif kind == 'nullable':
+                columns[column] = pd.arrays.IntegerArray(self.array(a), self.array(b), copy=False)
+            else:
+                columns[column] = self.array(a)
+        df = pd.DataFrame(columns, index=pd.RangeIndex(self.manifest['index']), copy=False)
+        _attached[self.name] = (self._attach(), df)
+        return df
+
+
+    def tag_lists(self):
+        """
+        Encoded tags of the albums: the tags of album i are
+        names[codes[offsets[i]:offsets[i + 1]]].
+
+        Returns
+        ----------
+
+        (codes, offsets, names) tuple, codes and offsets being read-only arrays
+        """
+        assert 'tags' in self.manifest, "the dataset has no tags."
+        codes, offsets, names = self.manifest['tags']
+        return self.array(codes), self.array(offsets), self.dictionary(names)
+
+
+    def close(self):
+        """
+        Detach this process from the block (frames returned by to_frame must not be used anymore).
+        """
+        shm, _ = _attached.pop(self.name, (None, None))
+        if shm is not None and shm is not self.owner:
+            _close(shm)
+
+
+    def unlink(self):
+        """
+        Free the block. Only the publishing process can do it.
+        """
+        assert self.owner is not None, "only the publishing process can unlink the dataset."
+        _attached.pop(self.name, None)
+        _close(self.owner)
+        self.owner.unlink()
+        self.owner = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.owner is not None:
+            self.unlink()
+        else:
+            self.close()
+
+
+    def __getstate__(self):
+        return {'name': self.name, 'manifest': self.manifest}
+
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['manifest'])
+
+
+    def _attach(self):
+        if self.name not in _attached:
+            _attached[self.name] = (shared_memory.SharedMemory(name=self.name), None)
+        return _attached[self.name][0]
+
+
+def _close(shm):
+    # arrays of frames still referenced keep the buffer exported, the mapping is
+    # then released when they are garbage collected
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+def _frame_fingerprint(df):
+    h = hashlib.sha1()
+    h.update(pickle.dumps([(c, str(df[c].dtype)) for c in df.columns]))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
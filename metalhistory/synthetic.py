@@ -0,0 +1,378 @@
+"""
+Seeded generator of synthetic album datasets with the schema of the processed dataset
+"""
+
+import os
+import shutil
+import urllib.parse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+# columns of the processed dataset, in order
+COLUMNS = ['artist', 'album', '0', 'ignored tags', 'image', 'listeners', 'mbid', 'playcount',
+           'release-date', 'tags', 'url', 'MA_score', 'MA_artist', 'MA_album']
+
+# albums are generated in blocks of this many rows, so the output of a seed does not
+# depend on the chunk size
+BLOCK_SIZE = 65536
+
+# share of albums LastFM knows nothing about
+MISSING_INFO_RATE = 0.09
+
+# albums per artist follow a Zipf law with this exponent
+ALBUMS_PER_ARTIST_EXPONENT = 2.0
+MAX_ALBUMS_PER_ARTIST = 60
+
+# tags follow a Zipf law over their popularity rank with this exponent
+TAG_EXPONENT = 1.1
+# probabilities of 0..5 accepted tags and of 0..5 ignored tags per album
+TAG_COUNT_PROBABILITIES = [0.03, 0.27, 0.38, 0.245, 0.072, 0.003]
+IGNORED_COUNT_PROBABILITIES = [0.003, 0.075, 0.25, 0.385, 0.265, 0.022]
+# probability that a tag of an album comes from the genre family of its artist
+FAMILY_PROBABILITY = 0.7
+
+# MA scores are 9 plus a log-normal value with median 3
+MA_SCORE_SIGMA = 0.8
+
+# playcounts: median, tail exponent of the Pareto popularity of the artists (so playcounts
+# have a power-law tail) and log-normal spread between the albums of an artist
+PLAYCOUNT_MEDIAN = 1.46e6
+ARTIST_TAIL_EXPONENT = 2.0
+ALBUM_SIGMA = 0.6
+# playcount per listener, log-normal
+PLAYS_PER_LISTENER = 20.7
+PLAYS_PER_LISTENER_SIGMA = 0.35
+
+# most popular tags of the Metal Archives top albums, the other accepted tags follow
+POPULAR_TAGS = ['death metal', 'heavy metal', 'thrash metal', 'black metal', 'progressive metal', 'power metal',
+                'technical death metal', 'melodic death metal', 'speed metal', 'doom metal',
+                'progressive death metal', 'symphonic metal', 'atmospheric black metal', 'folk metal',
+                'gothic metal', 'viking metal', 'grindcore', 'symphonic black metal', 'metalcore', 'pagan metal']
+# words grouping tags into genre families
+FAMILY_WORDS = ['black', 'death', 'thrash', 'doom', 'power', 'progressive', 'folk', 'symphonic', 'core',
+                'gothic', 'heavy', 'speed', 'sludge', 'stoner', 'grind', 'nu', 'industrial']
+IGNORED_TAGS = ['albums i own', 'metal', 'hard rock', 'seen live', 'favorite albums', 'rock', 'classic rock',
+                'progressive rock', 'nwobhm', '80s', '90s', 'old school death metal', 'brutal death metal',
+                'norwegian black metal', 'melodic black metal', 'groove metal', 'awesome', 'female vocalists']
+
+ARTIST_WORDS = (['Black', 'Grave', 'Iron', 'Dark', 'Frozen', 'Blood', 'Dead', 'Burning', 'Cursed', 'Eternal',
+                 'Night', 'Storm', 'Death', 'Shadow', 'Hell', 'Funeral', 'Void', 'Savage', 'Unholy', 'Silent'],
+                ['Altar', 'Throne', 'Crypt', 'Legion', 'Sabbath', 'Serpent', 'Tomb', 'Wolf', 'Maiden', 'Priest',
+                 'Oath', 'Reaper', 'Temple', 'Horde', 'Winter', 'Abyss', 'Forge', 'Citadel', 'Raven', 'Plague'])
+ALBUM_WORDS = (['Reign', 'Master', 'Ride', 'Heaven', 'Kingdom', 'Symphony', 'Rust', 'Lord', 'Song', 'Dawn',
+                'Hymns', 'Blessing', 'Ashes', 'Chaos', 'Wings', 'Mirror', 'Spirit', 'Night', 'Fire', 'Tears'],
+               ['in Blood', 'of Puppets', 'the Lightning', 'and Hell', 'of Darkness', 'of Destruction',
+                'in Peace', 'of the Flies', 'from the Abyss', 'of the Wolf', 'in Chains', 'of Steel',
+                'under the Moon', 'of Time', 'beyond Death', 'of the Storm', 'in Ruins', 'of Sorrow',
+                'of the North', 'of Fire'])
+
+IMAGE_URL = 'https://lastfm.freetls.fastly.net/i/u/{size}/{image_id}.png'
+IMAGE_SIZES = [('34s', 'small'), ('64s', 'medium'), ('174s', 'large'), ('300x300', 'extralarge'),
+               ('300x300', 'mega'), ('300x300', '')]
+
+
+def tag_vocabulary():
+    """
+    Accepted tags (see config.yaml) by decreasing popularity.
+    """
+    with open(os.path.join(os.path.dirname(__file__), 'config.yaml')) as file:
+        accepted = [t.strip().lower() for t in yaml.safe_load(file)['user settings']['accepted tags']]
+    return POPULAR_TAGS + sorted(set(accepted) - set(POPULAR_TAGS))
+
+
+def generate_albums(n_albums, seed=0, chunksize=100000):
+    """
+    Generate a synthetic processed dataset chunk by chunk. Artists have a Zipfian
+    number of albums and a Pareto popularity, so playcounts and listeners have
+    power-law tails and are correlated within artists (and with the MA score).
+    Titles repeated within the albums of an artist get a number suffix, so that
+    (artist, album) pairs are unique.
+    Each artist plays in a genre family: album tags are drawn from a Zipfian tag
+    vocabulary, mostly within the family, so tags cooccur like real genres do.
+
+    Parameters
+    ----------
+
+    n_albums : Number of albums
+
+    seed : Seed of the generator, the same seed always gives the same albums
+
+    chunksize : Number of albums per chunk
+
+    Returns
+    ----------
+
+    Iterator over DataFrames with the columns of the processed dataset
+
+
+    Examples
+    ----------
+    >>> from metalhistory.synthetic import generate_albums
+    >>>
+    >>> df = next(generate_albums(10000, seed=1, chunksize=10000))
+
+    """
+    assert isinstance(n_albums, int) and n_albums >= 0, "'n_albums' must be an int larger or equal to 0."
+    assert isinstance(chunksize, int) and chunksize > 0, "'chunksize' must be an int larger than 0."
+
+    generator = _BlockGenerator(seed)
+    pending = []
+    n_pending = 0
+    remaining = n_albums
+    while remaining > 0:
+        # blocks are generated whole and cut into chunks
+        while n_pending < min(chunksize, remaining):
+            block = generator.block()
+            pending.append(block)
+            n_pending += len(block)
+        chunk = pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+        size = min(chunksize, remaining)
+        yield chunk.iloc[:size].reset_index(drop=True)
+        pending = [chunk.iloc[size:]]
+        n_pending -= size
+        remaining -= size
+
+
+def write_dataset(path, n_albums, seed=0, chunksize=100000, progress=None):
+    """
+    Generate a synthetic dataset and stream it to disk, so that memory is bounded
+    by the chunk size. A path ending with .csv is written as one csv file (as read
+    by load_data), any other path as a directory of pickled chunks, which
+    load_data and iter_chunks read without parsing text.
+
+    Parameters
+    ----------
+
+    path : Name of the csv file or of the directory
+
+    n_albums : Number of albums
+
+    seed : Seed of the generator
+
+    chunksize : Number of albums generated and written at once
+
+    progress : Function called with the number of albums written after each chunk (or None)
+    """
+    assert isinstance(path, str), "'path' must be of type str."
+
+    as_csv = path.endswith('.csv')
+    tmp_path = path + '.tmp'
+    if as_csv:
+        file = open(tmp_path, 'w', newline='')
+    else:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+    try:
+        written = 0
+        for i, chunk in enumerate(generate_albums(n_albums, seed, chunksize)):
+            if as_csv:
+                chunk.to_csv(file, header=i == 0, index=False)
+            else:
+                chunk.to_pickle(os.path.join(tmp_path, 'part-%05d.pkl' % i))
+            written += len(chunk)
+            if progress is not None:
+                progress(written)
+    finally:
+        if as_csv:
+            file.close()
+
+    # the dataset only appears once complete
+    if not as_csv and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+class _BlockGenerator():
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.tags = np.array(tag_vocabulary(), dtype=object)
+        weights = 1 / np.arange(1, len(self.tags) + 1) ** TAG_EXPONENT
+        self.tag_p = weights / weights.sum()
+
+        # tags of every genre family, most popular first
+        families = [next((w for w in FAMILY_WORDS if w in tag), 'other') for tag in self.tags]
+        self.family_of = np.array([sorted(set(families)).index(f) for f in families])
+        self.family_tags = []
+        for family in range(self.family_of.max() + 1):
+            members = np.flatnonzero(self.family_of == family)
+            p = self.tag_p[members]
+            self.family_tags.append((members, np.cumsum(p / p.sum())))
+
+        self.n_artists = 0
+        # artist whose albums continue in the next block: (id, albums left, popularity, primary tag)
+        self.carry = None
+        # counts of the album titles of that artist in the previous blocks
+        self.carry_titles = Counter()
+
+    def block(self):
+        rng = self.rng
+        n = BLOCK_SIZE
+
+        # artists of the block
+        artists, sizes, popularity, primary = [], [], [], []
+        if self.carry is not None:
+            for values, value in zip([artists, sizes, popularity, primary], self.carry):
+                values.append(value)
+        total = sum(sizes)
+        while total < n:
+            m = max(1, (n - total) // 2)
+            new_sizes = np.minimum(rng.zipf(ALBUMS_PER_ARTIST_EXPONENT, m), MAX_ALBUMS_PER_ARTIST)
+            artists.extend(range(self.n_artists, self.n_artists + m))
+            sizes.extend(new_sizes.tolist())
+            # log of a Pareto popularity with median 1
+            popularity.extend((np.log1p(rng.pareto(ARTIST_TAIL_EXPONENT, m)) - np.log(2) / ARTIST_TAIL_EXPONENT).tolist())
+            primary.extend(rng.choice(len(self.tags), m, p=self.tag_p).tolist())
+            self.n_artists += m
+            total += int(new_sizes.sum())
+        sizes = np.array(sizes)
+        owner = np.repeat(np.arange(len(artists)), sizes)[:n]
+        # the artist of the last album continues in the next block, the following ones are dropped
+        last = owner[-1]
+        left = int(sizes[:last + 1].sum()) - n
+        carried = self.carry is not None
+        self.carry = None if left == 0 else (artists[last], left, popularity[last], primary[last])
+        artist_ids = np.array(artists)[owner]
+        artist_popularity = np.array(popularity)[owner]
+        artist_primary = np.array(primary)[owner]
+
+        # metrics: MA score and playcount share a latent album quality
+        quality = rng.normal(0, 1, n)
+        ma_score = np.round(9 + np.exp(np.log(3) + MA_SCORE_SIGMA * quality), 2)
+        log_plays = (np.log(PLAYCOUNT_MEDIAN) + artist_popularity
+                     + ALBUM_SIGMA * (0.5 * quality + 0.87 * rng.normal(0, 1, n)))
+        playcount = np.round(np.exp(log_plays))
+        listeners = np.round(playcount / np.exp(np.log(PLAYS_PER_LISTENER) + PLAYS_PER_LISTENER_SIGMA * rng.normal(0, 1, n)))
+        listeners = np.maximum(listeners, 1)
+
+        artist_names = [_artist_name(i) for i in artist_ids]
+        album_names = self._album_names(owner, carried, last, left > 0)
+        years = np.clip(np.round(rng.normal(1998, 11, n)), 1968, 2021).astype(int)
+
+        tags = self._tags(artist_primary)
+        ignored = self._ignored_tags(years)
+        image_ids = _random_hex(rng, n)
+        mbids = ['%s-%s-4%s-8%s-%s' % (h[:8], h[8:12], h[13:16], h[17:20], h[20:]) for h in _random_hex(rng, n)]
+        dates = self._release_dates(years)
+
+        df = pd.DataFrame({
+            'artist': artist_names,
+            'album': album_names,
+            '0': np.full(n, np.nan, dtype=np.float64),
+            'ignored tags': [str(t) for t in ignored],
+            'image': [_image_list(i) for i in image_ids],
+            'listeners': listeners,
+            'mbid': mbids,
+            'playcount': playcount,
+            'release-date': dates,
+            'tags': [str(t) for t in tags],
+            'url': ['https://www.last.fm/music/%s/%s' % (urllib.parse.quote_plus(a), urllib.parse.quote_plus(b))
+                    for a, b in zip(artist_names, album_names)],
+            'MA_score': ma_score,
+            'MA_artist': artist_names,
+            'MA_album': album_names,
+        }, columns=COLUMNS)
+
+        # albums unknown to LastFM only keep their Metal Archives columns
+        missing = rng.random(n) < MISSING_INFO_RATE
+        lastfm_columns = [c for c in COLUMNS if c not in ['MA_score', 'MA_artist', 'MA_album']]
+        df.loc[missing, lastfm_columns] = np.nan
+        return df
+
+    def _album_names(self, owner, carried, last, carries):
+        rng = self.rng
+        n = len(owner)
+        titles = np.array([ALBUM_WORDS[0][a] + ' ' + ALBUM_WORDS[1][b]
+                           for a, b in zip(rng.integers(0, 20, n), rng.integers(0, 20, n))], dtype=object)
+        # number of earlier albums of the same artist with the same title
+        repeats = pd.Series(titles).groupby([owner, titles]).cumcount().to_numpy()
+        if carried:
+            first = np.flatnonzero(owner == 0)
+            repeats[first] += [self.carry_titles[t] for t in titles[first]]
+
+        titles_of_last = Counter(titles[owner == last])
+        if carried and last == 0:
+            titles_of_last.update(self.carry_titles)
+        self.carry_titles = titles_of_last if carries else Counter()
+        return [t if r == 0 else '%s %d' % (t, r + 1) for t, r in zip(titles, repeats)]
+
+    def _tags(self, primary):
+        rng = self.rng
+        n = len(primary)
+        counts = rng.choice(len(TAG_COUNT_PROBABILITIES), n, p=TAG_COUNT_PROBABILITIES)
+        # candidate tags: the primary tag of the artist, tags of its family and popular tags
+        from_family = rng.random((n, 8)) < FAMILY_PROBABILITY
+        global_tags = rng.choice(len(self.tags), (n, 8), p=self.tag_p)
+        family_draws = rng.random((n, 8))
+        tag_lists = []
+        for i in range(n):
+            members, cumulative = self.family_tags[self.family_of[primary[i]]]
+            chosen = [primary[i]]
+            for j in range(8):
+                if len(chosen) >= counts[i]:
+                    break
+                if from_family[i, j]:
+                    tag = members[min(np.searchsorted(cumulative, family_draws[i, j]), len(members) - 1)]
+                else:
+                    tag = global_tags[i, j]
+                if tag not in chosen:
+                    chosen.append(tag)
+            tag_lists.append([self.tags[t] for t in chosen[:counts[i]]])
+        return tag_lists
+
+    def _ignored_tags(self, years):
+        rng = self.rng
+        n = len(years)
+        counts = rng.choice(len(IGNORED_COUNT_PROBABILITIES), n, p=IGNORED_COUNT_PROBABILITIES)
+        weights = 1 / np.arange(1, len(IGNORED_TAGS) + 1) ** TAG_EXPONENT
+        draws = rng.choice(len(IGNORED_TAGS), (n, 5), p=weights / weights.sum())
+        with_year = rng.random(n) < 0.3
+        tag_lists = []
+        for i in range(n):
+            tags = list(dict.fromkeys(IGNORED_TAGS[t] for t in draws[i, :counts[i]]))
+            if with_year[i] and counts[i] > 0:
+                tags[-1] = str(years[i])
+            tag_lists.append(tags)
+        return tag_lists
+
+    def _release_dates(self, years):
+        rng = self.rng
+        n = len(years)
+        months = rng.integers(1, 13, n)
+        days = rng.integers(1, 29, n)
+        precision = rng.choice(4, n, p=[0.72, 0.05, 0.15, 0.08])
+        dates = []
+        for year, month, day, p in zip(years, months, days, precision):
+            if p == 0:
+                dates.append('%d-%02d-%02d' % (year, month, day))
+            elif p == 1:
+                dates.append('%d-%02d' % (year, month))
+            elif p == 2:
+                dates.append(str(year))
+            else:
+                dates.append(np.nan)
+        return dates
+
+
+def _random_hex(rng, n):
+    # n random 128 bit hex strings
+    digits = rng.bytes(16 * n).hex()
+    return [digits[32 * i:32 * (i + 1)] for i in range(n)]
+
+
+def _artist_name(i):
+    # every artist id has its own name: the words are permuted within each run of 400 ids
+    first, second = ARTIST_WORDS
+    run, k = divmod(int(i), len(first) * len(second))
+    k = k * 163 % (len(first) * len(second))
+    name = first[k % len(first)] + ' ' + second[k // len(first)]
+    return name if run == 0 else '%s %d' % (name, run + 1)
+
+
+def _image_list(image_id):
+    return str([{'#text': IMAGE_URL.format(size=size, image_id=image_id), 'size': name}
+                for size, name in IMAGE_SIZES])
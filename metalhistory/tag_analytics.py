@@ -0,0 +1,477 @@
+"""
+Analytics of the tag network computed on the sparse cooccurrence matrix with numpy:
+normalized PMI, PageRank and eigenvector centrality, label propagation communities
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .profiling import profiled
+
+
+WEIGHTS = ['count', 'npmi']
+
+# communities colored in tag graphs, smaller ones are grey
+COMMUNITY_COLORMAP = 'tab10'
+OTHER_COMMUNITY_COLOR = '#999999'
+CENTRALITY_COLORMAP = 'YlOrRd'
+
+
+class TagMatrix():
+    def __init__(self, tags, occurrences, rows, cols, counts, n_albums):
+        """
+        Sparse symmetric matrix of tag cooccurrences, stored as the coordinates of
+        its upper triangle (rows < cols) with the number of albums carrying both
+        tags. Use from_tag_lists or from_dataset to build it.
+
+        Parameters
+        ----------
+
+        tags : List of the tags, the tag of row i is tags[i]
+
+        occurrences : Number of albums with each tag
+
+        rows, cols : Tag numbers of the cooccurring pairs, with rows < cols
+
+        counts : Number of albums with both tags of each pair
+
+        n_albums : Number of albums with at least one tag
+
+
+        Examples
+        ----------
+        Rank subgenres by influence and group them into scenes:
+
+        >>> from metalhistory.tag_analytics import TagMatrix, tag_table
+        >>>
+        >>> matrix = TagMatrix.from_dataset('data/proc_MA_1k_albums.csv')
+        >>> table = tag_table(matrix)
+        >>> table.groupby('community').head(3)
+
+        """
+        self.tags = list(tags)
+        self.occurrences = np.asarray(occurrences, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.n_albums = n_albums
+
+
+    @classmethod
+    @profiled('analytics.matrix')
+    def from_tag_lists(cls, tag_lists):
+        """
+        Cooccurrence matrix of lists of tags per album.
+
+        Parameters
+        ----------
+
+        tag_lists : List of tags per album (see generate_tag_cooccurrence_list_from_df)
+
+        Returns
+        ----------
+
+        TagMatrix
+        """
+        assert isinstance(tag_lists, list), "'tag_lists' is not of type list."
+        builder = _MatrixBuilder()
+        builder.add(tag_lists)
+        return builder.matrix()
+
+
+    @classmethod
+    @profiled('analytics.matrix')
+    def from_dataset(cls, dataset=None, chunksize=None, tag_query=None):
+        """
+        Cooccurrence matrix of the tags of a dataset.
+
+        Parameters
+        ----------
+
+        dataset : Name of the input csv file or pandas dataframe (or None for the bundled dataset)
+
+        chunksize : If not None, stream the dataset in chunks of this many rows
+
+        tag_query : If not None, only consider the albums matching this TagQuery
+
+        Returns
+        ----------
+
+        TagMatrix
+        """
+        from .tag_index import filter_by_tags
+        from .visualization_api import generate_tag_cooccurrence_list_from_df, iter_chunks, load_tagged
+
+        builder = _MatrixBuilder()
+        if chunksize is None:
+            builder.add(generate_tag_cooccurrence_list_from_df(load_tagged(dataset, tag_query)))
+        else:
+            for chunk in iter_chunks(dataset, chunksize, ['tags']):
+                builder.add(generate_tag_cooccurrence_list_from_df(filter_by_tags(chunk, tag_query)))
+        return builder.matrix()
+
+
+    def __len__(self):
+        return len(self.tags)
+
+
+    def npmi(self):
+        """
+        Normalized pointwise mutual information of the cooccurring pairs,
+        log(p(a, b) / (p(a) p(b))) / -log(p(a, b)) with probabilities over albums:
+        1 for tags always found together, 0 for independent tags and towards -1
+        for tags rarely found together.
+
+        Returns
+        ----------
+
+        ndarray aligned with self.rows and self.cols
+        """
+        p_pair = self.counts / self.n_albums
+        p_rows = self.occurrences[self.rows] / self.n_albums
+        p_cols = self.occurrences[self.cols] / self.n_albums
+        pmi = np.log(p_pair) - np.log(p_rows) - np.log(p_cols)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            npmi = np.where(p_pair < 1, pmi / -np.log(p_pair), 1.0)
+        return npmi
+
+
+    def weights(self, weight='npmi'):
+        """
+        Non-negative edge weights: the cooccurrence counts, or the NPMI clipped at
+        0 so that tags found together less often than by chance are not linked.
+
+        Parameters
+        ----------
+
+        weight : Edge weight [count, npmi]
+
+        Returns
+        ----------
+
+        ndarray aligned with self.rows and self.cols
+        """
+        assert weight in WEIGHTS, "'weight' must be in %s." % WEIGHTS
+        if weight == 'count':
+            return self.counts.astype(float)
+        return np.clip(self.npmi(), 0, None)
+
+
+    def dot(self, x, weights):
+        """
+        Product of the symmetric weight matrix with a vector.
+
+        Parameters
+        ----------
+
+        x : Vector with one value per tag
+
+        weights : Edge weights (see weights)
+
+        Returns
+        ----------
+
+        ndarray
+        """
+        n = len(self.tags)
+        return np.bincount(self.rows, weights * x[self.cols], minlength=n) \
+            + np.bincount(self.cols, weights * x[self.rows], minlength=n)
+
+
+    def edges(self):
+        """
+        Table of the cooccurring pairs.
+
+        Returns
+        ----------
+
+        DataFrame with the tags of each pair, the number of albums with both and
+        their NPMI, sorted by decreasing NPMI
+        """
+        tags = np.asarray(self.tags, dtype=object)
+        df = pd.DataFrame({'tag_a': tags[self.rows], 'tag_b': tags[self.cols],
+                           'albums': self.counts, 'npmi': self.npmi()})
+        return df.sort_values(['npmi', 'albums'], ascending=False, ignore_index=True)
+
+
+@profiled('analytics.pagerank')
+def pagerank(matrix, weight='npmi', damping=0.85, tol=1e-10, max_iter=1000):
+    """
+    Weighted PageRank of the tags by power iteration on the sparse matrix. A random
+    walk follows the edges in proportion to their weight and jumps to a random tag
+    with probability 1 - damping, or from tags without edges.
+
+    Parameters
+    ----------
+
+    matrix : TagMatrix
+
+    weight : Edge weight [count, npmi]
+
+    damping : Probability to follow an edge
+
+    tol : Convergence threshold on the sum of the changes of the ranks
+
+    max_iter : Max number of iterations
+
+    Returns
+    ----------
+
+    ndarray of ranks summing to 1, aligned with matrix.tags
+    """
+    n = len(matrix)
+    if n == 0:
+        return np.zeros(0)
+    weights = matrix.weights(weight)
+    strength = matrix.dot(np.ones(n), weights)
+    dangling = strength == 0
+    x = np.full(n, 1 / n)
+    for _ in range(max_iter):
+        spread = matrix.dot(np.where(dangling, 0, x / np.where(dangling, 1, strength)), weights)
+        new = damping * (spread + x[dangling].sum() / n) + (1 - damping) / n
+        done = np.abs(new - x).sum() < tol
+        x = new
+        if done:
+            break
+    return x / x.sum()
+
+
+@profiled('analytics.eigenvector')
+def eigenvector_centrality(matrix, weight='npmi', tol=1e-10, max_iter=1000):
+    """
+    Eigenvector centrality of the tags by power iteration on the sparse matrix
+    shifted by the identity (which has the same leading eigenvector and converges
+    on bipartite graphs too).
+
+    Parameters
+    ----------
+
+    matrix : TagMatrix
+
+    weight : Edge weight [count, npmi]
+
+    tol : Convergence threshold on the sum of the changes of the centralities
+
+    max_iter : Max number of iterations
+
+    Returns
+    ----------
+
+    ndarray of centralities with unit norm, aligned with matrix.tags
+    """
+    n = len(matrix)
+    if n == 0:
+        return np.zeros(0)
+    weights = matrix.weights(weight)
+    x = np.full(n, 1 / np.sqrt(n))
+    for _ in range(max_iter):
+        new = x + matrix.dot(x, weights)
+        new /= np.linalg.norm(new)
+        done = np.abs(new - x).sum() < n * tol
+        x = new
+        if done:
+            break
+    return x
+
+
+@profiled('analytics.communities')
+def label_propagation(matrix, weight='npmi', max_iter=100, seed=0):
+    """
+    Communities of tags by label propagation: every tag starts in its own
+    community and repeatedly joins the community with the largest total edge
+    weight among its neighbours (keeping its own on ties), until no tag changes.
+    The tags are updated in random halves, which avoids the oscillations of
+    fully synchronous updates while every update is a vectorized pass over the
+    edges.
+
+    Parameters
+    ----------
+
+    matrix : TagMatrix
+
+    weight : Edge weight [count, npmi]
+
+    max_iter : Max number of iterations
+
+    seed : Seed of the order of the updates and of the ties
+
+    Returns
+    ----------
+
+    ndarray of community numbers aligned with matrix.tags, numbered by decreasing size
+    """
+    n = len(matrix)
+    weights = matrix.weights(weight)
+    linked = weights > 0
+    source = np.concatenate([matrix.rows[linked], matrix.cols[linked]])
+    target = np.concatenate([matrix.cols[linked], matrix.rows[linked]])
+    weights = np.concatenate([weights[linked], weights[linked]])
+
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n)
+    for _ in range(max_iter if len(source) > 0 else 0):
+        # total weight of each label among the neighbours of each tag
+        keys, inverse = np.unique(target * n + labels[source], return_inverse=True)
+        score = np.bincount(inverse, weights)
+        tag, label = keys // n, keys % n
+        # best label of each tag: highest score, then its own label, then at random,
+        # with the scores of a tag contiguous since the keys are sorted
+        starts = np.flatnonzero(np.concatenate([[True], tag[1:] != tag[:-1]]))
+        segment = np.cumsum(np.concatenate([[0], tag[1:] != tag[:-1]]))
+        top = score >= np.maximum.reduceat(score, starts)[segment]
+        priority = np.where(top, 1 + 2 * (label == labels[tag]) + rng.random(len(keys)), 0)
+        chosen = priority == np.maximum.reduceat(priority, starts)[segment]
+        best = labels.copy()
+        best[tag[chosen]] = label[chosen]
+
+        changed = best != labels
+        if not changed.any():
+            break
+        update = changed & (rng.random(n) < 0.5)
+        if not update.any():
+            update = changed
+        labels[update] = best[update]
+
+    # communities numbered by decreasing size
+    _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+    return rank[labels]
+
+
+def tag_table(matrix, weight='npmi', seed=0):
+    """
+    Table of the tags with their number of albums, degree, weighted degree,
+    PageRank, eigenvector centrality and community.
+
+    Parameters
+    ----------
+
+    matrix : TagMatrix
+
+    weight : Edge weight [count, npmi]
+
+    seed : Seed of the label propagation
+
+    Returns
+    ----------
+
+    DataFrame indexed by tag, sorted by decreasing PageRank
+    """
+    weights = matrix.weights(weight)
+    n = len(matrix)
+    table = pd.DataFrame({
+        'albums': matrix.occurrences,
+        'degree': matrix.dot(np.ones(n), (weights > 0).astype(float)).astype(np.int64),
+        'strength': matrix.dot(np.ones(n), weights),
+        'pagerank': pagerank(matrix, weight),
+        'eigenvector': eigenvector_centrality(matrix, weight),
+        'community': label_propagation(matrix, weight, seed=seed),
+    }, index=pd.Index(matrix.tags, name='tag'))
+    return table.sort_values('pagerank', ascending=False)
+
+
+def community_table(table, n_tags=5):
+    """
+    Table of the communities of a tag table.
+
+    Parameters
+    ----------
+
+    table : Table of the tags (see tag_table)
+
+    n_tags : Number of tags listed per community
+
+    Returns
+    ----------
+
+    DataFrame indexed by community, with its number of tags, its number of albums
+    with each tag summed and its most central tags
+    """
+    ranked = table.sort_values('pagerank', ascending=False)
+    groups = ranked.groupby('community')
+    return pd.DataFrame({
+        'tags': groups.size(),
+        'albums': groups['albums'].sum(),
+        'top_tags': groups.apply(lambda df: ', '.join(df.index[:n_tags])),
+    })
+
+
+def tag_colors(table, color_by='community'):
+    """
+    Colors of the tags by community or by PageRank, to color tag graphs.
+
+    Parameters
+    ----------
+
+    table : Table of the tags (see tag_table)
+
+    color_by : Column colored [community, pagerank]
+
+    Returns
+    ----------
+
+    Dictionary of hex colors by tag
+    """
+    assert color_by in ['community', 'pagerank'], "'color_by' must be 'community' or 'pagerank'."
+    from matplotlib import cm
+    from matplotlib.colors import to_hex
+
+    if color_by == 'community':
+        colormap = cm.get_cmap(COMMUNITY_COLORMAP)
+        return {tag: to_hex(colormap(c)) if c < colormap.N else OTHER_COMMUNITY_COLOR
+                for tag, c in table['community'].items()}
+    # ranks rather than values, PageRank is heavy-tailed
+    rank = table['pagerank'].rank(pct=True)
+    colormap = cm.get_cmap(CENTRALITY_COLORMAP)
+    return {tag: to_hex(colormap(r)) for tag, r in rank.items()}
+
+
+class _MatrixBuilder():
+    # accumulates the cooccurrences of chunks of albums, with tag numbers in order of appearance
+    def __init__(self):
+        self.codes = {}
+        self.occurrences = []
+        self.pairs = []
+        self.n_albums = 0
+
+    def add(self, tag_lists):
+        tag_lists = [tags for tags in tag_lists if len(tags) > 0]
+        self.n_albums += len(tag_lists)
+        if len(tag_lists) == 0:
+            return
+        album = np.repeat(np.arange(len(tag_lists)), [len(tags) for tags in tag_lists])
+        for tag in itertools.chain.from_iterable(tag_lists):
+            if tag not in self.codes:
+                self.codes[tag] = len(self.codes)
+        code = np.fromiter((self.codes[tag] for tag in itertools.chain.from_iterable(tag_lists)),
+                           dtype=np.int64, count=len(album))
+
+        # albums sorted with their tags, a tag counted once per album
+        n = len(self.codes)
+        key = np.unique(album * n + code)
+        album, code = key // n, key % n
+        self.occurrences.append(np.bincount(code, minlength=n))
+
+        # pairs of tags of the same album, i positions apart, keyed by (smaller << 32) | larger code
+        keys = []
+        for i in range(1, np.bincount(album).max()):
+            same = album[:-i] == album[i:]
+            a, b = code[:-i][same], code[i:][same]
+            keys.append(np.minimum(a, b) << 32 | np.maximum(a, b))
+        if len(keys) > 0:
+            self.pairs.append(np.unique(np.concatenate(keys), return_counts=True))
+
+    def matrix(self):
+        n = len(self.codes)
+        occurrences = np.zeros(n, dtype=np.int64)
+        for counts in self.occurrences:
+            occurrences[:len(counts)] += counts
+        if len(self.pairs) == 0:
+            keys, counts = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        else:
+            keys, inverse = np.unique(np.concatenate([k for k, _ in self.pairs]), return_inverse=True)
+            counts = np.bincount(inverse, np.concatenate([c for _, c in self.pairs])).astype(np.int64)
+        return TagMatrix(list(self.codes), occurrences, keys >> 32, keys & 0xFFFFFFFF, counts, self.n_albums)
@@ -0,0 +1,285 @@
+"""
+Inverted index from tags to albums, for faceted album queries
+"""
+
+import ast
+
+import numpy as np
+import pandas as pd
+
+from .aggregation import top_k_positions
+from .profiling import profiled
+
+
+class TagQuery():
+    def __init__(self, all_of=(), any_of=(), none_of=()):
+        """
+        Boolean query on album tags. An album matches if it has all tags of all_of,
+        at least one tag of any_of (if given) and none of the tags of none_of.
+        Each entry can be a tag or another TagQuery, so queries can be nested.
+
+        Parameters
+        ----------
+
+        all_of: Tags (or queries) that must all match (AND)
+
+        any_of: Tags (or queries) of which at least one must match (OR)
+
+        none_of: Tags (or queries) that must not match (NOT)
+
+
+        Examples
+        ----------
+        Thrash metal albums from the bay area that are not tagged as crossover:
+
+        >>> from metalhistory.tag_index import TagQuery
+        >>>
+        >>> query = TagQuery(all_of=['thrash metal', 'bay area'], none_of=['crossover thrash'])
+
+        """
+        for terms in [all_of, any_of, none_of]:
+            assert isinstance(terms, (list, tuple)), "query terms must be given as list or tuple."
+            assert all(isinstance(t, (str, TagQuery)) for t in terms), "query terms must be str or TagQuery."
+
+        self.all_of = list(all_of)
+        self.any_of = list(any_of)
+        self.none_of = list(none_of)
+
+
+    def __repr__(self):
+        return 'TagQuery(all_of=%r, any_of=%r, none_of=%r)' % (self.all_of, self.any_of, self.none_of)
+
+
+class TagIndex():
+    def __init__(self, df):
+        """
+        Build an inverted index of a processed album dataframe. For every tag, the
+        index keeps the sorted positions of the albums carrying it (posting list),
+        delta encoded in the smallest unsigned integer type that fits.
+
+        Parameters
+        ----------
+
+        df: Processed album dataframe with a 'tags' column
+
+
+        Examples
+        ----------
+        Top 10 albums by playcount tagged both 'thrash metal' and 'bay area':
+
+        >>> import pandas as pd
+        >>> from metalhistory.tag_index import TagIndex, TagQuery
+        >>>
+        >>> df = pd.read_csv('data/proc_MA_1k_albums.csv')
+        >>> index = TagIndex(df)
+        >>> df.iloc[index.top_k(TagQuery(all_of=['thrash metal', 'bay area']), 'playcount', 10)]
+
+        """
+        assert isinstance(df, pd.DataFrame), "'df' must be a pandas DataFrame."
+        assert 'tags' in df.columns, "'df' must have a 'tags' column."
+
+        self.n_albums = len(df)
+        self.metrics = {}
+        for metric in ['listeners', 'playcount', 'MA_score']:
+            if metric in df.columns:
+                self.metrics[metric] = df[metric].astype(float).to_numpy()
+
+        tags = pd.Series(df['tags'].to_numpy(), index=np.arange(self.n_albums)).dropna()
+        tags = tags.apply(ast.literal_eval).explode().dropna()
+
+        self.postings = {}
+        for tag, positions in tags.groupby(tags).groups.items():
+            self.postings[tag] = encode_postings(np.unique(np.asarray(positions)))
+
+
+    def tags(self):
+        """
+        List of the indexed tags.
+        """
+        return list(self.postings.keys())
+
+
+    def albums(self, tag):
+        """
+        Positions of the albums with a tag.
+
+        Parameters
+        ----------
+
+        tag: Name of the tag
+
+        Returns
+        ----------
+        ndarray
+            Sorted album positions (empty if the tag is unknown).
+        """
+        if tag not in self.postings:
+            return np.array([], dtype=np.int64)
+        return decode_postings(self.postings[tag])
+
+
+    def query(self, query):
+        """
+        Positions of the albums matching a query.
+
+        Parameters
+        ----------
+
+        query: TagQuery (or a single tag)
+
+        Returns
+        ----------
+        ndarray
+            Sorted album positions.
+        """
+        if isinstance(query, str):
+            return self.albums(query)
+        assert isinstance(query, TagQuery), "'query' must be a TagQuery or str."
+
+        if len(query.all_of) > 0:
+            # intersect the shortest posting lists first
+            postings = sorted([self.query(t) for t in query.all_of], key=len)
+            result = postings[0]
+            for p in postings[1:]:
+                result = np.intersect1d(result, p, assume_unique=True)
+        else:
+            result = np.arange(self.n_albums)
+
+        if len(query.any_of) > 0:
+            union = np.unique(np.concatenate([self.query(t) for t in query.any_of]))
+            result = np.intersect1d(result, union, assume_unique=True)
+
+        for t in query.none_of:
+            result = np.setdiff1d(result, self.query(t), assume_unique=True)
+        return result
+
+
+    def top_k(self, query, metric='playcount', k=None):
+        """
+        Positions of the k albums matching a query with the largest metric.
+
+        Parameters
+        ----------
+
+        query: TagQuery (or a single tag)
+
+        metric: Metric used to rank the albums [listeners, playcount, MA_score]
+
+        k: Number of albums to return (or None for all matching albums)
+
+        Returns
+        ----------
+        ndarray
+            Album positions, ranked by decreasing metric.
+        """
+        if metric not in self.metrics:
+            raise ValueError('%s is not an indexed metric.' % metric)
+        positions = self.query(query)
+        return positions[top_k_positions(self.metrics[metric][positions], k)]
+
+
+def encode_postings(positions):
+    """
+    Delta encode sorted album positions in the smallest unsigned integer type.
+
+    Parameters
+    ----------
+
+    positions: Sorted array of unique album positions
+
+    Returns
+    ----------
+    ndarray
+        Deltas between consecutive positions (the first one relative to 0).
+    """
+    deltas = np.diff(np.asarray(positions, dtype=np.int64), prepend=0)
+    largest = deltas.max() if len(deltas) > 0 else 0
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if largest <= np.iinfo(dtype).max:
+            return deltas.astype(dtype)
+    return deltas.astype(np.uint64)
+
+
+def decode_postings(deltas):
+    """
+    Decode delta encoded album positions.
+
+    Parameters
+    ----------
+
+    deltas: Array returned by encode_postings
+
+    Returns
+    ----------
+    ndarray
+        Sorted album positions.
+    """
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+@profiled('tags.query')
+def filter_by_tags(df, tag_query, index=None):
+    """
+    Keep the albums of a dataframe matching a tag query.
+
+    Parameters
+    ----------
+
+    df: Processed album dataframe
+
+    tag_query: TagQuery (or a single tag), or None to keep all albums
+
+    index: TagIndex of df, or None to match the tags of df directly (for data that
+           is queried once, such as the chunks of a streamed dataset)
+
+    Returns
+    ----------
+    DataFrame
+        The matching albums, in their original order.
+    """
+    if tag_query is None:
+        return df
+    if index is None:
+        return df.iloc[np.flatnonzero(tag_mask(df, tag_query))]
+    assert index.n_albums == len(df), "'index' was not built from 'df'."
+    return df.iloc[index.query(tag_query)]
+
+
+def tag_mask(df, tag_query):
+    """
+    Albums of a dataframe matching a tag query, without building a TagIndex: the
+    tags are parsed once and only the tags of the query are looked up.
+
+    Parameters
+    ----------
+
+    df: Processed album dataframe with a 'tags' column
+
+    tag_query: TagQuery (or a single tag)
+
+    Returns
+    ----------
+    ndarray
+        Boolean mask of the matching albums.
+    """
+    tags = pd.Series(df['tags'].to_numpy(), index=np.arange(len(df))).dropna()
+    tags = tags.apply(ast.literal_eval).explode().dropna()
+    return _query_mask(tag_query, tags.index.to_numpy(dtype=np.int64), tags.to_numpy(), len(df))
+
+
+def _query_mask(query, albums, tags, n_albums):
+    # albums and tags are the (album position, tag) pairs of the dataframe
+    if isinstance(query, str):
+        mask = np.zeros(n_albums, dtype=bool)
+        mask[albums[tags == query]] = True
+        return mask
+    assert isinstance(query, TagQuery), "'query' must be a TagQuery or str."
+
+    mask = np.ones(n_albums, dtype=bool)
+    for t in query.all_of:
+        mask &= _query_mask(t, albums, tags, n_albums)
+    if len(query.any_of) > 0:
+        mask &= np.logical_or.reduce([_query_mask(t, albums, tags, n_albums) for t in query.any_of])
+    for t in query.none_of:
+        mask &= ~_query_mask(t, albums, tags, n_albums)
+    return mask
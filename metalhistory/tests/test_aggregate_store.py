@@ -0,0 +1,63 @@
+"""
+Test routines for the aggregate store
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.aggregate_store import AggregateStore
+from metalhistory.aggregation import AggregationPlan
+
+import os
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_store_matches_dataset(tmp_path):
+    """
+    Test that the artist statistics of the store match the ones computed on the dataset
+    """
+    store = AggregateStore(DATASET, path=str(tmp_path / 'aggregates.pkl'))
+    assert store.is_fresh() == False
+
+    # the first update builds the whole store
+    assert store.update() == 1000
+    assert store.is_fresh() == True
+
+    plan = AggregationPlan('playcount', ['mean', 'min', 'max'], top_k=30)
+    from_store = plan.execute_partial(store.artists(min_albums=5))
+    from_data = plan.execute(vis.prune_and_group(5, DATASET))
+
+    pd.testing.assert_frame_equal(from_store, from_data, check_exact=True)
+    score_plan = AggregationPlan('MA_score', ['mean', 'sum', 'min', 'max'])
+    pd.testing.assert_frame_equal(score_plan.execute_partial(store.artists(min_albums=5)),
+                                  score_plan.execute(vis.prune_and_group(5, DATASET)), check_exact=True)
+
+    # the oracle knows the content of the dataset: Iron Maiden has 16 albums
+    assert store.artists(5).loc['Iron Maiden', ('MA_album', 'count')] == 16
+    assert store.tags().loc['thrash metal', ('MA_album', 'count')] > 0
+    assert 1980 in store.decades().index
+
+
+def test_store_incremental_update(tmp_path):
+    """
+    Test that appended rows are merged into the store without a rebuild
+    """
+    df = pd.read_csv(DATASET)
+    dataset = str(tmp_path / 'albums.csv')
+    df.head(600).to_csv(dataset, index=False)
+
+    store = AggregateStore(dataset)
+    assert store.update() == 600
+    assert os.path.isfile(store.path)
+
+    # append the remaining rows to the dataset
+    df.tail(400).to_csv(dataset, index=False, header=False, mode='a')
+    assert store.is_fresh() == False
+    # only the appended rows are read
+    assert store.update() == 400
+
+    rebuilt = AggregateStore(dataset, path=str(tmp_path / 'rebuilt.pkl'))
+    rebuilt.build()
+    for name in ['artist', 'tag', 'decade']:
+        pd.testing.assert_frame_equal(store.tables[name], rebuilt.tables[name])
@@ -0,0 +1,127 @@
+"""
+Test routines for the aggregation plans
+"""
+
+from metalhistory.aggregation import AggregationPlan, top_k_positions, partial_aggregate, merge_partials, exact_sums
+
+import math
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def oracle_df():
+    """
+    Small dataset with known statistics per artist.
+    """
+    return pd.DataFrame({
+        'MA_artist': ['a', 'a', 'b', 'b', 'c', 'd'],
+        'MA_score': [10., 12., 15., 13., 9., np.nan],
+        'playcount': [1., 3., 2., 2., 7., 1.]})
+
+
+def test_plan_matches_describe():
+    """
+    Test that the plan computes the same statistics as a full describe()
+    """
+    grouped = oracle_df().groupby('MA_artist')
+    plan = AggregationPlan('MA_score', ['mean', 'min', 'max'])
+    stats = plan.execute(grouped)
+
+    described = grouped.describe()['MA_score'][['mean', 'min', 'max']]
+    described = described.sort_values(by='mean', ascending=False)
+
+    # the plan keeps only the requested metric and statistics
+    assert list(stats.columns.get_level_values(0)) == ['MA_score'] * 3
+    assert list(stats.columns.get_level_values(1)) == ['mean', 'min', 'max']
+    # artists are ranked by mean and the artist without score comes last
+    assert list(stats.index) == ['b', 'a', 'c', 'd']
+    assert np.allclose(stats.to_numpy(), described.to_numpy(), equal_nan=True)
+
+
+def test_plan_top_k():
+    """
+    Test that top_k keeps only the best ranked groups
+    """
+    grouped = oracle_df().groupby('MA_artist')
+    plan = AggregationPlan('playcount', ['sum'], top_k=2, ascending=True)
+    stats = plan.execute(grouped)
+
+    # a and b are tied, the first group in the index wins
+    assert list(stats.index) == ['d', 'a']
+    assert list(stats[('playcount', 'sum')]) == [1., 4.]
+
+
+def test_plan_bad_statistic():
+    """
+    Test that unknown statistics are rejected
+    """
+    with pytest.raises(ValueError):
+        AggregationPlan('MA_score', ['median'])
+    with pytest.raises(ValueError):
+        AggregationPlan('MA_score', ['mean'], order_by='max')
+
+
+def test_top_k_positions_matches_stable_sort():
+    """
+    Test that partial selection gives the same result as a stable full sort
+    """
+    rng = np.random.default_rng(0)
+    # many ties and some NaN values
+    values = rng.integers(0, 10, 200).astype(float)
+    values[rng.integers(0, 200, 20)] = np.nan
+
+    for ascending in [True, False]:
+        key = values if ascending else -values
+        oracle = np.argsort(key, kind='stable')
+        for k in [0, 1, 7, 50, 185, 200, 300]:
+            positions = top_k_positions(values, k, ascending)
+            assert list(positions) == list(oracle[:k])
+
+
+def test_merged_partials_match_execute():
+    """
+    Test that statistics merged from partitions are the ones computed at once
+    """
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'MA_artist': rng.integers(0, 20, 500),
+        'MA_score': rng.random(500) * 30,
+        'playcount': rng.integers(0, 10 ** 9, 500).astype(float)})
+    plan = AggregationPlan('MA_score', ['mean', 'sum', 'min', 'max'])
+    oracle_stats = plan.execute(df.groupby('MA_artist'))
+    playcount_plan = AggregationPlan('playcount', ['sum'])
+    oracle_playcounts = playcount_plan.execute(df.groupby('MA_artist'))
+
+    for size in [13, 250]:
+        partials = [partial_aggregate(df.iloc[i:i + size], 'MA_artist', ['MA_score', 'playcount'])
+                    for i in range(0, len(df), size)]
+        merged = merge_partials(partials)
+        pd.testing.assert_frame_equal(plan.execute_partial(merged), oracle_stats, check_exact=True)
+        pd.testing.assert_frame_equal(playcount_plan.execute_partial(merged), oracle_playcounts, check_exact=True)
+
+
+def test_exact_sums():
+    """
+    Test that the sums are exact and do not depend on the order of the values
+    """
+    # the oracle knows that the exact sums are 2 and 0
+    values = np.array([1e16, 1., 1., -1e16, 0.1, 0.2, -0.3])
+    df = pd.DataFrame({'group': [0, 0, 0, 0, 1, 1, 1], 'value': values})
+    plan = AggregationPlan('value', ['sum'])
+    sums = plan.execute(df.groupby('group'))[('value', 'sum')]
+    assert sums.loc[0] == 2. and sums.loc[1] == math.fsum(values[4:])
+    assert np.cumsum(values[:4])[-1] != 2.
+
+    # sums are correctly rounded, whatever the magnitudes and the order of the values
+    rng = np.random.default_rng(2)
+    values = rng.standard_normal(1000) * 10. ** rng.integers(-20, 20, 1000)
+    codes = rng.integers(0, 5, 1000)
+    for permutation in [np.arange(1000), rng.permutation(1000)]:
+        df = pd.DataFrame({'group': codes[permutation], 'value': values[permutation]})
+        sums = plan.execute(df.groupby('group'))[('value', 'sum')].sort_index()
+        assert list(sums) == [math.fsum(values[codes == code]) for code in range(5)]
+
+    # the sum levels hold integral units
+    levels = exact_sums(values, codes, 5)
+    assert all(sums.dtype == np.int64 for stat, sums in levels.items() if stat != 'sum_nonfinite')
@@ -0,0 +1,53 @@
+"""
+Test routines for the benchmark suite
+"""
+
+from metalhistory.benchmark import run_benchmarks, compare, scaled_dataset, LocalTransport
+from metalhistory.data_query_functions import LastFM
+
+import copy
+import os
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_scaled_dataset():
+    """
+    Test that scaled datasets keep the schema and grow the number of artists
+    """
+    df = pd.read_csv(DATASET)
+    scaled = scaled_dataset(2500, dataset=df)
+    assert list(scaled.columns) == list(df.columns)
+    assert len(scaled) == 2500
+    assert scaled['MA_artist'].nunique() > df['MA_artist'].nunique()
+
+
+def test_local_transport():
+    """
+    Test that the LastFM queries are answered by the local transport
+    """
+    transport = LocalTransport(pd.read_csv(DATASET).head(10))
+    lastfm = LastFM(fetch=transport.fetch)
+    info = lastfm.get_album_info(artist='Opeth', album='Pale Communion', fields=['name', 'tags', 'release-date'])
+    # the oracle knows that Pale Communion has no accepted tag
+    assert info == {'name': 'Pale Communion', 'tags': [], 'ignored tags': ['progressive rock', 'neo-erotic spandex rock',
+                    '2014', 'chad kroeger', 'stevie willie didgeridoo'], 'release-date': '1986-10-07'}
+    # one album.getinfo and one musicbrainz request
+    assert transport.requests == 2
+
+
+def test_run_benchmarks():
+    """
+    Test the benchmark records and the detection of regressions
+    """
+    results = run_benchmarks(scales=[1000], names=['lastfm.build_request', 'prune_and_group', 'filter_tag_graph'], repeat=1)
+    assert [(r['name'], r['rows']) for r in results['results']] == \
+        [('lastfm.build_request', 1000), ('prune_and_group', 1000), ('filter_tag_graph', 1000)]
+    assert all(r['seconds'] > 0 and r['items_per_second'] > 0 for r in results['results'])
+
+    assert not compare(results, results)['regression'].any()
+    baseline = copy.deepcopy(results)
+    baseline['results'][1]['seconds'] /= 2
+    assert list(compare(results, baseline)['regression']) == [False, True, False]
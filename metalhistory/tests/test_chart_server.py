@@ -0,0 +1,99 @@
+"""
+Test routines for the chart rendering HTTP service
+"""
+
+from metalhistory.chart_server import make_server
+
+import os
+import json
+import threading
+import urllib.request
+import urllib.error
+import pytest
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+@pytest.fixture
+def server():
+    server = make_server(DATASET, port=0, max_concurrent=1, queue_timeout=0.05)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, headers={}):
+    """
+    Status, headers and body of a GET request to the server.
+    """
+    url = 'http://%s:%d%s' % (server.server_address[:2] + (path,))
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_chart_server_etag(server):
+    """
+    Test that charts are rendered once and revalidated with their ETag
+    """
+    status, headers, body = get(server, '/charts/barplot.svg?metric=playcount&min_albums=3')
+    assert status == 200
+    assert headers['Content-Type'] == 'image/svg+xml'
+    assert body.startswith(b'<?xml')
+    etag = headers['ETag']
+
+    # conditional requests are answered without rendering
+    status, _, body = get(server, '/charts/barplot.svg?min_albums=3&metric=playcount', {'If-None-Match': etag})
+    assert (status, body) == (304, b'')
+
+    # other requests of the same chart are served from memory
+    status, headers, _ = get(server, '/charts/barplot.svg?min_albums=3&metric=playcount')
+    assert (status, headers['ETag']) == (200, etag)
+    assert server.service.renders == 1
+
+    status, headers, body = get(server, '/charts/tag-graph.png?n_tags=8&tags=heavy%20metal')
+    assert status == 200 and body.startswith(b'\x89PNG')
+    assert headers['ETag'] != etag
+    # tag queries use the index kept by the service
+    assert server.service.tag_index.n_albums == len(server.service.df)
+
+    status, _, body = get(server, '/health')
+    assert status == 200 and json.loads(body)['renders'] == 2
+
+
+def test_chart_server_force_layout_etag(server):
+    """
+    Test that force-directed tag graphs are not revalidated once the layout state changed
+    """
+    path = '/charts/tag-graph.png?n_tags=8&layout=force'
+    etag = get(server, path)[1]['ETag']
+
+    # the oracle knows that the layout moved the tags, the next graph starts from their new positions
+    status, headers, body = get(server, path, {'If-None-Match': etag})
+    assert status == 200 and body.startswith(b'\x89PNG')
+    assert headers['ETag'] != etag
+    assert server.service.renders == 2
+
+
+def test_chart_server_errors(server):
+    """
+    Test the answers to unknown charts, bad parameters and a busy server
+    """
+    assert get(server, '/charts/pie.png')[0] == 404
+    assert get(server, '/charts/covers.svg')[0] == 404
+    assert get(server, '/charts/barplot.png?n_artists=many')[0] == 400
+    assert get(server, '/charts/barplot.png?color=red')[0] == 400
+    assert get(server, '/charts/barplot.png?metric=unknown')[0] == 400
+
+    # the oracle holds the only rendering slot
+    server.service.slots.acquire()
+    try:
+        status, headers, _ = get(server, '/charts/cloud.png')
+    finally:
+        server.service.slots.release()
+    assert status == 503 and headers['Retry-After'] == '1'
@@ -0,0 +1,97 @@
+"""
+Test routines for the command line interface
+"""
+
+import metalhistory.data_query_functions as dqf
+from metalhistory.cli import main, EXIT_OK, EXIT_USAGE, EXIT_PARTIAL
+
+import io
+import os
+import sys
+import json
+import subprocess
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+class FakeLastFM():
+    """
+    LastFM API object answering without network, with no info about 'Unknown' albums
+    and failing on 'Broken' albums.
+    """
+    def get_album_info(self, artist, album, fields):
+        if album == 'Unknown':
+            return float('nan')
+        if album == 'Broken':
+            raise RuntimeError('LastFM API responded with status code 500')
+        return {'artist': artist, 'name': album, 'listeners': 10, 'playcount': 100, 'tags': ['thrash metal'],
+                'ignored tags': [], 'mbid': '', 'url': '', 'image': [], 'release-date': '1986'}
+
+
+def events(stderr):
+    """
+    Progress events reported on stderr.
+    """
+    return [json.loads(line) for line in stderr.splitlines() if line.startswith('{')]
+
+
+def test_cli_lazy_imports():
+    """
+    Test that the command line interface does not import the heavy modules up front
+    """
+    code = "import sys, metalhistory.cli; print(sorted(m for m in ['matplotlib', 'pandas'] if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True,
+                            cwd=os.path.dirname(os.path.dirname(DATASET)))
+    assert output.stdout.strip() == '[]'
+
+
+def test_cli_enrich(tmp_path, monkeypatch, capsys):
+    """
+    Test that albums streamed on stdin are enriched, reported and resumed
+    """
+    monkeypatch.setattr(dqf, 'LastFM', FakeLastFM)
+    output = str(tmp_path / 'proc.csv')
+    albums = 'artist,album,MA_score\nSlayer,Reign in Blood,36.01\nSlayer,Unknown,1.0\nSlayer,Broken,2.0\n'
+
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(albums))
+    assert main(['enrich', '-', '-o', output, '--progress-every', '1']) == EXIT_PARTIAL
+    reported = events(capsys.readouterr().err)
+    assert [e['event'] for e in reported] == ['start', 'progress', 'failed', 'progress', 'failed', 'progress', 'done']
+    assert (reported[-1]['done'], reported[-1]['failed']) == (3, 2)
+    assert reported[4]['error'] == 'RuntimeError: LastFM API responded with status code 500'
+
+    # the oracle knows that the albums without info or whose query failed are not written
+    df = pd.read_csv(output)
+    assert list(df.columns) == dqf.ENRICHED_COLUMNS
+    assert df[['MA_album', 'MA_score', 'playcount']].values.tolist() == [['Reign in Blood', 36.01, 100]]
+
+    # the enriched album is skipped when resuming, and the failed album is queried again
+    albums += 'Metallica,Kill \'Em All,33.39\n'
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(albums))
+    assert main(['enrich', '-', '-o', output, '--resume']) == EXIT_PARTIAL
+    reported = events(capsys.readouterr().err)
+    assert reported[0]['skipped'] == 1
+    assert [e['album'] for e in reported if e['event'] == 'failed'] == ['Unknown', 'Broken']
+    assert list(pd.read_csv(output)['MA_artist']) == ['Slayer', 'Metallica']
+
+
+def test_cli_convert_and_charts(tmp_path, capsys):
+    """
+    Test the conversion of the dataset and the rendering of charts from it
+    """
+    converted = str(tmp_path / 'albums.pkl')
+    assert main(['convert', DATASET, converted]) == EXIT_OK
+    assert len(pd.read_pickle(converted)) == len(pd.read_csv(DATASET))
+
+    output = str(tmp_path / 'bar.png')
+    assert main(['barplot', '--dataset', converted, '-o', output, '--metric', 'playcount', '--tags', 'heavy metal']) == EXIT_OK
+    assert os.path.exists(output)
+    done = events(capsys.readouterr().err)[-1]
+    assert (done['event'], done['command'], done['output']) == ('done', 'barplot', output)
+
+    # invalid arguments and failing charts have their exit codes
+    assert main(['barplot', '--metric', 'unknown']) == EXIT_USAGE
+    assert main(['tag-graph', '--dataset', str(tmp_path / 'missing.csv'), '-o', str(tmp_path / 'g.png')]) == 1
+    assert events(capsys.readouterr().err)[-1]['event'] == 'error'
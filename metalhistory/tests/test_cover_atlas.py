@@ -0,0 +1,72 @@
+"""
+Test routines for the cover atlas
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.cover_atlas import CoverAtlas
+from metalhistory.cover_cache import CoverCache
+
+import io
+import os
+import numpy as np
+from PIL import Image
+
+from .test_cover_cache import FakeServer
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_atlas_roundtrip(tmp_path):
+    """
+    Test that covers are read back from the atlas at the stored sizes
+    """
+    atlas = CoverAtlas(str(tmp_path / 'atlas'), sizes=[16, 32])
+    atlas.add(CoverAtlas.key('Metallica', 'Master of Puppets'), Image.new('RGB', (300, 300), (200, 10, 10)))
+    atlas.add(CoverAtlas.key('Slayer', 'Reign in Blood'), Image.new('RGB', (300, 300), (10, 10, 200)))
+    atlas.save()
+
+    # a new atlas object on the same files finds the covers
+    atlas = CoverAtlas(str(tmp_path / 'atlas'))
+    assert len(atlas) == 2
+    im = atlas.get(CoverAtlas.key('Slayer', 'Reign in Blood'), size=(20, 10))
+    assert im.size == (32, 32)
+    assert im.getpixel((5, 5)) == (10, 10, 200)
+    assert atlas.get(CoverAtlas.key('Metallica', 'Master of Puppets'), size=(8, 8)).getpixel((0, 0)) == (200, 10, 10)
+
+    # unsaved covers are dropped when the atlas is opened again
+    atlas.add(CoverAtlas.key('Exodus', 'Bonded by Blood'), Image.new('RGB', (300, 300)))
+    atlas = CoverAtlas(str(tmp_path / 'atlas'))
+    assert len(atlas) == 2
+    assert os.path.getsize(atlas.raw_file) == atlas.end
+
+
+def test_album_covers_from_atlas(tmp_path):
+    """
+    Test that mosaics composed from the atlas do not load covers, and that the
+    atlas is built incrementally
+    """
+    server = FakeServer()
+
+    def fetch(url):
+        # the same album has the same cover at every LastFM size
+        server.fetch(url)
+        buffer = io.BytesIO()
+        color = int(url.rsplit('/', 1)[-1][:6], 16)
+        Image.new('RGB', (300, 300), (color >> 16, (color >> 8) & 255, color & 255)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    cache = CoverCache(str(tmp_path / 'covers'), fetch=fetch)
+    atlas = vis.build_cover_atlas(str(tmp_path / 'atlas'), num_albums=5, dataset=DATASET, cache=cache)
+    assert len(atlas) == 5
+    atlas = vis.build_cover_atlas(str(tmp_path / 'atlas'), num_albums=10, dataset=DATASET, cache=cache)
+    assert len(atlas) == 10
+    assert len(server.requests) == 10
+
+    img = vis.album_covers(num_albums=10, width=320, height=180, dataset=DATASET, image_name=None, atlas=atlas)
+    assert len(server.requests) == 10
+    oracle_img = vis.album_covers(num_albums=10, width=320, height=180, dataset=DATASET, image_name=None, cache=cache)
+
+    # the atlas stores resized covers, so only allow small interpolation differences
+    difference = np.abs(np.asarray(img, dtype=int) - np.asarray(oracle_img, dtype=int))
+    assert np.median(difference) < 2
@@ -0,0 +1,147 @@
+"""
+Test routines for the album cover cache
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.cover_cache import CoverCache
+from metalhistory.mosaic import PLACEHOLDER_COLOR
+
+import io
+import os
+import pytest
+from PIL import Image
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+class FakeServer():
+    """
+    Local stand-in for the cover server, serving a plain 300x300 cover for any URL.
+    """
+    def __init__(self):
+        self.requests = []
+
+    def fetch(self, url):
+        self.requests.append(url)
+        buffer = io.BytesIO()
+        color = len(self.requests) * 40 % 256
+        Image.new('RGB', (300, 300), (color, 0, 255 - color)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+
+def test_cache_hits(tmp_path):
+    """
+    Test that cached covers are not downloaded again and that thumbnails are used
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+
+    im = cache.get('http://covers/a.png')
+    assert im.size == (300, 300)
+    assert cache.contains('http://covers/a.png')
+
+    # the smallest thumbnail covering the requested size is returned
+    assert cache.get('http://covers/a.png', size=(50, 40)).size == (64, 64)
+    assert cache.get('http://covers/a.png', size=(280, 280)).size == (300, 300)
+    assert server.requests == ['http://covers/a.png']
+
+    # a new cache object on the same directory finds the cached covers
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+    cache.get('http://covers/a.png', size=(20, 20))
+    assert server.requests == ['http://covers/a.png']
+
+    # a cover removed between its lookup and its decoding is a miss
+    key = cache.key('http://covers/a.png')
+    os.remove(os.path.join(str(tmp_path), key[:2], key, '64.jpg'))
+    assert cache.get('http://covers/a.png', size=(50, 40)).size == (64, 64)
+    assert server.requests == ['http://covers/a.png'] * 2
+
+
+def test_cache_eviction(tmp_path):
+    """
+    Test that the least recently used covers are evicted beyond the size cap
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+    cache.get('http://covers/a.png')
+    entry_bytes = cache.total_bytes
+
+    # the oracle knows that there is room for two covers only
+    cache = CoverCache(str(tmp_path / 'small'), max_bytes=int(entry_bytes * 2.5), fetch=server.fetch)
+    cache.get('http://covers/a.png')
+    cache.get('http://covers/b.png')
+    cache.get('http://covers/a.png')
+    cache.get('http://covers/c.png')
+
+    assert cache.contains('http://covers/a.png')
+    assert not cache.contains('http://covers/b.png')
+    assert cache.contains('http://covers/c.png')
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_album_covers_with_cache(tmp_path):
+    """
+    Test that a repeated mosaic is rendered without downloading any cover
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+
+    img = vis.album_covers(num_albums=10, width=320, height=180, dataset=DATASET, image_name=None, cache=cache)
+    assert img.size == (320, 180)
+    assert len(server.requests) == 10
+
+    img = vis.album_covers(num_albums=10, width=320, height=180, dataset=DATASET, image_name=None, cache=cache)
+    assert img.size == (320, 180)
+    assert len(server.requests) == 10
+
+
+def test_album_covers_placeholder(tmp_path):
+    """
+    Test that covers failing to load are replaced by placeholder tiles
+    """
+    server = FakeServer()
+
+    def failing_fetch(url):
+        # the oracle knows the cover of the most played album
+        if url.endswith('1d0aa6c5b7d1893882eae3f282143eed.png'):
+            raise RuntimeError('Cover server responded with status code 404.')
+        return server.fetch(url)
+
+    cache = CoverCache(str(tmp_path), fetch=failing_fetch)
+    with pytest.warns(UserWarning, match='1d0aa6c5b7d1893882eae3f282143eed'):
+        img = vis.album_covers(num_albums=10, width=320, height=180, dataset=DATASET, image_name=None,
+                               cache=cache, n_workers=4)
+
+    assert img.size == (320, 180)
+    assert len(server.requests) == 9
+    # the most played album is placed in the upper left corner
+    assert img.getpixel((0, 0)) == PLACEHOLDER_COLOR
+
+
+def test_album_covers_small_images(tmp_path):
+    """
+    Test that small mosaics only download small covers
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+    vis.album_covers(num_albums=20, width=160, height=90, dataset=DATASET, image_name=None, cache=cache)
+
+    assert len(server.requests) == 20
+    assert not any('/300x300/' in url for url in server.requests)
+    assert any('/34s/' in url or '/64s/' in url for url in server.requests)
+
+
+def test_album_covers_all_albums(tmp_path):
+    """
+    Test that the mosaic of all the albums leaves out the albums without playcount or cover
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+    img = vis.album_covers(num_albums=None, width=320, height=180, dataset=DATASET, image_name=None, cache=cache)
+
+    assert img.size == (320, 180)
+    # the oracle knows that 94 of the 1000 albums have neither playcount nor cover
+    df = vis.top_albums(num_albums=None, dataset=DATASET)
+    assert len(df) == 906
+    assert len(set(server.requests)) == df['image'].nunique()
@@ -0,0 +1,50 @@
+"""
+Test routines for the figure management of the visualizations
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.figures import FigurePool, bar_figure_size, figure_memory, MAX_BAR_WIDTH
+
+import os
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_bar_figure_size():
+    """
+    Test that bar plots grow with the number of bars, within bounds
+    """
+    assert bar_figure_size(10)[0] < bar_figure_size(60)[0]
+    assert bar_figure_size(10000)[0] == MAX_BAR_WIDTH
+
+
+def test_barplot_figure(tmp_path):
+    """
+    Test that the returned figure is the chart, with bounded memory
+    """
+    fig, df = vis.artist_barplot(5, 30, 'MA_score', str(tmp_path / 'bar.png'), DATASET)
+
+    # the chart of the top 30 artists is drawn on the returned figure
+    assert len(fig.axes) == 1
+    assert len(fig.axes[0].patches) == 3 * 30
+    # the oracle knows that 67 artists have at least 5 albums, all of them are returned
+    assert len(df) == 67
+
+    # the oracle knows that 30 artists fit a 14x6 inch figure at 100 dpi
+    assert tuple(fig.get_size_inches()) == (14, 6)
+    assert figure_memory(fig) == 1400 * 600 * 4
+
+
+def test_figure_pool(tmp_path):
+    """
+    Test that released figures are reused
+    """
+    pool = FigurePool(max_figures=1)
+    fig, _ = vis.artist_barplot(5, 10, 'MA_score', str(tmp_path / 'a.png'), DATASET, figure_pool=pool)
+    pool.release(fig)
+    assert len(fig.axes) == 0
+
+    other_fig, _ = vis.artist_barplot(5, 40, 'playcount', str(tmp_path / 'b.png'), DATASET, figure_pool=pool)
+    assert other_fig is fig
+    assert tuple(fig.get_size_inches()) == bar_figure_size(40)
@@ -0,0 +1,70 @@
+"""
+Test routines for the force-directed layout of tag graphs
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.graph_layout import force_layout, scale_positions, _exact_repulsion, _grid_repulsion
+from metalhistory.graph_renderer import TagGraphRenderer
+
+import json
+import os
+import networkx as nx
+import numpy as np
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_grid_repulsion():
+    """
+    Test that the grid approximation of the repulsion is close to the exact one
+    """
+    rng = np.random.default_rng(0)
+    # a dense cluster in a uniform background
+    x = np.concatenate([rng.normal(0, 0.05, (600, 2)), rng.random((400, 2))])
+    exact = _exact_repulsion(x, 1)
+    approximated = _grid_repulsion(x, 1)
+    assert np.linalg.norm(approximated - exact) / np.linalg.norm(exact) < 0.02
+
+
+def test_force_layout():
+    """
+    Test that linked tags are laid out together and that a warm start keeps the layout
+    """
+    # two cliques joined by one edge, large enough for the grid approximation
+    G = nx.disjoint_union(nx.complete_graph(250), nx.complete_graph(250))
+    G.add_edge(0, 250)
+    pos = scale_positions(force_layout(G, iterations=60))
+    x = np.array([pos[node] for node in G])
+    assert np.abs(x).max() <= 1 + 1e-9
+    # the oracle knows that each clique is far from the other one
+    first, second = x[:250].mean(axis=0), x[250:].mean(axis=0)
+    assert np.linalg.norm(first - second) > 3 * np.linalg.norm(x[:250] - first, axis=1).mean()
+
+    G = nx.barabasi_albert_graph(600, 2, seed=1)
+    pos = force_layout(G)
+    side = np.ptp(np.array(list(pos.values())), axis=0).max()
+    G.add_edge(0, 'new tag')
+    warm = force_layout(G, pos=pos, iterations=30)
+    cold = force_layout(G, seed=1)
+    assert np.mean([np.linalg.norm(warm[node] - pos[node]) for node in pos]) < 0.05 * side
+    assert np.mean([np.linalg.norm(cold[node] - pos[node]) for node in pos]) > 0.1 * side
+    assert np.linalg.norm(warm['new tag'] - warm[0]) < 0.1 * side
+
+
+def test_tag_graph_force_layout(tmp_path):
+    """
+    Test that the renderer keeps the positions of force-directed layouts across runs
+    """
+    positions = str(tmp_path / 'positions.json')
+    renderer = TagGraphRenderer(fig_size=(6, 5), dpi=50, positions_file=positions)
+    vis.tag_graph(10, dataset=DATASET, file_name=str(tmp_path / 'small.png'), renderer=renderer, layout='force')
+    with open(positions) as file:
+        assert len(json.load(file)) == 10
+
+    # a new renderer starts from the saved positions
+    renderer = TagGraphRenderer(fig_size=(6, 5), dpi=50, positions_file=positions)
+    vis.tag_graph(40, dataset=DATASET, file_name=str(tmp_path / 'large.png'), renderer=renderer, layout='force')
+    with open(positions) as file:
+        assert len(json.load(file)) >= 10
+    assert os.path.isfile(str(tmp_path / 'large.png'))
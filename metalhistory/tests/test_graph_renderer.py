@@ -0,0 +1,48 @@
+"""
+Test routines for the tag graph renderer
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.graph_renderer import TagGraphRenderer
+
+import os
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_renderer_reuses_template(tmp_path):
+    """
+    Test that renders only replace the graph and keep the background template
+    """
+    renderer = TagGraphRenderer(fig_size=(6, 5), dpi=50)
+
+    # the background is downsampled to the figure resolution
+    assert renderer.background.shape[0] <= 250 and renderer.background.shape[1] <= 300
+
+    G = vis.generate_tag_network([['a', 'b'], ['b', 'c'], ['c', 'a']], ['a', 'b', 'c'])
+    fig = renderer.render(G, str(tmp_path / 'first.png'))
+    n_artists = len(fig.axes[0].get_children())
+
+    # the oracle knows that a graph with as many nodes draws as many artists
+    G = vis.generate_tag_network([['x', 'y'], ['y', 'z'], ['z', 'x']], ['x', 'y', 'z'])
+    fig = renderer.render(G, str(tmp_path / 'second.png'), title='Thrash Metal Relations')
+    assert len(fig.axes[0].get_children()) == n_artists
+    assert renderer.title.get_text() == 'Thrash Metal Relations'
+    assert os.path.isfile(str(tmp_path / 'second.png'))
+
+
+def test_tag_graph_with_renderer(tmp_path):
+    """
+    Test that tag_graph draws on the given renderer, from any working directory
+    """
+    renderer = TagGraphRenderer()
+    cwd = os.getcwd()
+    try:
+        os.chdir(str(tmp_path))
+        fig = vis.tag_graph(dataset=DATASET, file_name='tag_graph.svg', renderer=renderer)
+    finally:
+        os.chdir(cwd)
+
+    assert fig is renderer.figure
+    assert os.path.isfile(str(tmp_path / 'tag_graph.svg'))
@@ -0,0 +1,75 @@
+"""
+Test routines for the album cover mosaics
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.cover_cache import CoverCache
+from metalhistory.mosaic import StreamingPNGWriter, cover_layout, render_region
+
+import os
+import numpy as np
+from PIL import Image
+
+from .test_cover_cache import FakeServer
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_cover_layout():
+    """
+    Test that the layout boxes cover the whole mosaic
+    """
+    boxes = cover_layout([50, 30, 20], 200, 100)
+
+    assert len(boxes) == 3
+    coverage = np.zeros((100, 200), dtype=int)
+    for left, upper, right, lower in boxes:
+        coverage[upper:lower, left:right] += 1
+    assert coverage.min() >= 1
+
+
+def test_streaming_png_writer(tmp_path):
+    """
+    Test that an image written band by band is read back unchanged
+    """
+    pixels = np.random.RandomState(0).randint(0, 256, (50, 30, 3)).astype(np.uint8)
+    file_name = str(tmp_path / 'bands.png')
+
+    with StreamingPNGWriter(file_name, 30, 50) as writer:
+        for upper in range(0, 50, 16):
+            writer.write(Image.fromarray(pixels[upper:upper + 16]))
+
+    assert np.array_equal(np.asarray(Image.open(file_name)), pixels)
+    assert not os.path.exists(file_name + '.tmp')
+
+
+def test_render_region():
+    """
+    Test that a region renders the parts of the covers intersecting it
+    """
+    red = Image.new('RGB', (10, 10), (255, 0, 0))
+    blue = Image.new('RGB', (10, 10), (0, 0, 255))
+    placed = [((0, 0, 20, 20), red), ((20, 0, 40, 20), blue)]
+
+    region = render_region(placed, (10, 5, 30, 15))
+    assert region.size == (20, 10)
+    assert region.getpixel((0, 0)) == (255, 0, 0)
+    assert region.getpixel((19, 9)) == (0, 0, 255)
+
+
+def test_album_covers_tiled(tmp_path):
+    """
+    Test that the tiled mosaic matches the mosaic rendered in memory
+    """
+    cache = CoverCache(str(tmp_path / 'covers'), fetch=FakeServer().fetch)
+    oracle_img = vis.album_covers(num_albums=10, width=320, height=180, dataset=DATASET, image_name=None, cache=cache)
+
+    file_name = vis.album_covers_tiled(num_albums=10, width=320, height=180, dataset=DATASET,
+                                       image_name=str(tmp_path / 'poster.png'), cache=cache, band_height=32)
+    img = Image.open(file_name)
+    assert img.size == (320, 180)
+
+    # covers are resampled per band, so only allow small interpolation differences
+    difference = np.abs(np.asarray(img, dtype=int) - np.asarray(oracle_img, dtype=int))
+    assert difference.mean() < 2
@@ -0,0 +1,65 @@
+"""
+Test routines for the profiling of the visualization pipeline
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory import profiling
+from metalhistory.profiling import Profiler, stage
+
+import os
+import json
+import numpy as np
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_profiling_disabled():
+    """
+    Test that nothing is recorded outside of a profiler
+    """
+    profiler = Profiler()
+    assert stage('unused') is profiling._NO_STAGE
+    vis.load_data(DATASET)
+    assert profiler.events == []
+
+
+def test_profiling_stages(tmp_path):
+    """
+    Test that the stages of a chart are recorded and exported
+    """
+    with Profiler() as profiler:
+        vis.tag_graph(n_tags=8, dataset=DATASET, file_name=str(tmp_path / 'tags.png'))
+    assert profiling._profiler is None
+
+    table = profiler.summary()
+    for name in ['chart.tag_graph', 'load_data', 'tags.parse', 'tags.network', 'graph.draw', 'savefig']:
+        assert table.loc[name, 'calls'] == 1
+    # the chart contains all the other stages
+    assert table.index[0] == 'chart.tag_graph'
+    assert (table['peak_bytes'] <= table.loc['chart.tag_graph', 'peak_bytes']).all()
+
+    trace_file = str(tmp_path / 'trace.json')
+    profiler.save_trace(trace_file)
+    with open(trace_file) as file:
+        events = json.load(file)['traceEvents']
+    assert len(events) == len(profiler.events)
+    assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
+
+
+def test_profiling_memory():
+    """
+    Test the peak memory of nested stages
+    """
+    with Profiler() as profiler:
+        with stage('outer'):
+            with stage('inner'):
+                a = np.ones(10**6)
+                del a
+            b = np.ones(10**5)
+
+    peaks = profiler.summary()['peak_bytes']
+    # the oracle knows that 10**6 float64 take 8 MB, freed before the second array
+    assert 8e6 <= peaks['inner'] < 9e6
+    assert peaks['outer'] >= peaks['inner']
+    assert peaks['outer'] < 9e6
@@ -0,0 +1,120 @@
+"""
+Test routines for the cache of rendered charts
+"""
+
+import metalhistory.visualization_api as vis
+import metalhistory.render_cache as render_cache
+from metalhistory.render_cache import RenderCache, dataset_fingerprint
+
+import os
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_render_cache_hits(tmp_path):
+    """
+    Test that charts are only rendered when parameters or dataset change
+    """
+    cache = RenderCache(str(tmp_path / 'cache'))
+    output = str(tmp_path / 'bar.svg')
+
+    fig, df = vis.artist_barplot(5, 20, 'MA_score', output, DATASET, render_cache=cache)
+    assert fig is not None
+    with open(output, 'rb') as file:
+        rendered = file.read()
+    os.remove(output)
+
+    # a hit copies the cached chart without rendering it, chunking does not change the chart
+    fig, hit_df = vis.artist_barplot(5, 20, 'MA_score', output, DATASET, chunksize=100, render_cache=cache)
+    assert fig is None
+    pd.testing.assert_frame_equal(hit_df, df)
+    with open(output, 'rb') as file:
+        assert file.read() == rendered
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # other parameters and other data are misses
+    vis.artist_barplot(5, 10, 'MA_score', output, DATASET, render_cache=cache)
+    df = pd.read_csv(DATASET)
+    df.loc[0, 'MA_score'] = 0
+    vis.artist_barplot(5, 20, 'MA_score', output, df, render_cache=cache)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_render_cache_results(tmp_path):
+    """
+    Test that hits return the data of the charts and that renderer state is part of the key
+    """
+    from metalhistory.graph_renderer import TagGraphRenderer
+
+    cache = RenderCache(str(tmp_path / 'cache'))
+    output = str(tmp_path / 'cloud.png')
+    words = vis.artist_cloud(5, 20, 'MA_score', output, DATASET, render_cache=cache)
+    pd.testing.assert_series_equal(vis.artist_cloud(5, 20, 'MA_score', output, DATASET, render_cache=cache), words)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # circular layouts do not depend on the state of the renderer
+    renderer = TagGraphRenderer()
+    output = str(tmp_path / 'graph.png')
+    vis.tag_graph(12, DATASET, output, renderer=renderer, layout='force', render_cache=cache)
+    vis.tag_graph(12, DATASET, output, renderer=renderer, render_cache=cache)
+    vis.tag_graph(12, DATASET, output, renderer=renderer, render_cache=cache)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    # the oracle knows that a force layout starts from the positions of the previous one
+    vis.tag_graph(12, DATASET, output, renderer=renderer, layout='force', render_cache=cache)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_render_cache_bounded(tmp_path):
+    """
+    Test that the least recently used charts are evicted beyond the size cap
+    """
+    source = tmp_path / 'chart.svg'
+    source.write_bytes(b'x' * 1000)
+
+    # the oracle knows that there is room for two charts only
+    cache = RenderCache(str(tmp_path / 'cache'), max_bytes=2500)
+    for key in ['a', 'b', 'c']:
+        cache.put(key * 40, str(source))
+
+    assert cache.total_bytes == 2000
+    assert not cache.fetch('a' * 40, str(tmp_path / 'out.svg'))
+    assert cache.fetch('c' * 40, str(tmp_path / 'out.svg'))
+
+    # a new cache object on the same directory finds the cached charts
+    assert len(RenderCache(str(tmp_path / 'cache')).entries) == 2
+
+
+def test_dataset_fingerprint():
+    """
+    Test that the fingerprint depends on the content of the dataset only
+    """
+    df = pd.read_csv(DATASET)
+    assert dataset_fingerprint(df) == dataset_fingerprint(df.copy())
+    assert dataset_fingerprint(DATASET) == dataset_fingerprint(DATASET)
+    df.loc[3, 'playcount'] += 1
+    assert dataset_fingerprint(df) != dataset_fingerprint(pd.read_csv(DATASET))
+
+
+def test_file_fingerprint_cached(tmp_path, monkeypatch):
+    """
+    Test that dataset files are hashed once per size and modification time
+    """
+    csv_name = str(tmp_path / 'albums.csv')
+    with open(DATASET, 'rb') as file:
+        content = file.read()
+    with open(csv_name, 'wb') as file:
+        file.write(content)
+    fingerprint = dataset_fingerprint(csv_name)
+
+    # the oracle knows that a cached fingerprint does not read the file again
+    reads = []
+    monkeypatch.setattr(render_cache, 'open', lambda *args: reads.append(args), raising=False)
+    assert dataset_fingerprint(csv_name) == fingerprint and reads == []
+    monkeypatch.undo()
+
+    with open(csv_name, 'ab') as file:
+        file.write(content.splitlines(keepends=True)[-1])
+    assert dataset_fingerprint(csv_name) != fingerprint
@@ -0,0 +1,46 @@
+"""
+Test routines for the batch rendering of charts
+"""
+
+from metalhistory.render_farm import ChartSpec, render_batch
+
+import os
+import pytest
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_render_batch(tmp_path):
+    """
+    Test that all specs are rendered by the pool, with their timing and status
+    """
+    specs = [ChartSpec('artist_barplot', str(tmp_path / 'bar_MA.png'), metric='MA_score', min_albums=5),
+             ChartSpec('artist_barplot', str(tmp_path / 'bar_playcount.svg'), metric='playcount', min_albums=3),
+             ChartSpec('artist_cloud', str(tmp_path / 'cloud.png'), words_limit=10),
+             ChartSpec('tag_graph', str(tmp_path / 'tags.svg'), n_tags=8),
+             # the oracle knows that this metric does not exist
+             ChartSpec('artist_barplot', str(tmp_path / 'bar_unknown.png'), metric='unknown')]
+
+    results = render_batch(specs, DATASET, n_workers=2)
+
+    assert list(results['output']) == [spec.output for spec in specs]
+    assert list(results['status'][:4]) == ['ok'] * 4
+    assert results['status'][4] != 'ok'
+    assert (results['seconds'] > 0).all()
+
+    # outputs are complete files and no temporary file is left
+    assert sorted(os.listdir(str(tmp_path))) == ['bar_MA.png', 'bar_playcount.svg', 'cloud.png', 'tags.svg']
+
+
+def test_render_batch_shared(tmp_path):
+    """
+    Test that workers render from the dataset published in shared memory
+    """
+    pytest.importorskip('multiprocessing.shared_memory')
+    specs = [ChartSpec('artist_barplot', str(tmp_path / 'bar.png'), metric='playcount'),
+             ChartSpec('tag_graph', str(tmp_path / 'tags.png'), n_tags=8)]
+
+    results = render_batch(specs, DATASET, n_workers=2, shared=True)
+    assert list(results['status']) == ['ok', 'ok']
+    assert sorted(os.listdir(str(tmp_path))) == ['bar.png', 'tags.png']
@@ -0,0 +1,68 @@
+"""
+Test routines for the dataset shared between processes
+"""
+
+import pytest
+
+# shared memory needs Python 3.8
+pytest.importorskip('multiprocessing.shared_memory')
+
+import metalhistory.visualization_api as vis
+from metalhistory.shared_dataset import SharedDataset
+
+import os
+import multiprocessing
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def worker_statistics(shared):
+    """
+    Statistics computed in a worker process attached to the shared dataset.
+    """
+    df = vis.load_data(shared)
+    plan = vis.AggregationPlan('playcount', ['mean', 'max'], top_k=10)
+    return vis.artist_statistics(plan, 3, df), df['MA_score'].to_numpy().flags.writeable
+
+
+def test_shared_dataset():
+    """
+    Test that the shared dataset is the compact dataset, without copy
+    """
+    df = pd.read_csv(DATASET)
+    with SharedDataset.publish(df) as shared:
+        shared_df = vis.load_data(shared)
+        oracle_df = vis.load_data(df, compact=True)
+
+        assert list(shared_df.columns) == list(oracle_df.columns)
+        for column in oracle_df.columns:
+            assert shared_df[column].astype(object).fillna('').tolist() == oracle_df[column].astype(object).fillna('').tolist()
+
+        # columns are read-only views of the shared memory, built once per process
+        assert not shared_df['MA_score'].to_numpy().flags.writeable
+        assert vis.load_data(shared) is shared_df
+
+        # the tags of every album are encoded in flat arrays
+        codes, offsets, names = shared.tag_lists()
+        assert len(offsets) == len(df) + 1
+        first = df['tags'].fillna('').str.len().gt(2).idxmax()
+        assert str([names[c] for c in codes[offsets[first]:offsets[first + 1]]]) == df['tags'][first]
+
+
+def test_shared_dataset_workers():
+    """
+    Test that worker processes compute from the shared dataset
+    """
+    df = pd.read_csv(DATASET)
+    oracle_stats = vis.artist_statistics(vis.AggregationPlan('playcount', ['mean', 'max'], top_k=10), 3, df)
+
+    with SharedDataset.publish(df) as shared:
+        with multiprocessing.get_context('spawn').Pool(2) as pool:
+            results = pool.map(worker_statistics, [shared, shared])
+
+    for stats, writeable in results:
+        assert not writeable
+        pd.testing.assert_frame_equal(stats.astype(float), oracle_stats.astype(float),
+                                      check_names=False, check_index_type=False, check_categorical=False)
@@ -0,0 +1,62 @@
+"""
+Test routines for the synthetic dataset generator
+"""
+
+from metalhistory.synthetic import generate_albums, write_dataset
+import metalhistory.visualization_api as vis
+
+import ast
+import os
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_generate_albums():
+    """
+    Test the schema of the synthetic albums and that a seed gives the same albums for any chunk size
+    """
+    df = pd.concat(generate_albums(5000, seed=3, chunksize=5000), ignore_index=True)
+    assert list(df.columns) == list(pd.read_csv(DATASET, nrows=1).columns)
+    assert len(df) == 5000
+    chunked = pd.concat(generate_albums(5000, seed=3, chunksize=1234), ignore_index=True)
+    pd.testing.assert_frame_equal(df, chunked)
+    assert not df.equals(pd.concat(generate_albums(5000, seed=4), ignore_index=True))
+
+    # many artists have one album and a few have many
+    albums = df['MA_artist'].value_counts()
+    assert albums.max() >= 10 and (albums == 1).mean() > 0.5
+    # the oracle knows that tags and images are python list literals, as in the processed dataset
+    tags = df['tags'].dropna().map(ast.literal_eval)
+    assert tags.map(len).max() <= 5
+    assert len(ast.literal_eval(df['image'].dropna().iloc[0])) == 6
+    assert df['0'].dtype == 'float64'
+
+    # albums are unique per artist, also for the artists spanning two blocks of the generator
+    df = pd.concat(generate_albums(70000, seed=3, chunksize=30000), ignore_index=True)
+    assert not df.duplicated(['MA_artist', 'MA_album']).any()
+
+
+def test_write_dataset(tmp_path):
+    """
+    Test that the csv and pickle parts datasets are read by the visualizations
+    """
+    csv_name = str(tmp_path / 'synthetic.csv')
+    parts_name = str(tmp_path / 'synthetic')
+    done = []
+    write_dataset(csv_name, 2500, seed=1, chunksize=1000, progress=done.append)
+    write_dataset(parts_name, 2500, seed=1, chunksize=1000)
+    assert done == [1000, 2000, 2500]
+    assert sorted(os.listdir(parts_name)) == ['part-00000.pkl', 'part-00001.pkl', 'part-00002.pkl']
+
+    from_csv = vis.load_data(csv_name)
+    from_parts = vis.load_data(parts_name)
+    pd.testing.assert_frame_equal(from_csv[['MA_artist', 'MA_score']], from_parts[['MA_artist', 'MA_score']])
+    assert sum(len(chunk) for chunk in vis.iter_chunks(parts_name, 700)) == 2500
+
+    plan = vis.AggregationPlan('playcount', ['mean'])
+    pd.testing.assert_frame_equal(vis.artist_statistics(plan, 3, parts_name),
+                                  vis.artist_statistics(plan, 3, csv_name, chunksize=700))
+    vis.tag_graph(file_name=str(tmp_path / 'tag_graph.svg'), dataset=parts_name)
+    assert os.path.getsize(tmp_path / 'tag_graph.svg') > 0
@@ -0,0 +1,85 @@
+"""
+Test routines for the analytics of the tag network
+"""
+
+from metalhistory.tag_analytics import TagMatrix, pagerank, eigenvector_centrality, label_propagation, tag_table, community_table
+from metalhistory.graph_renderer import TagGraphRenderer
+import metalhistory.visualization_api as vis
+
+import itertools
+import math
+import os
+import numpy as np
+import pandas as pd
+from collections import Counter
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_tag_matrix():
+    """
+    Test the cooccurrence counts and their NPMI
+    """
+    tag_lists = vis.generate_tag_cooccurrence_list_from_df(pd.read_csv(DATASET))
+    matrix = TagMatrix.from_tag_lists(tag_lists)
+    counts = Counter()
+    for tags in tag_lists:
+        counts.update(itertools.combinations(sorted(set(tags)), 2))
+    pairs = {tuple(sorted((matrix.tags[a], matrix.tags[b]))): c for a, b, c in zip(matrix.rows, matrix.cols, matrix.counts)}
+    assert pairs == dict(counts)
+
+    chunked = TagMatrix.from_dataset(DATASET, chunksize=128)
+    assert chunked.tags == matrix.tags and chunked.n_albums == matrix.n_albums
+    assert np.array_equal(chunked.counts, matrix.counts) and np.array_equal(chunked.rows, matrix.rows)
+
+    # the oracle knows that a and b are found together in 1 of 4 albums, a in 2 and b in 2
+    matrix = TagMatrix.from_tag_lists([['a', 'b'], ['a'], ['b', 'c'], ['c']])
+    edges = matrix.edges().set_index(['tag_a', 'tag_b'])
+    npmi = math.log(0.25 / (0.5 * 0.5)) / -math.log(0.25)
+    assert math.isclose(edges.loc[('a', 'b'), 'npmi'], npmi, abs_tol=1e-12)
+    assert math.isclose(edges.loc[('b', 'c'), 'npmi'], npmi, abs_tol=1e-12)
+
+
+def test_centrality_and_communities():
+    """
+    Test the centralities and communities of two scenes of tags linked by a bridge
+    """
+    scene_a = ['a%d' % i for i in range(6)]
+    scene_b = ['b%d' % i for i in range(6)]
+    tag_lists = [list(pair) for pair in itertools.combinations(scene_a, 2)] \
+        + [list(pair) for pair in itertools.combinations(scene_b, 2)] + [['a0', 'b0']]
+    matrix = TagMatrix.from_tag_lists(tag_lists)
+
+    for weight in ['count', 'npmi']:
+        ranks = pagerank(matrix, weight)
+        assert math.isclose(ranks.sum(), 1)
+        communities = label_propagation(matrix, weight)
+        # the oracle knows that each scene is one community
+        assert len(set(communities[:6])) == 1 and len(set(communities[6:])) == 1
+        assert communities[0] != communities[-1]
+
+    # the bridge tags are the most central ones
+    table = tag_table(matrix, 'count')
+    assert set(table.index[:2]) == {'a0', 'b0'}
+    centrality = eigenvector_centrality(matrix, 'count')
+    assert math.isclose(np.linalg.norm(centrality), 1)
+    assert centrality[matrix.tags.index('a0')] == centrality.max()
+
+    communities = community_table(table, n_tags=1)
+    assert communities['tags'].tolist() == [6, 6]
+    assert sorted(communities['top_tags']) == ['a0', 'b0']
+
+
+def test_tag_graph_color_by(tmp_path):
+    """
+    Test that the tags of tag graphs are colored by community
+    """
+    renderer = TagGraphRenderer(fig_size=(6, 5), dpi=50)
+    fig = vis.tag_graph(12, dataset=DATASET, file_name=str(tmp_path / 'tag_graph.png'), renderer=renderer, color_by='community')
+    # the node collections are the shadows and the colored nodes
+    nodes = [c for c in fig.axes[0].collections if len(c.get_offsets()) == 12]
+    assert len(np.unique(nodes[-1].get_facecolors(), axis=0)) > 1
+
+    fig = vis.tag_graph(12, dataset=DATASET, file_name=str(tmp_path / 'chunked.png'), renderer=renderer, chunksize=300, color_by='pagerank')
+    assert os.path.isfile(str(tmp_path / 'chunked.png'))
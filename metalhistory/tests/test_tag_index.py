@@ -0,0 +1,101 @@
+"""
+Test routines for the inverted tag index
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.tag_index import TagIndex, TagQuery, encode_postings, decode_postings, filter_by_tags, tag_mask
+
+import os
+import numpy as np
+import pandas as pd
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def oracle_df():
+    """
+    Small dataset with known tags per album.
+    """
+    return pd.DataFrame({
+        'album': ['A', 'B', 'C', 'D', 'E'],
+        'tags': ["['thrash metal', 'bay area']", "['thrash metal']", np.nan,
+                 "['bay area', 'crossover thrash']", "['thrash metal', 'bay area', 'crossover thrash']"],
+        'playcount': [10., 50., 100., 20., 30.]})
+
+
+def test_tag_queries():
+    """
+    Test AND, OR and NOT queries on the index
+    """
+    index = TagIndex(oracle_df())
+
+    assert sorted(index.tags()) == ['bay area', 'crossover thrash', 'thrash metal']
+    assert list(index.albums('thrash metal')) == [0, 1, 4]
+    assert list(index.albums('unknown tag')) == []
+
+    assert list(index.query(TagQuery(all_of=['thrash metal', 'bay area']))) == [0, 4]
+    assert list(index.query(TagQuery(any_of=['thrash metal', 'crossover thrash']))) == [0, 1, 3, 4]
+    assert list(index.query(TagQuery(none_of=['bay area']))) == [1, 2]
+
+    # nested query: bay area albums that are thrash metal or crossover, but not both
+    both = TagQuery(all_of=['thrash metal', 'crossover thrash'])
+    query = TagQuery(all_of=['bay area'], any_of=['thrash metal', 'crossover thrash'], none_of=[both])
+    assert list(index.query(query)) == [0, 3]
+
+    # the mask of the chunks matches the same albums as the index
+    for q in ['thrash metal', TagQuery(none_of=['bay area']), query]:
+        assert list(np.flatnonzero(tag_mask(oracle_df(), q))) == list(index.query(q))
+
+
+def test_top_k():
+    """
+    Test that the top albums of a query are ranked by the metric
+    """
+    index = TagIndex(oracle_df())
+    query = TagQuery(any_of=['thrash metal', 'bay area'])
+
+    assert list(index.top_k(query, 'playcount', 2)) == [1, 4]
+    assert list(oracle_df().iloc[index.top_k(query, 'playcount')]['album']) == ['B', 'E', 'D', 'A']
+
+
+def test_postings_encoding():
+    """
+    Test that posting lists are compressed and decoded without loss
+    """
+    positions = np.array([3, 7, 200, 1000, 70000])
+    deltas = encode_postings(positions)
+
+    assert deltas.dtype == np.uint32
+    assert list(decode_postings(deltas)) == list(positions)
+    assert encode_postings(np.array([1, 2, 3])).dtype == np.uint8
+
+
+def test_filtered_artist_statistics():
+    """
+    Test that tag queries give the same statistics in memory and in chunks
+    """
+    df = pd.read_csv(DATASET)
+    query = TagQuery(all_of=['thrash metal'])
+    plan = vis.AggregationPlan('playcount', ['mean', 'min', 'max'], top_k=10)
+
+    filtered_df = filter_by_tags(df, query)
+    assert len(filtered_df) > 0
+    assert all('thrash metal' in tags for tags in filtered_df['tags'])
+
+    oracle_stats = vis.artist_statistics(plan, 2, df, tag_query=query)
+    chunked_stats = vis.artist_statistics(plan, 2, df, chunksize=100, tag_query=query)
+    pd.testing.assert_frame_equal(chunked_stats, oracle_stats, check_exact=True)
+
+
+def test_dataset_tag_index():
+    """
+    Test that the tag index of a dataset is built once and reused by the tag queries
+    """
+    index = vis.dataset_tag_index(DATASET)
+    assert vis.dataset_tag_index(DATASET) is index
+    assert vis.dataset_tag_index(pd.read_csv(DATASET)) is not index
+
+    query = TagQuery(all_of=['thrash metal'])
+    df = vis.load_tagged(DATASET, query)
+    pd.testing.assert_frame_equal(df, filter_by_tags(pd.read_csv(DATASET), query))
@@ -0,0 +1,86 @@
+"""
+Test routines for the zoomable tile pyramid
+"""
+
+import metalhistory.visualization_api as vis
+from metalhistory.cover_cache import CoverCache
+from metalhistory.tile_pyramid import TilePyramid
+
+import io
+import os
+import numpy as np
+import pytest
+from PIL import Image
+
+from .test_cover_cache import FakeServer
+
+# get path of the dataset
+DATASET = os.path.abspath(__file__ + "/../../../") + '/data/proc_MA_1k_albums.csv'
+
+
+def test_pyramid_levels():
+    """
+    Test the zoom levels and tile grid of the XYZ scheme
+    """
+    pyramid = TilePyramid([], 1000, 600, tile_size=256)
+
+    # the oracle knows that 1000 pixels need 4 tiles of 256 pixels, i.e. 2 zoom levels
+    assert pyramid.max_zoom == 2
+    assert pyramid.level_size(0) == (250, 150)
+    assert pyramid.n_tiles(0) == (1, 1)
+    assert pyramid.n_tiles(2) == (4, 3)
+
+    with pytest.raises(ValueError):
+        pyramid.get_tile(3, 0, 0)
+    with pytest.raises(ValueError):
+        pyramid.get_tile(2, 4, 0)
+
+
+def test_pyramid_tiles(tmp_path):
+    """
+    Test that tiles only load their covers, are cached, and match the full mosaic
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path / 'covers'), fetch=server.fetch)
+    pyramid = vis.album_cover_pyramid(num_albums=10, width=512, height=288, dataset=DATASET, cache=cache,
+                                      tile_size=128, tile_dir=str(tmp_path / 'tiles'))
+
+    # the most played album is in the upper left tile, at full resolution
+    tile = Image.open(io.BytesIO(pyramid.get_tile(2, 0, 0)))
+    assert tile.size == (128, 128)
+    assert 0 < len(server.requests) < 10
+    assert os.path.exists(str(tmp_path / 'tiles' / pyramid.layout_key / '2' / '0' / '0.png'))
+
+    # cached tiles are not rendered again
+    requests = len(server.requests)
+    pyramid.rendered.clear()
+    assert pyramid.get_tile(2, 0, 0) == pyramid.get_tile(2, 0, 0)
+    assert len(server.requests) == requests
+
+    # zoom 0 shows the whole mosaic downscaled
+    oracle_img = vis.album_covers(num_albums=10, width=512, height=288, dataset=DATASET, image_name=None, cache=cache)
+    tile = Image.open(io.BytesIO(pyramid.get_tile(0, 0, 0)))
+    assert tile.size == (128, 72)
+    difference = np.abs(np.asarray(tile, dtype=int) - np.asarray(oracle_img.resize((128, 72)), dtype=int))
+    assert np.median(difference) < 2
+
+    # the oracle knows that a pyramid of another layout renders its own tiles
+    other = vis.album_cover_pyramid(num_albums=5, width=512, height=288, dataset=DATASET, cache=cache,
+                                    tile_size=128, tile_dir=str(tmp_path / 'tiles'))
+    assert other.layout_key != pyramid.layout_key
+    assert other.get_tile(2, 0, 0) != pyramid.get_tile(2, 0, 0)
+
+
+def test_pyramid_defaults(tmp_path):
+    """
+    Test the pyramid of the top 1000 albums of the dataset, with the default arguments
+    """
+    server = FakeServer()
+    cache = CoverCache(str(tmp_path), fetch=server.fetch)
+    pyramid = vis.album_cover_pyramid(cache=cache)
+
+    # the oracle knows that 65536 pixels need 256 tiles of 256 pixels, i.e. 8 zoom levels
+    assert pyramid.max_zoom == 8
+    tile = Image.open(io.BytesIO(pyramid.get_tile(8, 0, 0)))
+    assert tile.size == (256, 256)
+    assert 0 < len(server.requests) < 10
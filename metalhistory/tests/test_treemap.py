@@ -0,0 +1,44 @@
+"""
+Test routines for the vectorized treemap layout
+"""
+
+from metalhistory import treemap
+
+import math
+import numpy as np
+import squarify
+
+
+def test_same_layout_as_squarify():
+    """
+    Test that the rectangles are exactly those of the squarify package
+    """
+    values = np.sort(np.random.RandomState(0).pareto(1.2, 500) + 1)[::-1]
+
+    # the oracle is squarify itself
+    oracle_rects = squarify.squarify(squarify.normalize_sizes(list(values), 720, 1280), 0., 0., 720, 1280)
+    rects = treemap.squarify(treemap.normalize_sizes(values, 720, 1280), 0., 0., 720, 1280)
+
+    assert rects.shape == (500, 4)
+    assert np.array_equal(rects, [[r['x'], r['y'], r['dx'], r['dy']] for r in oracle_rects])
+
+    # integer boxes as they were computed before
+    boxes = treemap.treemap_boxes(values, 1280, 720)
+    for box, r in zip(boxes, oracle_rects):
+        assert tuple(box) == (max(0, math.floor(r['y'])), max(0, math.floor(r['x'])),
+                              min(1280, math.ceil(r['y'] + r['dy'])), min(720, math.ceil(r['x'] + r['dx'])))
+
+
+def test_layout_cache():
+    """
+    Test that layouts are cached by values and image size
+    """
+    values = np.arange(2000, 0, -1, dtype=float)
+
+    boxes = treemap.treemap_boxes(values, 4000, 3000)
+    assert treemap.treemap_boxes(values.copy(), 4000, 3000) is boxes
+    assert treemap.treemap_boxes(values, 3000, 3000) is not boxes
+    assert not boxes.flags.writeable
+
+    # large layouts do not hit the recursion limit of squarify
+    assert treemap.treemap_boxes(np.arange(20000, 0, -1, dtype=float), 16384, 9216).shape == (20000, 4)
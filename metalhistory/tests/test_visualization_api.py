@@ -8,6 +8,7 @@ import os
 from pathlib import Path
 from PIL import Image
 
+import numpy as np
 import pandas as pd
 import networkx as nx
 import pytest
@@ -205,6 +206,23 @@ def test_generate_wordcloud():
     assert oracle_isthere == test_file.is_file()
 
 
+def test_word_cloud_from_frequencies():
+    """
+    Test the word cloud generation from a frequency series, without text file
+    """
+
+    # the oracle knows the words and their sizes
+    oracle_series = pd.Series({'Iron Maiden': 3., 'Slayer': 1., 'Unknown': np.nan})
+
+    array = vis.generate_word_cloud_from_frequencies(oracle_series, 2, None)
+    assert array.ndim == 3 and array.shape[2] == 3
+
+    # artist names are not split into words, and missing values are left out
+    renderer, _ = vis.word_cloud_renderer(2, None)
+    assert sorted(word for (word, _), *_ in renderer.layout_) == ['Iron Maiden', 'Slayer']
+    assert vis.word_cloud_renderer(2, None)[0] is renderer
+
+
 def test_wordcloud_MA():
     """
     Test the artist cloud function with the MA score metric
@@ -403,4 +421,78 @@ def test_tag_graph():
 
     test_file = Path(test_image)
 
-    assert oracle_isthere == test_file.is_file()
\ No newline at end of file
+    assert oracle_isthere == test_file.is_file()
+
+def test_chunked_artist_statistics():
+    """
+    Test that streaming the dataset in chunks gives the in-memory statistics
+    """
+    df = pd.read_csv(DATASET)
+    plan = vis.AggregationPlan('MA_score', ['mean', 'min', 'max'], top_k=30)
+
+    oracle_df = vis.artist_statistics(plan, 5, df)
+    for chunksize in [7, 100, 1000]:
+        chunked_df = vis.artist_statistics(plan, 5, df, chunksize=chunksize)
+        pd.testing.assert_frame_equal(chunked_df, oracle_df, check_exact=True)
+
+
+def test_generate_tag_network_chunked():
+    """
+    Test that the tag network built from chunks is the in-memory tag network
+    """
+    tag_cooccurrence_list = vis.generate_tag_cooccurrence_list_from_df(pd.read_csv(DATASET))
+    unique_tags = vis.generate_unique_tag_from_list(tag_cooccurrence_list)
+    oracle_G = vis.generate_tag_network(tag_cooccurrence_list, unique_tags)
+
+    G = vis.generate_tag_network_chunked(DATASET, chunksize=64)
+
+    assert dict(G.nodes(data='weight')) == dict(oracle_G.nodes(data='weight'))
+    assert nx.utils.edges_equal(G.edges(data='weight'), oracle_G.edges(data='weight'))
+
+
+def test_compact_dataset():
+    """
+    Test the compact representation of the dataset
+    """
+    df = vis.load_data(DATASET)
+    compact_df = vis.load_data(DATASET, compact=True)
+
+    # unused columns and the list of image urls are dropped
+    for column in vis.UNUSED_COLUMNS + ['image']:
+        assert column not in compact_df.columns
+    assert str(compact_df['MA_artist'].dtype) == 'category'
+    assert str(compact_df['playcount'].dtype) == 'UInt32'
+
+    # the oracle knows that the compact dataset is at least 3 times smaller
+    assert vis.dataset_footprint(compact_df)['bytes_per_row'] * 3 < vis.dataset_footprint(df)['bytes_per_row']
+
+    # the cover urls can be recovered from the image ids
+    oracle_url = 'https://lastfm.freetls.fastly.net/i/u/300x300/33a8234de2a442c6c294b985e8aebb2c.png'
+    assert vis.cover_url(compact_df['image_id'][0]) == oracle_url
+    assert vis.cover_url(compact_df['image_id'][0], 'small') == oracle_url.replace('300x300', '34s')
+
+    # the statistics do not depend on the representation
+    plan = vis.AggregationPlan('playcount', ['mean', 'min', 'max'], top_k=30)
+    oracle_stats = vis.artist_statistics(plan, 5, df)
+    stats = vis.artist_statistics(plan, 5, compact_df)
+    assert list(stats.index) == list(oracle_stats.index)
+    assert (stats.astype(float).to_numpy() == oracle_stats.to_numpy()).all()
+
+
+def test_cover_size_selection():
+    """
+    Test that the smallest LastFM image covering a rectangle is selected
+    """
+    assert vis.cover_size_name((20, 20)) == 'small'
+    assert vis.cover_size_name((34, 10)) == 'small'
+    assert vis.cover_size_name((35, 10)) == 'medium'
+    assert vis.cover_size_name((100, 174)) == 'large'
+    assert vis.cover_size_name((1000, 700)) == 'extralarge'
+
+    oracle_images = str([{'#text': 'http://covers/34s/a.png', 'size': 'small'},
+                         {'#text': '', 'size': 'medium'},
+                         {'#text': 'http://covers/174s/a.png', 'size': 'large'}])
+    assert vis.format_image_str(oracle_images, 'small') == 'http://covers/34s/a.png'
+    # missing sizes fall back to the largest available image
+    assert vis.format_image_str(oracle_images, 'medium') == 'http://covers/174s/a.png'
+    assert vis.format_image_str(oracle_images) == 'http://covers/174s/a.png'
@@ -0,0 +1,229 @@
+"""
+Zoomable tile pyramid of album cover mosaics, rendered on demand
+"""
+
+import collections
+import hashlib
+import io
+import math
+import os
+import threading
+import warnings
+
+import numpy as np
+from PIL import Image
+
+from .mosaic import PLACEHOLDER_COLOR, open_cover, map_bounded, render_region
+
+
+class TilePyramid():
+    def __init__(self, tiles, width, height, tile_size=256, cache=None, tile_dir=None, max_tiles=1024, n_workers=8):
+        """
+        Zoomable view of a mosaic layout, following the XYZ tile scheme of web maps:
+        zoom 0 fits the whole mosaic in a single tile, every following zoom level
+        doubles the resolution, up to max_zoom where one mosaic pixel is one tile
+        pixel. Tile (x, y) of a level covers the pixels [x * tile_size, (x + 1) * tile_size)
+        horizontally and [y * tile_size, (y + 1) * tile_size) vertically; tiles at the
+        right and bottom edges are cropped to the mosaic.
+
+        A tile is only rendered when it is requested, from the covers intersecting it,
+        loaded at the resolution they are displayed at in this zoom level. Rendered
+        tiles are kept in memory (least recently used first out) and, if tile_dir is
+        given, on disk as tile_dir/{layout}/{z}/{x}/{y}.png, layout being a hash of the
+        covers, their boxes, the mosaic size and the tile size, so that pyramids of
+        different layouts never serve each other's tiles.
+
+        Parameters
+        ----------
+
+        tiles : List of (url, box) pairs, box being (left, upper, right, lower) in the mosaic
+
+        width : Width of the mosaic at the largest zoom level
+
+        height : Height of the mosaic at the largest zoom level
+
+        tile_size : Side of the tiles in pixels
+
+        cache : CoverCache used to get the covers (or None to download them)
+
+        tile_dir : Directory of the rendered tiles (or None to keep them in memory only)
+
+        max_tiles : Number of encoded tiles kept in memory
+
+        n_workers : Number of threads loading the covers of a tile
+
+
+        Examples
+        ----------
+        >>> import metalhistory.visualization_api as vis
+        >>> from metalhistory.cover_cache import CoverCache
+        >>>
+        >>> pyramid = vis.album_cover_pyramid(num_albums=5000, width=65536, height=36864, cache=CoverCache())
+        >>> png = pyramid.get_tile(3, 2, 1)
+
+        """
+        assert isinstance(width, int) and width > 0, "'width' must be an int larger than 0."
+        assert isinstance(height, int) and height > 0, "'height' must be an int larger than 0."
+        assert isinstance(tile_size, int) and tile_size > 0, "'tile_size' must be an int larger than 0."
+        assert tile_dir is None or isinstance(tile_dir, str), "'tile_dir' must be None or str."
+
+        self.urls = [url for url, _ in tiles]
+        self.boxes = np.array([box for _, box in tiles], dtype=np.int64).reshape(-1, 4)
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.cache = cache
+        self.tile_dir = tile_dir
+        self.max_tiles = max_tiles
+        self.n_workers = n_workers
+        self.max_zoom = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+        self.layout_key = self._layout_key()
+
+        self.lock = threading.Lock()
+        self.rendered = collections.OrderedDict()
+
+
+    def scale(self, zoom):
+        """
+        Scale of a zoom level relative to the mosaic.
+        """
+        return 2.0 ** (zoom - self.max_zoom)
+
+
+    def level_size(self, zoom):
+        """
+        (width, height) of the mosaic at a zoom level.
+        """
+        scale = self.scale(zoom)
+        return max(1, math.ceil(self.width * scale)), max(1, math.ceil(self.height * scale))
+
+
+    def n_tiles(self, zoom):
+        """
+        Number of tiles (columns, rows) of a zoom level.
+        """
+        level_width, level_height = self.level_size(zoom)
+        return math.ceil(level_width / self.tile_size), math.ceil(level_height / self.tile_size)
+
+
+    def render_tile(self, zoom, x, y):
+        """
+        Render a tile, without using the tile cache.
+
+        Parameters
+        ----------
+
+        zoom : Zoom level, from 0 to max_zoom
+
+        x : Column of the tile
+
+        y : Row of the tile
+
+        Raises
+        ----------
+
+        ValueError : If the tile is not in the pyramid
+
+        Returns
+        ----------
+
+        The tile as a PIL Image object
+        """
+        self._check(zoom, x, y)
+        scale = self.scale(zoom)
+        level_width, level_height = self.level_size(zoom)
+        region = (x * self.tile_size, y * self.tile_size,
+                  min(level_width, (x + 1) * self.tile_size), min(level_height, (y + 1) * self.tile_size))
+
+        # boxes of the covers at this zoom level, the ones intersecting the tile are loaded
+        boxes = np.empty_like(self.boxes)
+        boxes[:, :2] = np.floor(self.boxes[:, :2] * scale)
+        boxes[:, 2:] = np.maximum(np.ceil(self.boxes[:, 2:] * scale), boxes[:, :2] + 1)
+        hits = np.flatnonzero((boxes[:, 0] < region[2]) & (boxes[:, 2] > region[0]) &
+                              (boxes[:, 1] < region[3]) & (boxes[:, 3] > region[1]))
+
+        def load(i):
+            box = tuple(int(v) for v in boxes[i])
+            try:
+                return box, open_cover(self.urls[i], (box[2] - box[0], box[3] - box[1]), self.cache)
+            except Exception as e:
+                warnings.warn('Could not load cover %s (%s), using a placeholder.' % (self.urls[i], e))
+                return box, Image.new('RGB', (1, 1), PLACEHOLDER_COLOR)
+
+        return render_region(list(map_bounded(load, hits, self.n_workers)), region)
+
+
+    def get_tile(self, zoom, x, y):
+        """
+        Get a tile encoded as PNG, rendering it only if it is not cached.
+
+        Parameters
+        ----------
+
+        zoom : Zoom level, from 0 to max_zoom
+
+        x : Column of the tile
+
+        y : Row of the tile
+
+        Raises
+        ----------
+
+        ValueError : If the tile is not in the pyramid
+
+        Returns
+        ----------
+        bytes
+            Encoded PNG image.
+        """
+        self._check(zoom, x, y)
+        key = (zoom, x, y)
+        with self.lock:
+            if key in self.rendered:
+                self.rendered.move_to_end(key)
+                return self.rendered[key]
+
+        path = self.tile_path(zoom, x, y)
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as file:
+                data = file.read()
+        else:
+            buffer = io.BytesIO()
+            self.render_tile(zoom, x, y).save(buffer, format='PNG')
+            data = buffer.getvalue()
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.tmp', 'wb') as file:
+                    file.write(data)
+                os.replace(path + '.tmp', path)
+
+        with self.lock:
+            self.rendered[key] = data
+            while len(self.rendered) > self.max_tiles:
+                self.rendered.popitem(last=False)
+        return data
+
+
+    def tile_path(self, zoom, x, y):
+        """
+        Path of a tile on disk (or None if tiles are only kept in memory).
+        """
+        if self.tile_dir is None:
+            return None
+        return os.path.join(self.tile_dir, self.layout_key, str(zoom), str(x), '%d.png' % y)
+
+
+    def _layout_key(self):
+        # hash of everything the pixels of the tiles depend on
+        h = hashlib.sha1(repr((self.width, self.height, self.tile_size)).encode('utf-8'))
+        h.update('\n'.join(self.urls).encode('utf-8'))
+        h.update(self.boxes.tobytes())
+        return h.hexdigest()[:16]
+
+
+    def _check(self, zoom, x, y):
+        if not (isinstance(zoom, int) and 0 <= zoom <= self.max_zoom):
+            raise ValueError('Zoom level %s is not between 0 and %d.' % (zoom, self.max_zoom))
+        columns, rows = self.n_tiles(zoom)
+        if not (isinstance(x, int) and isinstance(y, int) and 0 <= x < columns and 0 <= y < rows):
+            raise ValueError('Tile (%s, %s) is not in zoom level %d of %dx%d tiles.' % (x, y, zoom, columns, rows))
@@ -0,0 +1,152 @@
+"""
+Vectorized squarified treemap layout, with a cache of computed layouts
+"""
+
+import collections
+import hashlib
+import threading
+
+import numpy as np
+
+
+# number of layouts kept by treemap_boxes
+LAYOUT_CACHE_SIZE = 32
+
+_layout_cache = collections.OrderedDict()
+_layout_lock = threading.Lock()
+
+
+def normalize_sizes(sizes, dx, dy):
+    """
+    Scale values so that they sum up to the area dx * dy, like squarify.normalize_sizes.
+
+    Parameters
+    ----------
+
+    sizes : Array of positive values
+
+    dx : Width of the rectangle
+
+    dy : Height of the rectangle
+
+    Returns
+    ----------
+    ndarray
+        The normalized values as floats.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    # sequential sum, as the sum of squarify
+    total_size = np.cumsum(sizes)[-1]
+    return sizes * float(dx * dy) / total_size
+
+
+def squarify(sizes, x, y, dx, dy):
+    """
+    Compute the squarified treemap of normalized values (Bruls, Huizing and van Wijk),
+    giving the same rectangles as squarify.squarify.
+
+    The values are laid out in rows along the shorter side of the remaining rectangle.
+    The worst aspect ratio of the candidate rows of every length is computed at once
+    from cumulative sums, maxima and minima, so each row costs a few array operations
+    and there is no recursion.
+
+    Parameters
+    ----------
+
+    sizes : Array of positive values, sorted in decreasing order and normalized to dx * dy
+
+    x, y : Origin of the rectangle
+
+    dx, dy : Size of the rectangle
+
+    Returns
+    ----------
+    ndarray
+        Array of shape (n, 4) with the x, y, dx and dy of every rectangle.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    n = len(sizes)
+    rects = np.empty((n, 4))
+
+    start = 0
+    while start < n:
+        # shortest prefix of the remaining values after which the worst aspect ratio increases
+        window = 64
+        while True:
+            candidates = sizes[start:start + window]
+            areas = np.cumsum(candidates)
+            side = dy if dx >= dy else dx
+            widths = areas / side
+            # the worst ratio of a row is reached by its largest or smallest rectangle
+            largest = np.maximum.accumulate(candidates) / widths
+            smallest = np.minimum.accumulate(candidates) / widths
+            worst = np.maximum.reduce([widths / largest, largest / widths, widths / smallest, smallest / widths])
+            increases = np.flatnonzero(~(worst[:-1] >= worst[1:]))
+            if len(increases) > 0 or start + window >= n:
+                break
+            window *= 2
+        length = increases[0] + 1 if len(increases) > 0 else len(candidates)
+
+        row = sizes[start:start + length]
+        width = areas[length - 1] / side
+        if dx >= dy:
+            # the row fills the height dy, starting at x
+            offsets = np.cumsum(np.concatenate([[y], row / width]))[:-1]
+            rects[start:start + length] = np.column_stack([np.full(length, x), offsets,
+                                                           np.full(length, width), row / width])
+            x, dx = x + width, dx - width
+        else:
+            # the row fills the width dx, starting at y
+            offsets = np.cumsum(np.concatenate([[x], row / width]))[:-1]
+            rects[start:start + length] = np.column_stack([offsets, np.full(length, y),
+                                                           row / width, np.full(length, width)])
+            y, dy = y + width, dy - width
+        start += length
+    return rects
+
+
+def treemap_boxes(values, width, height):
+    """
+    Squarified treemap of values as integer boxes in an image. Boxes are rounded
+    outwards, so neighbours may overlap by a pixel but never leave gaps. Layouts
+    are cached by (values, width, height), so laying out the same data again is free.
+
+    Parameters
+    ----------
+
+    values : Positive values, sorted in decreasing order
+
+    width : Width of the image
+
+    height : Height of the image
+
+    Returns
+    ----------
+    ndarray
+        Read-only int array of shape (n, 4) with the (left, upper, right, lower) of every box.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    assert np.all(np.isfinite(values)) and np.all(values > 0), "'values' must be finite and larger than 0."
+
+    key = (hashlib.sha1(values.tobytes()).hexdigest(), width, height)
+    with _layout_lock:
+        if key in _layout_cache:
+            _layout_cache.move_to_end(key)
+            return _layout_cache[key]
+
+    if len(values) == 0:
+        boxes = np.empty((0, 4), dtype=np.int64)
+    else:
+        # as the original layout, x runs along the height and y along the width
+        rects = squarify(normalize_sizes(values, height, width), 0., 0., height, width)
+        boxes = np.column_stack([np.maximum(0, np.floor(rects[:, 1])),
+                                 np.maximum(0, np.floor(rects[:, 0])),
+                                 np.minimum(width, np.ceil(rects[:, 1] + rects[:, 3])),
+                                 np.minimum(height, np.ceil(rects[:, 0] + rects[:, 2]))]).astype(np.int64)
+    boxes.setflags(write=False)
+
+    with _layout_lock:
+        _layout_cache[key] = boxes
+        while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+            _layout_cache.popitem(last=False)
+    return boxes
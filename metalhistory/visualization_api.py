@@ -6,30 +6,69 @@ Class allowing some nice visualization of heavy metal data
 import numpy as np
 import pandas as pd
 import os
-import squarify
 import ast
-import math
-import requests
+import functools
+import sys
+import threading
 from PIL import Image
 import networkx as nx
 import itertools
+from collections import Counter, OrderedDict
 from heapq import nlargest
 
 from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+
+from .aggregation import AggregationPlan, partial_aggregate, merge_partials
+from .aggregate_store import AggregateStore, METRICS
+from .tag_index import TagIndex, filter_by_tags
+from .mosaic import cover_layout, load_covers, render_mosaic_tiled
+from .render_cache import cached_render, dataset_fingerprint
+from .figures import create_figure, bar_figure_size, save_figure
+from .profiling import profiled, stage
 
 
 DATASET = os.path.abspath(__file__ + "/../../") + '/data/proc_MA_1k_albums.csv'
 
-def load_data(dataset):
+# LastFM serves every album cover in several sizes under the same image id
+LASTFM_IMAGE_URL = 'https://lastfm.freetls.fastly.net/i/u/{size}/{image_id}'
+LASTFM_IMAGE_SIZES = {'small': '34s', 'medium': '64s', 'large': '174s', 'extralarge': '300x300'}
+# largest side in pixels of the LastFM image sizes
+LASTFM_IMAGE_PIXELS = {'small': 34, 'medium': 64, 'large': 174, 'extralarge': 300}
+
+# size in inches of the word cloud figures
+WORD_CLOUD_FIG_SIZE = (6.4, 4.8)
+
+# number of TagIndex of datasets kept in memory (see dataset_tag_index)
+MAX_TAG_INDEXES = 4
+# tag indexes by dataset fingerprint, in least recently used order
+_tag_indexes = OrderedDict()
+_tag_indexes_lock = threading.Lock()
+
+# columns of the processed dataset that are not used by the visualizations
+UNUSED_COLUMNS = ['0', 'ignored tags', 'mbid', 'url']
+
+def is_shared_dataset(dataset):
+    """
+    Whether a dataset is a SharedDataset handle. Shared memory needs Python 3.8,
+    so its module is only imported by the code publishing or unpickling handles.
     """
-    Loads a dataset as Pandas DataFrame. Inputs can be either a filepath to a csv, a Pandas DataFrame or None.
-    If None the dataset indicate in global constant is loaded.
+    module = sys.modules.get(__package__ + '.shared_dataset')
+    return module is not None and isinstance(dataset, module.SharedDataset)
+
+
+@profiled('load_data')
+def load_data(dataset, compact=False):
+    """
+    Loads a dataset as Pandas DataFrame. Inputs can be either a filepath to a csv or pickle (.pkl) file,
+    a directory of pickle parts (see synthetic.write_dataset), a Pandas DataFrame, a SharedDataset handle or None. If None the dataset indicate in global constant is loaded.
+    A SharedDataset is attached without copy and is always compact.
 
     Parameters
     ----------
 
-    dataset : Name of the input csv file or pandas dataframe
+    dataset : Name of the input csv file, pandas dataframe or SharedDataset
+
+    compact : If True, return the compact representation of the dataset (see compact_dataset)
 
     Returns:
     ----------
@@ -38,17 +77,292 @@ def load_data(dataset):
     """
     
     # Load data
-    assert dataset is None or isinstance(dataset, str) or isinstance(dataset, pd.DataFrame), "'dataset' must be None, str or pandas DataFrame"
+    assert dataset is None or isinstance(dataset, (str, pd.DataFrame)) or is_shared_dataset(dataset), "'dataset' must be None, str, pandas DataFrame or SharedDataset"
+    if is_shared_dataset(dataset):
+        return dataset.to_frame()
     if isinstance(dataset, pd.DataFrame):
         df = dataset
     elif dataset is not None:
-        df = pd.read_csv(dataset)
+        # datasets converted to pickle files (see the convert command) are loaded without parsing
+        if os.path.isdir(dataset):
+            df = pd.concat([pd.read_pickle(part) for part in dataset_parts(dataset)], ignore_index=True)
+        else:
+            df = pd.read_pickle(dataset) if dataset.endswith('.pkl') else pd.read_csv(dataset)
     else:
         df = pd.read_csv(DATASET)
+    if compact:
+        df = compact_dataset(df)
+    return df
+
+
+def dataset_parts(directory):
+    """
+    Pickle parts of a dataset stored as a directory, in order.
+
+    Parameters
+    ----------
+
+    directory : Name of the directory
+
+    Returns
+    ----------
+
+    List of file names
+    """
+    parts = sorted(name for name in os.listdir(directory) if name.endswith('.pkl'))
+    if len(parts) == 0:
+        raise ValueError("no .pkl parts in dataset directory '{}'".format(directory))
+    return [os.path.join(directory, name) for name in parts]
+
+
+@profiled('compact_dataset')
+def compact_dataset(df):
+    """
+    Compact in-memory representation of the processed dataset. Unused columns are
+    dropped, artist and album names are interned as categoricals (one dictionary
+    shared by e.g. 'artist' and 'MA_artist'), counts are downcast to the smallest
+    unsigned integer type and the list of image URLs is replaced by the LastFM image id.
+
+    Parameters
+    ----------
+
+    df : Processed album dataframe
+
+    Returns:
+    ----------
+
+    Compact dataframe, see dataset_footprint for its memory usage.
+    """
+
+    df = df.drop(columns=[c for c in UNUSED_COLUMNS if c in df.columns])
+
+    # the LastFM and Metal Archives names are the same for most albums, share one dictionary
+    for names in [['artist', 'MA_artist'], ['album', 'MA_album']]:
+        names = [c for c in names if c in df.columns]
+        if len(names) == 0:
+            continue
+        categories = pd.unique(pd.concat([df[c] for c in names]).dropna())
+        dtype = pd.CategoricalDtype(categories)
+        for c in names:
+            df[c] = df[c].astype(dtype)
+
+    for c in ['listeners', 'playcount']:
+        if c in df.columns:
+            df[c] = downcast_counts(df[c])
+
+    if 'tags' in df.columns:
+        df['tags'] = df['tags'].astype('category')
+
+    if 'image' in df.columns:
+        df['image_id'] = image_ids(df['image'])
+        df = df.drop(columns=['image'])
     return df
 
 
-def artist_barplot(min_albums=5, n_artists=30, metric='MA_score', file_name='./images/artist_bar.svg'):
+def downcast_counts(counts):
+    """
+    Downcast a column of counts to the smallest nullable unsigned integer type.
+
+    Parameters
+    ----------
+
+    counts : pandas Series of counts, possibly with missing values
+
+    Returns:
+    ----------
+
+    Downcast Series (unchanged if the values are not non-negative integers).
+    """
+
+    values = counts.dropna()
+    if len(values) == 0 or (values < 0).any() or (values % 1 != 0).any():
+        return counts
+    for dtype, largest in [('UInt8', 2**8), ('UInt16', 2**16), ('UInt32', 2**32)]:
+        if values.max() < largest:
+            return counts.astype(dtype)
+    return counts.astype('UInt64')
+
+
+def image_ids(images):
+    """
+    Extract the LastFM image id from the image column of the processed dataset.
+    Covers that are not hosted by LastFM keep their largest URL instead.
+
+    Parameters
+    ----------
+
+    images : pandas Series of image lists, as written by the LastFM API
+
+    Returns:
+    ----------
+
+    Series of image ids (see cover_url).
+    """
+
+    # the last entry of the list is the largest image
+    urls = images.str.extract(r"""["']#text["']: ["']([^"']*)["'][^{]*$""", expand=False)
+    urls = urls.replace('', np.nan)
+    prefix = LASTFM_IMAGE_URL.split('{size}')[0]
+    is_lastfm = urls.str.startswith(prefix, na=False)
+    urls[is_lastfm] = urls[is_lastfm].str.rsplit('/', n=1).str[-1]
+    return urls
+
+
+def cover_url(image_id, size='extralarge'):
+    """
+    URL of an album cover of the given size.
+
+    Parameters
+    ----------
+
+    image_id : LastFM image id (or full URL), as returned by image_ids
+
+    size : LastFM image size [small, medium, large, extralarge]
+
+    Returns:
+    ----------
+
+    URL string
+    """
+
+    if image_id.startswith('http'):
+        return image_id
+    return LASTFM_IMAGE_URL.format(size=LASTFM_IMAGE_SIZES[size], image_id=image_id)
+
+
+def dataset_footprint(df):
+    """
+    Memory footprint of a dataset. Category dictionaries shared by several
+    columns are counted once.
+
+    Parameters
+    ----------
+
+    df : Album dataframe
+
+    Returns:
+    ----------
+
+    Dictionary with the number of rows, the total bytes and the bytes per row.
+    """
+
+    total = df.index.memory_usage(deep=True)
+    seen_categories = set()
+    for c in df.columns:
+        column = df[c]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            total += column.cat.codes.nbytes
+            categories = column.cat.categories
+            if id(categories) not in seen_categories:
+                seen_categories.add(id(categories))
+                total += categories.memory_usage(deep=True)
+        else:
+            total += column.memory_usage(deep=True, index=False)
+    return {'rows': len(df), 'bytes': int(total), 'bytes_per_row': total / max(len(df), 1)}
+
+
+def iter_chunks(dataset, chunksize, columns=None):
+    """
+    Iterates over a dataset in chunks, so that at most chunksize rows are in memory at once.
+    Inputs can be either a filepath to a csv or pickle file, a directory of pickle parts,
+    a Pandas DataFrame or None. If None the dataset indicate in global constant is read.
+
+    Parameters
+    ----------
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    chunksize : Max number of rows per chunk
+
+    columns : List of columns to read (or None to read all of them)
+
+    Returns:
+    ----------
+
+    Iterator over Dataframes
+    """
+
+    assert dataset is None or isinstance(dataset, (str, pd.DataFrame)) or is_shared_dataset(dataset), "'dataset' must be None, str, pandas DataFrame or SharedDataset"
+    assert isinstance(chunksize, int) and chunksize > 0, "'chunksize' must be an int larger than 0."
+    if is_shared_dataset(dataset):
+        dataset = dataset.to_frame()
+    if isinstance(dataset, str) and os.path.isdir(dataset):
+        # parts are read one at a time
+        for part in dataset_parts(dataset):
+            yield from iter_chunks(pd.read_pickle(part), chunksize, columns)
+        return
+    if isinstance(dataset, str) and dataset.endswith('.pkl'):
+        dataset = pd.read_pickle(dataset)
+    if isinstance(dataset, pd.DataFrame):
+        df = dataset if columns is None else dataset[columns]
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    else:
+        reader = pd.read_csv(DATASET if dataset is None else dataset, usecols=columns, chunksize=chunksize)
+        for chunk in reader:
+            yield chunk
+
+
+def dataset_tag_index(dataset=None, df=None):
+    """
+    TagIndex of a dataset. The index is built once per dataset content and the
+    indexes of the last MAX_TAG_INDEXES datasets are kept for the next tag queries.
+
+    Parameters
+    ----------
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    df : The dataset already loaded with load_data (or None to load it)
+
+    Returns:
+    ----------
+
+    TagIndex of the dataset
+    """
+    fingerprint = dataset_fingerprint(DATASET if dataset is None else dataset)
+    with _tag_indexes_lock:
+        if fingerprint in _tag_indexes:
+            _tag_indexes.move_to_end(fingerprint)
+            return _tag_indexes[fingerprint]
+    index = TagIndex(load_data(dataset) if df is None else df)
+    with _tag_indexes_lock:
+        _tag_indexes[fingerprint] = index
+        while len(_tag_indexes) > MAX_TAG_INDEXES:
+            _tag_indexes.popitem(last=False)
+    return index
+
+
+def load_tagged(dataset, tag_query, tag_index=None):
+    """
+    Load a dataset and keep the albums matching a tag query.
+
+    Parameters
+    ----------
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    tag_query : TagQuery, or None to keep all albums
+
+    tag_index : TagIndex of the dataset (or None for the one cached per dataset)
+
+    Returns:
+    ----------
+
+    Dataframe of the matching albums
+    """
+    df = load_data(dataset)
+    if tag_query is None:
+        return df
+    if tag_index is None:
+        tag_index = dataset_tag_index(dataset, df)
+    return filter_by_tags(df, tag_query, tag_index)
+
+
+@profiled('chart.artist_barplot')
+@cached_render('file_name', DATASET, ignore=['chunksize', 'tag_index', 'figure_pool'],
+               store_result=lambda result: result[1], hit_result=lambda df: (None, df))
+def artist_barplot(min_albums=5, n_artists=30, metric='MA_score', file_name='./images/artist_bar.svg', dataset=None, chunksize=None, tag_query=None, tag_index=None, figure_pool=None):
     """
     Visualize a histogram plot with artists statistics based on the MA score.
 
@@ -63,48 +377,56 @@ def artist_barplot(min_albums=5, n_artists=30, metric='MA_score', file_name='./i
 
     file_name: Name of the output file
 
+    dataset : Name of the input csv file or pandas dataframe
+
+    chunksize : If not None, stream the dataset in chunks of this many rows
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    tag_index : TagIndex of the dataset, for the tag query (or None for the one cached per dataset)
+
+    figure_pool : FigurePool the figure is taken from (or None to create a new figure).
+                  The caller gives the returned figure back to the pool when done.
+
+    render_cache : RenderCache of the rendered charts. On a hit the cached file is copied to
+                   the output and (None, dataset) is returned without rendering.
+
     Returns:
     ----------
 
-    Return the image with average, max and min scores and the dataset used for the plotting.
+    Return the figure with average, max and min scores and the statistics of all the artists
+    with at least min_albums albums, the first n_artists of which are plotted.
     """
 
-    artist_df = prune_and_group(min_albums)
-
-    # manipulate DF to retain useful statistics for the plot
-    artist_description = artist_df.describe()
-    # prune the dataset from the not considered metrics
-    all_metrics = ['listeners', 'playcount', 'MA_score']
-    all_metrics.remove(metric)
-    artist_description.drop(all_metrics, axis=1, level=0, inplace=True)
-    artist_description.drop(['count', 'std', '25%', '50%', '75%'], axis=1, level=1, inplace=True)
-    artist_sorted = artist_description.sort_values(by=(metric, "mean"), ascending=False)
+    # compute only the mean, min and max of the requested metric, for all the artists
+    plan = AggregationPlan(metric, ['mean', 'min', 'max'])
+    artist_sorted = artist_statistics(plan, min_albums, dataset, chunksize, tag_query, tag_index)
     # drop upper level in columns names
     output_df = artist_sorted.copy()
     artist_sorted.columns = artist_sorted.columns.droplevel()
-    # keep the requested number of artists
-    # note that n_artists is higher than the size of the dataframe, no exception is raised
+    # keep the requested number of artists in the plot
     artist_sorted = artist_sorted.head(n_artists)
 
-    img = plt.figure(figsize=(900,300))
-    artist_sorted.plot.bar()
-    plt.xticks(rotation=70)
-    plt.title("Statistics on artists with at least " + str(min_albums) + " albums.")
-    plt.xlabel("")
-    plt.ylabel("Metric: " + metric)
-    plt.tight_layout()
-
-    if file_name is not None:
-        dir_name = os.path.dirname(file_name)
-        if dir_name != '' and not os.path.exists(dir_name):
-            os.makedirs(dir_name)
-        plt.savefig(file_name)
-    plt.close("all")
+    # the figure grows with the number of artists, within bounds
+    fig_size = bar_figure_size(len(artist_sorted))
+    img = create_figure(fig_size) if figure_pool is None else figure_pool.acquire(fig_size)
+    with stage('barplot.draw'):
+        ax = img.add_subplot()
+        artist_sorted.plot.bar(ax=ax)
+        ax.tick_params(axis='x', labelrotation=70)
+        ax.set_title("Statistics on artists with at least " + str(min_albums) + " albums.")
+        ax.set_xlabel("")
+        ax.set_ylabel("Metric: " + metric)
+        img.tight_layout()
+    save_figure(img, file_name)
 
     return img, output_df
 
 
-def artist_cloud(min_albums=5, words_limit=20, metric='MA_score', file_name='./images/artist_cloud.svg'):
+@profiled('chart.artist_cloud')
+@cached_render('file_name', DATASET, ignore=['chunksize', 'tag_index', 'figure_pool'],
+               store_result=lambda result: result, hit_result=lambda result: result)
+def artist_cloud(min_albums=5, words_limit=20, metric='MA_score', file_name='./images/artist_cloud.svg', dataset=None, chunksize=None, tag_query=None, tag_index=None, mask=None, figure_pool=None):
     """
     Visualize a world cloud with artist names.
 
@@ -119,15 +441,30 @@ def artist_cloud(min_albums=5, words_limit=20, metric='MA_score', file_name='./i
 
     file_name: Name of the output file
 
+    dataset : Name of the input csv file or pandas dataframe
+
+    chunksize : If not None, stream the dataset in chunks of this many rows
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    tag_index : TagIndex of the dataset, for the tag query (or None for the one cached per dataset)
+
+    mask : Path of an image whose white pixels are left empty (or None to fill the whole image)
+
+    figure_pool : FigurePool the figure is taken from (or None to create a new figure)
+
+    render_cache : RenderCache of the rendered charts. On a hit the cached file is copied to
+                   the output and the Series is returned without rendering.
+
     Returns:
     ----------
 
     The pandas Series used to produce the image
     """
 
-    artist_df = prune_and_group(min_albums)
-
-    artist_df = artist_df.mean().sort_values(by=metric, ascending=False)[metric]
+    # compute only the mean of the requested metric for the top artists
+    plan = AggregationPlan(metric, ['mean'], top_k=words_limit)
+    artist_df = artist_statistics(plan, min_albums, dataset, chunksize, tag_query, tag_index)[(metric, 'mean')].rename(metric)
     # elaborate data
     if metric == 'listeners':
         artist_df = artist_df.div(1e+05)
@@ -135,15 +472,55 @@ def artist_cloud(min_albums=5, words_limit=20, metric='MA_score', file_name='./i
         artist_df = artist_df.div(1e+06)
     artist_df = artist_df.round(2)
 
-    artist_df = artist_df.head(words_limit)
-
-    # create and generate a word cloud image
-    txt_path = generate_text_from_df(artist_df)
-    generate_word_cloud(words_limit, txt_path, file_name)
+    # create and generate a word cloud image straight from the values
+    generate_word_cloud_from_frequencies(artist_df, words_limit, file_name, mask, figure_pool)
 
     return artist_df
 
 
+@profiled('artist_statistics')
+def artist_statistics(plan, min_albums=5, dataset=None, chunksize=None, tag_query=None, tag_index=None):
+    """
+    Execute an aggregation plan on the artists with at least min_albums albums.
+    If the dataset is a csv file with a fresh aggregate store next to it, the
+    statistics are derived from the store instead of the raw data. If chunksize
+    is given, the dataset is streamed and aggregated chunk by chunk.
+
+    Parameters
+    ----------
+
+    plan: AggregationPlan declaring the metric, statistics and number of artists
+
+    min_albums: Min number of album published by the considered artists
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    chunksize : If not None, stream the dataset in chunks of this many rows
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    tag_index : TagIndex of the dataset, for the tag query (or None for the one cached per dataset)
+
+    Returns:
+    ----------
+
+    Dataframe with the requested statistics of the top artists.
+    """
+
+    # the store holds statistics of all albums, it cannot answer tag queries
+    if (dataset is None or isinstance(dataset, str)) and tag_query is None:
+        store = AggregateStore(DATASET if dataset is None else dataset)
+        if store.is_fresh():
+            return plan.execute_partial(store.artists(min_albums))
+
+    if chunksize is not None:
+        return plan.execute_partial(prune_and_aggregate(min_albums, dataset, chunksize, tag_query))
+    if tag_query is not None:
+        dataset = load_tagged(dataset, tag_query, tag_index)
+    return plan.execute(prune_and_group(min_albums, dataset))
+
+
+@profiled('group')
 def prune_and_group(threshold=5, dataset=None):
     """
     Preprocess the dataset with grouping and pruning.
@@ -167,16 +544,48 @@ def prune_and_group(threshold=5, dataset=None):
     
     # consider only relevant index
     df = df[['MA_artist', 'MA_album', 'listeners', 'playcount', 'MA_score']]
-    # group dataset by artist
-    df_grouped = df.groupby('MA_artist')
-    # sort artist by album count
-    df_sorted = df_grouped.count().sort_values(by='MA_album', ascending=False)
-    # save the dataframe with discarded artists
-    discarded = df_sorted.drop(df_sorted[df_sorted['MA_album'] >= threshold].index)
-    for artist in discarded.index:
-        df = df.drop(df_grouped.get_group(artist).index)
+    # keep the albums of the artists with at least threshold albums, in one pass
+    album_counts = df.groupby('MA_artist', observed=True)['MA_album'].transform('count')
+    df = df[album_counts >= threshold]
 
-    return df.groupby('MA_artist')
+    return df.groupby('MA_artist', observed=True)
+
+
+@profiled('aggregate')
+def prune_and_aggregate(threshold=5, dataset=None, chunksize=100000, tag_query=None):
+    """
+    Streaming counterpart of prune_and_group. The dataset is read in chunks and
+    mergeable partial aggregates are computed per artist, so memory is bounded by
+    the chunk size and the number of artists rather than by the dataset size.
+
+    Parameters
+    ----------
+
+    threshold: pruning value, all artist entries with album value < threshold will be removed
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    chunksize : Max number of rows read at once
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    Returns:
+    ----------
+
+    Return the partial aggregates of the pruned artists (see aggregation.partial_aggregate).
+    """
+
+    columns = ['MA_artist', 'MA_album'] + METRICS
+    if tag_query is not None:
+        columns.append('tags')
+    # the partials of the chunks are small (one row per artist), they are merged once at the end
+    chunk_partials = []
+    for chunk in iter_chunks(dataset, chunksize, columns):
+        chunk = filter_by_tags(chunk, tag_query)
+        chunk_partials.append(partial_aggregate(chunk, 'MA_artist', METRICS, counts=['MA_album']))
+    partials = merge_partials(chunk_partials)
+
+    return partials[partials[('MA_album', 'count')] >= threshold]
 
 
 def generate_text_from_df(df, file_name='./images/artist_cloud.txt'):
@@ -197,21 +606,13 @@ def generate_text_from_df(df, file_name='./images/artist_cloud.txt'):
     """
 
     # the dataframe is indexed with the artists names that we need to access
-    index_obj = df.index
-    index_list = []
-
-    # erase the file if it exists
-    out_file = open(file_name, 'w')
-    out_file.write("")
-
-    for name in index_obj:
-        # replace space with tabs so that artists names with multiple words are counted as a single entity
-        index_list.append(name.replace(' ', '_'))
-        count = round(float(df.loc[name]))
-        # create a file.txt containing artists names repeated N times where N is the number of published albums
-        out_file = open(file_name, 'a')
-        for i in range(count):
-            out_file.write(index_list[-1] + " ")
+    with open(file_name, 'w') as out_file:
+        for name in df.index:
+            # replace space with tabs so that artists names with multiple words are counted as a single entity
+            word = name.replace(' ', '_')
+            count = round(float(df.loc[name]))
+            # create a file.txt containing artists names repeated N times where N is the number of published albums
+            out_file.write((word + " ") * count)
 
     return file_name
 
@@ -230,25 +631,99 @@ def generate_word_cloud(words=1, txt_file='./images/artist_cloud.txt', figure_na
     figure_name: Name of the output figure
     """
 
-    out_file = open(txt_file, 'r')
-    contents = out_file.read()
+    with open(txt_file, 'r') as in_file:
+        contents = in_file.read()
     wordcloud = WordCloud(collocations=False, max_words=words).generate(contents)
+    save_word_cloud(wordcloud.to_array(), figure_name)
 
-    # Display the generated image:
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis("off")
-    plt.savefig(figure_name)
 
-    if figure_name is not None:
-        dir_name = os.path.dirname(figure_name)
-        if dir_name != '' and not os.path.exists(dir_name):
-            os.makedirs(dir_name)
-        plt.savefig(figure_name)
-    plt.close("all")
+@profiled('cloud.generate')
+def generate_word_cloud_from_frequencies(frequencies, words=20, figure_name='./images/artist_cloud.svg', mask=None, figure_pool=None):
+    """
+    Generate the word cloud of a frequency Series, without tokenizing any text.
+
+    Parameters
+    ----------
+
+    frequencies: pandas Series (or dict) of the size of every word, indexed by word.
+                 Words with missing or non-positive values are left out.
+
+    words: Number of words in the could
+
+    figure_name: Name of the output figure (or None to not save)
+
+    mask: Path of an image whose white pixels are left empty (or None)
+
+    figure_pool: FigurePool the figure is taken from (or None to create a new figure)
+
+    Returns:
+    ----------
+
+    The word cloud as an RGB array
+    """
+
+    frequencies = pd.Series(frequencies, dtype=float)
+    frequencies = frequencies[frequencies > 0]
+    frequencies.index = frequencies.index.astype(str)
+
+    wordcloud, lock = word_cloud_renderer(words, mask)
+    # the renderer keeps the layout of the last cloud, so it is not shared between threads
+    with lock:
+        array = wordcloud.generate_from_frequencies(frequencies.to_dict()).to_array()
+    save_word_cloud(array, figure_name, figure_pool)
+    return array
+
+
+@functools.lru_cache(maxsize=16)
+def word_cloud_renderer(words=20, mask=None):
+    """
+    Word cloud renderer with its mask loaded, cached across calls.
+
+    Parameters
+    ----------
+
+    words: Number of words in the could
+
+    mask: Path of an image whose white pixels are left empty (or None)
+
+    Returns:
+    ----------
+
+    (WordCloud, lock) pair
+    """
+    mask_array = None if mask is None else np.array(Image.open(mask).convert('L'))
+    return WordCloud(collocations=False, max_words=words, mask=mask_array), threading.Lock()
+
+
+def save_word_cloud(array, figure_name, figure_pool=None):
+    """
+    Save a word cloud image as a figure, rendering it once.
+
+    Parameters
+    ----------
+
+    array: RGB array of the word cloud
 
+    figure_name: Name of the output figure (or None to not save)
 
+    figure_pool: FigurePool the figure is taken from (or None to create a new figure)
+    """
+    if figure_name is None:
+        return
+
+    fig = create_figure(WORD_CLOUD_FIG_SIZE) if figure_pool is None else figure_pool.acquire(WORD_CLOUD_FIG_SIZE)
+    ax = fig.add_subplot()
+    ax.imshow(array, interpolation='bilinear')
+    ax.axis("off")
+    save_figure(fig, figure_name)
+    if figure_pool is not None:
+        figure_pool.release(fig)
+
+
+@profiled('chart.album_covers')
+@cached_render('image_name', DATASET, ignore=['tag_index', 'cache', 'n_workers', 'atlas'])
 def album_covers(num_albums=100, width=1280, height=720, dataset=None,
-                 image_name='./images/album_covers.jpg'):
+                 image_name='./images/album_covers.jpg', tag_query=None, tag_index=None, cache=None, n_workers=8, atlas=None):
     """
     Visualize a wordcloud but use album covers instead of names.
 
@@ -265,6 +740,20 @@ def album_covers(num_albums=100, width=1280, height=720, dataset=None,
 
     image_name : Name of the output image (or None to not save)
 
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    tag_index : TagIndex of the dataset, for the tag query (or None for the one cached per dataset)
+
+    cache : CoverCache used to get the covers (or None to download all of them)
+
+    n_workers : Number of threads fetching, decoding and resizing covers in parallel
+
+    atlas : CoverAtlas the covers are copied from (see build_cover_atlas), covers
+            missing from the atlas are loaded as usual
+
+    render_cache : RenderCache of the rendered charts. On a hit the cached file is copied to
+                   the output and None is returned without rendering.
+
     Returns
     ----------
 
@@ -276,51 +765,310 @@ def album_covers(num_albums=100, width=1280, height=720, dataset=None,
     assert isinstance(width, int) and width > 0, "'width' must be an int larger than 0."
     assert isinstance(height, int) and height > 0, "'height' must be an int larger than 0."
     assert image_name == None or isinstance(image_name, str), "'image_name' must be None or str."
+    assert isinstance(n_workers, int) and n_workers > 0, "'n_workers' must be an int larger than 0."
 
-    # Load data
-    df = load_data(dataset)
-    df = df[['artist', 'album', 'playcount', 'image']]
-    df = df.sort_values('playcount', ascending=False)
-    if num_albums is not None:
-        df = df.head(num_albums)
-
-    # Format image URLs
-    def format_image_str(s):
-        # TODO: get the largest image in case some image sizes are not present
-        s = s.replace('"', "'")
-        s = ast.literal_eval(s)
-        return s[-1]['#text']
-    df['image'] = df.apply(lambda row: format_image_str(row['image']), axis=1)
-
-    # Compute album cover positions using squarify
-    values = list(df['playcount'])
-    values = squarify.normalize_sizes(values, height, width)
-    rects = squarify.squarify(values, 0., 0., height, width)
-
-    # Compute integer values for slicing
-    for rect in rects:
-        rect['x1'] = max(0, math.floor(rect['x']))
-        rect['y1'] = max(0, math.floor(rect['y']))
-        rect['x2'] = min(height, math.ceil(rect['x'] + rect['dx']))
-        rect['y2'] = min(width,  math.ceil(rect['y'] + rect['dy']))
-
-    # Create the image
+    df = top_albums(num_albums, dataset, tag_query, tag_index)
+    tiles = cover_tiles(df, width, height)
     img = Image.new('RGB', (width, height))
-    for i, url in enumerate(df['image']):
-        rect = rects[i]
-        im = Image.open(requests.get(url, stream=True).raw)
-        im = im.resize((rect['y2']-rect['y1'], rect['x2']-rect['x1']))
-        img.paste(im, box=(rect['y1'], rect['x1'], rect['y2'], rect['x2']))
+
+    # Covers in the atlas are copied out of its pixel file, only the others are loaded
+    if atlas is not None:
+        from .cover_atlas import CoverAtlas
+        missing = []
+        with stage('covers.atlas'):
+            for artist, album, (url, box) in zip(df['artist'], df['album'], tiles):
+                key = CoverAtlas.key(artist, album)
+                if key in atlas:
+                    size = (box[2] - box[0], box[3] - box[1])
+                    img.paste(atlas.get(key, size).resize(size), box=box)
+                else:
+                    missing.append((url, box))
+        tiles = missing
+
+    # Covers are fetched, decoded and resized by a pool of threads
+    # and pasted by this thread as they arrive
+    with stage('covers.download'):
+        for box, im in load_covers(tiles, cache, n_workers):
+            img.paste(im, box=box)
 
     # Save and return the image
     if image_name is not None:
         dir_name = os.path.dirname(image_name)
         if dir_name != '' and not os.path.exists(dir_name):
             os.makedirs(dir_name)
-        img.save(image_name)
+        with stage('save'):
+            img.save(image_name)
     return img
 
 
+@profiled('chart.album_covers_tiled')
+@cached_render('image_name', DATASET, ignore=['cache', 'n_workers', 'band_height'])
+def album_covers_tiled(num_albums=100, width=16384, height=9216, dataset=None,
+                       image_name='./images/album_covers.png', tag_query=None, cache=None, n_workers=8,
+                       band_height=512):
+    """
+    Visualize album covers like album_covers, for poster-size mosaics. The layout
+    is computed once and the image is rendered band by band and streamed into a
+    PNG file, so peak memory is bounded by the band size rather than the image size.
+
+    Parameters
+    ----------
+
+    num_albums : Number of top albums to use (by playcount)
+
+    width : Width of the output image
+
+    height : Height of the output image
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    image_name : Name of the output PNG image
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    cache : CoverCache used to get the covers (or None to download all of them)
+
+    n_workers : Number of threads fetching and decoding covers in parallel
+
+    band_height : Number of rows of the image rendered at once
+
+    render_cache : RenderCache of the rendered charts. On a hit the cached file is copied to
+                   the output and None is returned without rendering.
+
+    Returns
+    ----------
+
+    Name of the output image
+    """
+
+    # Assert that input arguments have correct types and values
+    assert num_albums == None or (isinstance(num_albums, int) and num_albums > 0), "'num_albums' must be None or int larger than 0."
+    assert isinstance(width, int) and width > 0, "'width' must be an int larger than 0."
+    assert isinstance(height, int) and height > 0, "'height' must be an int larger than 0."
+    assert isinstance(image_name, str) and image_name.lower().endswith('.png'), "'image_name' must be the name of a PNG file."
+    assert isinstance(n_workers, int) and n_workers > 0, "'n_workers' must be an int larger than 0."
+
+    tiles = album_cover_tiles(num_albums, width, height, dataset, tag_query)
+    return render_mosaic_tiled(tiles, width, height, image_name, band_height, cache, n_workers)
+
+
+def album_cover_pyramid(num_albums=1000, width=65536, height=36864, dataset=None, tag_query=None,
+                        cache=None, tile_size=256, tile_dir=None, n_workers=8):
+    """
+    Zoomable album cover mosaic, whose tiles are rendered on demand (see TilePyramid).
+
+    Parameters
+    ----------
+
+    num_albums : Number of top albums to use (by playcount)
+
+    width : Width of the mosaic at the largest zoom level
+
+    height : Height of the mosaic at the largest zoom level
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    cache : CoverCache used to get the covers (or None to download them)
+
+    tile_size : Side of the tiles in pixels
+
+    tile_dir : Directory of the rendered tiles (or None to keep them in memory only)
+
+    n_workers : Number of threads loading the covers of a tile
+
+    Returns
+    ----------
+
+    TilePyramid object
+    """
+    assert num_albums == None or (isinstance(num_albums, int) and num_albums > 0), "'num_albums' must be None or int larger than 0."
+    assert isinstance(width, int) and width > 0, "'width' must be an int larger than 0."
+    assert isinstance(height, int) and height > 0, "'height' must be an int larger than 0."
+
+    tiles = album_cover_tiles(num_albums, width, height, dataset, tag_query)
+    from .tile_pyramid import TilePyramid
+    return TilePyramid(tiles, width, height, tile_size, cache, tile_dir, n_workers=n_workers)
+
+
+def album_cover_tiles(num_albums=100, width=1280, height=720, dataset=None, tag_query=None):
+    """
+    Compute the layout of the album cover mosaic.
+
+    Parameters
+    ----------
+
+    num_albums : Number of top albums to use (by playcount)
+
+    width : Width of the mosaic
+
+    height : Height of the mosaic
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    Returns
+    ----------
+
+    List of (url, box) pairs, box being (left, upper, right, lower) in the mosaic
+    """
+    return cover_tiles(top_albums(num_albums, dataset, tag_query), width, height)
+
+
+@profiled('covers.top_albums')
+def top_albums(num_albums=100, dataset=None, tag_query=None, tag_index=None):
+    """
+    Top albums by playcount, with their covers. Albums without playcount or
+    cover cannot be placed in a mosaic and are left out.
+
+    Parameters
+    ----------
+
+    num_albums : Number of top albums to return (or None for all)
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    tag_index : TagIndex of the dataset, for the tag query (or None for the one cached per dataset)
+
+    Returns
+    ----------
+
+    DataFrame of the albums sorted by decreasing playcount
+    """
+    df = load_tagged(dataset, tag_query, tag_index)
+    image_column = 'image' if 'image' in df.columns else 'image_id'
+    df = df[['artist', 'album', 'playcount', image_column]]
+    # the treemap layout needs positive playcounts
+    df = df[(df['playcount'].fillna(0) > 0) & df[image_column].notna()]
+    df = df.sort_values('playcount', ascending=False)
+    if num_albums is not None:
+        df = df.head(num_albums)
+    return df
+
+
+@profiled('covers.layout')
+def cover_tiles(df, width, height):
+    """
+    Compute the layout of the album cover mosaic of the albums of a dataframe.
+
+    Parameters
+    ----------
+
+    df : DataFrame returned by top_albums
+
+    width : Width of the mosaic
+
+    height : Height of the mosaic
+
+    Returns
+    ----------
+
+    List of (url, box) pairs, box being (left, upper, right, lower) in the mosaic
+    """
+    # Compute album cover positions as a squarified treemap
+    boxes = cover_layout(df['playcount'].to_numpy(dtype=float), width, height)
+
+    # Format image URLs, using the smallest image covering each box
+    tiles = []
+    images = df['image_id'] if 'image_id' in df.columns else df['image']
+    for image, box in zip(images, boxes.tolist()):
+        box = tuple(box)
+        size_name = cover_size_name((box[2] - box[0], box[3] - box[1]))
+        if 'image_id' in df.columns:
+            tiles.append((cover_url(image, size_name), box))
+        else:
+            tiles.append((format_image_str(image, size_name), box))
+    return tiles
+
+
+def build_cover_atlas(path, num_albums=None, dataset=None, tag_query=None, cache=None, n_workers=8):
+    """
+    Build (or extend) the cover atlas of the top albums. Albums already in the
+    atlas are skipped, so the atlas can be updated as new albums are added.
+
+    Parameters
+    ----------
+
+    path : Path of the atlas, without extension
+
+    num_albums : Number of top albums to add (by playcount), or None for all
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    cache : CoverCache used to get the covers (or None to download them)
+
+    n_workers : Number of threads loading covers
+
+    Returns
+    ----------
+
+    CoverAtlas object
+    """
+    # albums without cover are left out by top_albums
+    df = top_albums(num_albums, dataset, tag_query)
+    if 'image_id' in df.columns:
+        urls = [cover_url(image) for image in df['image_id']]
+    else:
+        urls = [format_image_str(image) for image in df['image']]
+    from .cover_atlas import CoverAtlas
+    keys = [CoverAtlas.key(artist, album) for artist, album in zip(df['artist'], df['album'])]
+
+    atlas = CoverAtlas(path)
+    atlas.build(zip(keys, urls), cache, n_workers)
+    return atlas
+
+
+def cover_size_name(size):
+    """
+    Smallest LastFM image size covering a rectangle.
+
+    Parameters
+    ----------
+
+    size : (width, height) of the rectangle
+
+    Returns
+    ----------
+
+    LastFM size name [small, medium, large, extralarge]
+    """
+    for name, pixels in sorted(LASTFM_IMAGE_PIXELS.items(), key=lambda item: item[1]):
+        if pixels >= max(size):
+            return name
+    return 'extralarge'
+
+
+def format_image_str(s, size_name='extralarge'):
+    """
+    Get the URL of an album cover from the image list written by the LastFM API.
+
+    Parameters
+    ----------
+
+    s : String of the list of images, one dictionary per size
+
+    size_name : Preferred LastFM size, the largest available image is used if it is missing
+
+    Returns
+    ----------
+
+    URL string
+    """
+    s = s.replace('"', "'")
+    images = [image for image in ast.literal_eval(s) if image['#text'] != '']
+    for image in images:
+        if image['size'] == size_name:
+            return image['#text']
+    return images[-1]['#text']
+
+
+@profiled('tags.parse')
 def generate_tag_cooccurrence_list_from_df(df):
     """
     Generate a list of cooccurring tags per album from a dataframe.
@@ -342,6 +1090,7 @@ def generate_tag_cooccurrence_list_from_df(df):
         tag_cooccurrence_list.append(eval(tag))
     return tag_cooccurrence_list
 
+@profiled('tags.unique')
 def generate_unique_tag_from_list(tag_list):
     """
     Generate a list of unique tags.
@@ -364,6 +1113,7 @@ def generate_unique_tag_from_list(tag_list):
     unique_tags = list(set(list(itertools.chain.from_iterable(tag_list))))
     return unique_tags
 
+@profiled('tags.network')
 def generate_tag_network(tag_cooccurrence_list, tags):
     """
     Generate a nextwork from tags and their coocurrences.
@@ -381,29 +1131,103 @@ def generate_tag_network(tag_cooccurrence_list, tags):
     Returns
     ----------
 
+    Graph of tags
+    """
+    node_counts, edge_counts = count_tag_cooccurrences(tag_cooccurrence_list)
+    return tag_network_from_counts(node_counts, edge_counts, tags)
+
+
+def count_tag_cooccurrences(tag_cooccurrence_list, node_counts=None, edge_counts=None):
+    """
+    Count occurrences and cooccurrences of tags. The counts are mergeable, so
+    they can be accumulated over chunks of a dataset by passing the counters
+    returned for the previous chunks.
+
+    Parameters
+    ----------
+
+    tag_cooccurrence_list : list of cooccurring tags.
+
+    node_counts : Counter of tag occurrences to update (or None to start a new one)
+
+    edge_counts : Counter of tag cooccurrences to update (or None to start a new one)
+
+    Returns
+    ----------
+
+    Counters of tag occurrences and of cooccurrences keyed by sorted tag pairs.
+    """
+    node_counts = Counter() if node_counts is None else node_counts
+    edge_counts = Counter() if edge_counts is None else edge_counts
+
+    for d in tag_cooccurrence_list:
+        node_counts.update(d)
+        if len(d) >= 2:
+            # each cooccurrence is counted once per tag of the album
+            for u, v in itertools.combinations(d, 2):
+                edge_counts[(u, v) if u <= v else (v, u)] += len(d)
+    return node_counts, edge_counts
+
+
+def tag_network_from_counts(node_counts, edge_counts, tags=None):
+    """
+    Generate a nextwork of tags from occurrence and cooccurrence counts.
+    Node weight is the number of occurrences of a tag plus one.
+
+    Parameters
+    ----------
+
+    node_counts : Counter of tag occurrences.
+
+    edge_counts : Counter of tag cooccurrences keyed by tag pairs.
+
+    tags : list of unique tags (or None to use the counted tags).
+
+    Returns
+    ----------
+
     Graph of tags
     """
     G = nx.Graph()
-    G.add_nodes_from(tags) #create a node for each tag
+    G.add_nodes_from(node_counts if tags is None else tags) #create a node for each tag
     nx.set_node_attributes(G, 1,'weight')
 
-    for d in tag_cooccurrence_list:
-        # Increase node weight
-        for n in d:
-            G.nodes[n]['weight'] += 1
-
-            # Draw Edges (or increase weight if already present)
-            if len(d) >= 2:
-                for comb in itertools.combinations(d, 2):
-                    u = comb[0]
-                    v = comb[1]
-                    if G.has_edge(u, v):
-                        G[u][v]['weight'] += 1
-                    else:
-                        G.add_edge(u, v, weight=1)
+    for n, count in node_counts.items():
+        G.nodes[n]['weight'] += count
+    for (u, v), weight in edge_counts.items():
+        G.add_edge(u, v, weight=weight)
     return G
 
 
+@profiled('tags.network')
+def generate_tag_network_chunked(dataset=None, chunksize=100000, tag_query=None):
+    """
+    Generate the network of tags by streaming the dataset in chunks.
+    The result is the same graph as with generate_tag_network on the whole dataset.
+
+    Parameters
+    ----------
+
+    dataset : Name of the input csv file or pandas dataframe
+
+    chunksize : Max number of rows read at once
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    Returns
+    ----------
+
+    Graph of tags
+    """
+    node_counts, edge_counts = Counter(), Counter()
+    for chunk in iter_chunks(dataset, chunksize, ['tags']):
+        chunk = filter_by_tags(chunk, tag_query)
+        tag_cooccurrence_list = generate_tag_cooccurrence_list_from_df(chunk)
+        count_tag_cooccurrences(tag_cooccurrence_list, node_counts, edge_counts)
+    return tag_network_from_counts(node_counts, edge_counts)
+
+
+@profiled('tags.filter_graph')
 def filter_tag_graph(g, n_top_tags, attribute='weight'):
     """
     Filter graph for the n top tags according to chosen attribute.
@@ -428,7 +1252,10 @@ def filter_tag_graph(g, n_top_tags, attribute='weight'):
     
     return g.subgraph(top_node_keys)
 
-def tag_graph(n_tags=18, dataset=None, file_name='./images/tag_graph.svg'):    
+@profiled('chart.tag_graph')
+@cached_render('file_name', DATASET, ignore=['chunksize', 'tag_index'],
+               fingerprints={'renderer': lambda params: tag_graph_renderer_fingerprint(params['renderer'], params['layout'])})
+def tag_graph(n_tags=18, dataset=None, file_name='./images/tag_graph.svg', chunksize=None, tag_query=None, tag_index=None, renderer=None, layout='circular', color_by=None):
     """
     Visualize coocurrences of tags in the dataframe.
 
@@ -443,75 +1270,65 @@ def tag_graph(n_tags=18, dataset=None, file_name='./images/tag_graph.svg'):
 
     image_name : Name of the output image (or None to not save)
 
+    chunksize : If not None, stream the dataset in chunks of this many rows
+
+    tag_query : If not None, only consider the albums matching this TagQuery
+
+    tag_index : TagIndex of the dataset, for the tag query (or None for the one cached per dataset)
+
+    renderer : TagGraphRenderer drawing the graph (or None for the one shared by all calls)
+
+    layout : Layout of the tags, 'circular' or 'force' for graphs of many tags. Force-directed
+             layouts start from the positions of the tags in the earlier graphs of the renderer.
+
+    color_by : If not None, color the tags by 'community' or by 'pagerank', computed on the
+               network of all the tags (see tag_analytics). With a chunksize, the dataset is
+               streamed a second time.
+
+    render_cache : RenderCache of the rendered charts, keyed by the state of the renderer too.
+                   On a hit the cached file is copied to the output and None is returned without rendering.
+
     Returns
     ----------
 
-    Matplotlib figure of the tag graph.
+    Matplotlib figure of the tag graph, reused by the next call with the same renderer.
     """
-    # Load data
-    df = load_data(dataset)
-
-    tag_cooccurrence_list = generate_tag_cooccurrence_list_from_df(df)
-    unique_tags = generate_unique_tag_from_list(tag_cooccurrence_list)
-    G = generate_tag_network(tag_cooccurrence_list, unique_tags)
+    # the tag analytics are only imported to color the tags
+    if color_by is not None:
+        from .tag_analytics import TagMatrix, tag_colors, tag_table
+    if chunksize is not None:
+        G = generate_tag_network_chunked(dataset, chunksize, tag_query)
+        if color_by is not None:
+            matrix = TagMatrix.from_dataset(dataset, chunksize, tag_query)
+    else:
+        # Load data
+        df = load_tagged(dataset, tag_query, tag_index)
+
+        tag_cooccurrence_list = generate_tag_cooccurrence_list_from_df(df)
+        unique_tags = generate_unique_tag_from_list(tag_cooccurrence_list)
+        G = generate_tag_network(tag_cooccurrence_list, unique_tags)
+        if color_by is not None:
+            matrix = TagMatrix.from_tag_lists(tag_cooccurrence_list)
     G = filter_tag_graph(G, n_top_tags=n_tags)
+    node_colors = None if color_by is None else tag_colors(tag_table(matrix), color_by)
 
-    n_weights = nx.get_node_attributes(G, 'weight')
-    edges,e_weights = zip(*nx.get_edge_attributes(G,'weight').items())    
-
-    # Plot constants for tag graph
-    FIG_SIZE = (12,10)
-
-    X_OFFSET = 1.1
-    Y_OFFSET = 1.25 # y-axis offset needs to be larger so labels have enough space
-    X_LIMIT = [-2,2]
-    Y_LIMIT = [-1.5,2]
-    IMG_EXTENT = X_LIMIT + Y_LIMIT
-
-    NODE_SIZE = 7
-    NODE_COLOR = 'white'
-    SHADOW_NODE_SIZE = 10
-    SHADOW_NODE_COLOR = '#333333'
-
-    EDGE_WIDTH= 1.0
-    EDGE_WIDTH_LOG_BASE = 3 # Base 10 was too extreme, base 2 too small
-    EDGE_COLOR = 'white'
-
-    LABEL_FONT_COLOR = 'white'
-    LABEL_FONT_WEIGHT = 'bold'
-
-    TITLE_TEXT = 'Heavy Metal Genre Relations'
-    TITLE_X_POS = -1.2
-    TITLE_Y_POS = 1.5
-    TITLE_FONT_SIZE = 28
-    TITLE_FONT_COLOR = 'white'
-
-    BACKGROUND_IMAGE_FILE = "assets/coal_bg_crop.jpg"
-
-    # Create figure
-    plt.figure(1,figsize=FIG_SIZE) 
-    ax = plt.axes()
-    img = plt.imread(BACKGROUND_IMAGE_FILE)
-    ax.imshow(img, extent=IMG_EXTENT)
-    pos = nx.circular_layout(G)
-    pos_outer = {}
-    for k, v in pos.items():
-        pos_outer[k] = (v[0]*(X_OFFSET), v[1]*(Y_OFFSET))
-
-    nx.draw_networkx(G, pos, nodelist=n_weights.keys(), node_size=[v * SHADOW_NODE_SIZE for v in n_weights.values()], node_color=SHADOW_NODE_COLOR, edge_color=EDGE_COLOR, width=[math.log(v, EDGE_WIDTH_LOG_BASE) * EDGE_WIDTH for v in e_weights], with_labels=False)
-    nx.draw_networkx_nodes(G, pos, nodelist=n_weights.keys(), node_size=[v * NODE_SIZE for v in n_weights.values()], node_color=NODE_COLOR)
-    nx.draw_networkx_labels(G, pos_outer, font_color=LABEL_FONT_COLOR, font_weight=LABEL_FONT_WEIGHT)
-    plt.xlim(X_LIMIT)
-    plt.ylim(Y_LIMIT)
-
-    ax.text(TITLE_X_POS, TITLE_Y_POS, TITLE_TEXT, size=TITLE_FONT_SIZE, color=TITLE_FONT_COLOR)
-    
-    fig = plt.gcf()
-    if file_name is not None:
-        dir_name = os.path.dirname(file_name)
-        if dir_name != '' and not os.path.exists(dir_name):
-            os.makedirs(dir_name)
-        plt.savefig(file_name)
-    plt.close("all")
+    if renderer is None:
+        renderer = default_tag_graph_renderer()
+    return renderer.render(G, file_name, layout=layout, node_colors=node_colors)
 
-    return fig
\ No newline at end of file
+
+@functools.lru_cache(maxsize=1)
+def default_tag_graph_renderer():
+    """
+    Tag graph renderer shared by the calls of tag_graph, created on first use.
+    """
+    from .graph_renderer import TagGraphRenderer
+    return TagGraphRenderer()
+
+
+def tag_graph_renderer_fingerprint(renderer, layout):
+    """
+    Fingerprint of the state of the renderer changing the graphs of a layout, keying the
+    tag graphs in the render cache (the default renderer is used if renderer is None).
+    """
+    return (default_tag_graph_renderer() if renderer is None else renderer).fingerprint(layout)